@@ -1,6 +1,68 @@
-"""Initialization of submodule."""
-from .algorithmrunner import AlgorithmRunner  # noqa: F401
-from .privacyrunner import PrivacyAlgorithmRunner  # noqa: F401
-from .datagenerator import OPALDataGenerator  # noqa: F401
-from .bandicoot_format import fields  # noqa: F401
-from .date_helper import is_date_between, is_date_greater  # noqa: F401
+"""Initialization of submodule.
+
+Submodules are imported lazily on first access of their attributes, so that
+light helpers like `fields` or `is_date_between`, which are used by
+algorithms inside the sandbox, do not import the runner stack (`requests`,
+`codejail`, `multiprocessing`).
+"""
+import importlib
+import sys
+import types
+
+_lazy_attributes = {
+    'AlgorithmRunner': 'algorithmrunner',
+    'PrivacyAlgorithmRunner': 'privacyrunner',
+    'OPALDataGenerator': 'datagenerator',
+    'fields': 'bandicoot_format',
+    'is_date_between': 'date_helper',
+    'is_date_greater': 'date_helper',
+    'StreamingReducer': 'reducer',
+    'ResultCache': 'resultcache',
+    'WeightsStore': 'weights',
+    'convert_weights': 'weights',
+    'RunnerService': 'service',
+    'JSONLinesSink': 'sinks',
+    'CSVSink': 'sinks',
+    'UnixSocketSink': 'sinks',
+    'SharedParams': 'sharedparams',
+    'OnlineAggregator': 'online',
+    'DenseReducer': 'dense',
+    'Limits': 'options',
+    'ProfileOptions': 'options',
+    'RecyclingOptions': 'options',
+    'StagingOptions': 'options',
+    'UserSelection': 'options',
+    'ZygoteOptions': 'options',
+}
+
+__all__ = sorted(_lazy_attributes)
+
+
+class _LazyModule(types.ModuleType):
+    """Module importing the submodule of an attribute on first access."""
+
+    def __getattr__(self, name):
+        """Import the submodule defining `name` and return the attribute."""
+        if name not in _lazy_attributes:
+            raise AttributeError(
+                'module {!r} has no attribute {!r}'.format(__name__, name))
+        module = importlib.import_module(
+            '.' + _lazy_attributes[name], __name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        """Return names available in the module including lazy attributes."""
+        return sorted(set(self.__dict__) | set(__all__))
+
+
+try:
+    sys.modules[__name__].__class__ = _LazyModule
+except TypeError:
+    # python 2 does not allow changing the class of a module, replace it
+    _module = _LazyModule(__name__, __doc__)
+    _module.__dict__.update(sys.modules[__name__].__dict__)
+    # python 2 clears globals of unreferenced modules, which are used here
+    _module._original_module = sys.modules[__name__]
+    sys.modules[__name__] = _module
@@ -0,0 +1,119 @@
+"""Placement of mapper and collector processes on CPU cores.
+
+Every mapper is pinned to its own set of cores within a single NUMA node,
+and the collector to a dedicated core, so that processes do not migrate
+between cores and memory stays local to their node. Sandboxes started by a
+mapper inherit its affinity. Pinning requires Linux `os.sched_setaffinity`
+and is skipped elsewhere.
+"""
+from __future__ import division, print_function
+import glob
+import multiprocessing as mp
+import os
+import re
+
+
+__all__ = ["affinity_supported", "available_cpus", "numa_nodes",
+           "plan_affinity", "set_affinity"]
+
+NODE_CPULIST = '/sys/devices/system/node/node*/cpulist'
+
+
+def parse_cpulist(cpulist):
+    """Return list of cpus of a list like `0-3,8-11`."""
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def affinity_supported():
+    """Return whether processes can be pinned to cpus."""
+    return hasattr(os, 'sched_setaffinity')
+
+
+def available_cpus():
+    """Return sorted list of cpus this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(mp.cpu_count()))
+
+
+def numa_nodes():
+    """Return sorted list of cpus of each NUMA node.
+
+    A single node with all available cpus is returned if the topology is
+    unknown.
+
+    """
+    available = set(available_cpus())
+    nodes = []
+    paths = sorted(glob.glob(NODE_CPULIST), key=lambda path: int(
+        re.search(r'node(\d+)', path).group(1)))
+    for path in paths:
+        with open(path) as cpulist:
+            cpus = sorted(available.intersection(
+                parse_cpulist(cpulist.read())))
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [sorted(available)]
+
+
+def plan_affinity(num_mappers, nodes=None):
+    """Assign cores to the collector and to each mapper.
+
+    The collector gets the last core of the last node to itself. Mappers
+    are spread over nodes in proportion to their number of cores, and the
+    cores of a node are split into contiguous sets between its mappers.
+    Mappers share cores only if there are fewer cores than mappers.
+
+    Args:
+        num_mappers (int): Number of mapper processes.
+        nodes (list): Cpus of each NUMA node, by default from `numa_nodes`.
+
+    Returns:
+        tuple: List of cpus of the collector and list with the list of cpus
+        of each mapper.
+
+    """
+    nodes = [list(node) for node in (nodes or numa_nodes())]
+    if sum(len(node) for node in nodes) < 2:
+        cpus = [cpu for node in nodes for cpu in node]
+        return cpus, [cpus] * num_mappers
+    collector_cpus = [nodes[-1].pop()]
+    nodes = [node for node in nodes if node]
+    counts = [0] * len(nodes)
+    for _ in range(num_mappers):
+        index = max(range(len(nodes)),
+                    key=lambda i: len(nodes[i]) / (counts[i] + 1))
+        counts[index] += 1
+    mapper_cpus = []
+    for node, count in zip(nodes, counts):
+        for i in range(count):
+            if count > len(node):
+                mapper_cpus.append([node[i % len(node)]])
+            else:
+                mapper_cpus.append(node[i * len(node) // count:
+                                        (i + 1) * len(node) // count])
+    return collector_cpus, mapper_cpus
+
+
+def set_affinity(cpus):
+    """Pin the current process to `cpus`.
+
+    Args:
+        cpus (list): Cpus the process may run on.
+
+    Returns:
+        set: Previous cpus of the process, to restore them later, None if
+        affinity is not supported.
+
+    """
+    if not affinity_supported():
+        return None
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cpus)
+    return previous
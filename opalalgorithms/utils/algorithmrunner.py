@@ -1,22 +1,52 @@
 """Given an algorithm object, run the algorithm."""
 from __future__ import division, print_function
 
+import collections
 import signal
 import sys
 import multiprocessing as mp
 import os
+import re
+import shutil
 import textwrap
 import json
+import time
+import heapq
+import random
+import warnings
 
-import requests
 import six
+from six.moves import queue
 import codejail
 from codejail.safe_exec import not_safe_exec
 from codejail.limits import set_limit
+from codejail.exceptions import SafeExecException
+
+from .affinity import affinity_supported, plan_affinity, set_affinity
+from .dense import DenseReducer
+from .estimator import CostEstimator, stratified_sample
+from .memory import MemoryUsage
+from .online import OnlineAggregator
+from .options import (
+    Limits, RecyclingOptions, StagingOptions, UserSelection)
+from .prefetch import FilePrefetcher, iter_file_queue
+from .profiling import ProfileReport, should_profile
+from .reducer import StreamingReducer
+from .sharedparams import is_shared_ref, publish_shared_params, resolver_code
+from .staging import FileStager
+from .userindex import LocationIndex, TimeIndex
+from .weights import WeightsStore, is_weights_store
+from .zygote import ZygoteJail, get_zygote, release_zygote
 
 
 __all__ = ["AlgorithmRunner"]
 
+DEFAULT_LIMITS = {'CPU': 15, 'REALTIME': None, 'VMEM': None}
+# number of results between samples of memory of the collector
+COLLECTOR_SAMPLE_INTERVAL = 100
+# Status codes of jailed process killed for exceeding CPU or realtime limit.
+LIMIT_STATUS_CODES = (-signal.SIGKILL, -signal.SIGXCPU)
+
 
 class GracefulExit(Exception):
     """Graceful exit exception class."""
@@ -42,9 +72,15 @@ def check_environ():
                 'Environment variable {} not set'.format(environ_var))
 
 
-def get_jail(python_version=sys.version_info[0]):
+def get_jail(python_version=sys.version_info[0], limits=None):
     """Return codejail object.
 
+    Args:
+        python_version (int): Python version being used for sandboxing.
+        limits (dict): Limits of the jailed process, with keys `CPU` (CPU
+            seconds), `REALTIME` (wall clock seconds) and `VMEM` (bytes of
+            virtual memory). Missing keys take values from `DEFAULT_LIMITS`.
+
     Note:
         - Please set environmental variables `OPALALGO_SANDBOX_VENV`
             and `OPALALGO_SANDBOX_USER` before calling this function.
@@ -56,8 +92,9 @@ def get_jail(python_version=sys.version_info[0]):
     """
     sandbox_env = os.environ.get('OPALALGO_SANDBOX_VENV')
     sandbox_user = os.environ.get('OPALALGO_SANDBOX_USER')
-    set_limit("REALTIME", None)
-    set_limit("CPU", 15)
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    for limit_name, value in six.iteritems(limits):
+        set_limit(limit_name, value)
     codejail.configure(
         'python',
         os.path.join(sandbox_env, 'bin', 'python'),
@@ -73,8 +110,55 @@ def get_jail(python_version=sys.version_info[0]):
     return jail
 
 
+def has_shared_params(params):
+    """Check if parameters reference published shared parameters."""
+    return any(is_shared_ref(value) for value in six.itervalues(params))
+
+
+def staged_records(user_csv_file, staged):
+    """Return directory read by bandicoot and files to be copied by codejail.
+
+    Args:
+        user_csv_file (string): Path to user csv file.
+        staged (bool): Whether the file is staged in a directory readable by
+            the sandbox.
+
+    Returns:
+        tuple: Directory of the records relative to the working directory of
+        the sandbox, and list of files to be copied or None.
+
+    """
+    if staged:
+        return os.path.dirname(os.path.abspath(user_csv_file)), None
+    return '', [user_csv_file]
+
+
+def get_stager(staging, zygote, time_window=None, sorted_files=None):
+    """Return `FileStager` of a process, None if codejail copies files.
+
+    The zygote stages files itself, unless only a time window of records
+    is staged, which the zygote then links in turn.
+
+    Args:
+        staging (str): `copy` or `link`, see `AlgorithmRunner`.
+        zygote (bool): Whether users are run in a `ZygoteJail`.
+        time_window (tuple): `(start, end)` of records to be staged.
+        sorted_files (set): Paths of users with records sorted by time.
+
+    Returns:
+        opalalgorithms.utils.staging.FileStager: Stager or None.
+
+    """
+    if time_window is not None:
+        return FileStager(time_window=time_window, sorted_files=sorted_files)
+    if staging == 'link' and not zygote:
+        return FileStager()
+    return None
+
+
 def process_user_csv(params, user_csv_file, algorithm, dev_mode, sandboxing,
-                     jail):
+                     jail, return_stats=False, profile=None, staged=False,
+                     limits=None):
     """Process a single user csv file.
 
     Args:
@@ -85,74 +169,546 @@ def process_user_csv(params, user_csv_file, algorithm, dev_mode, sandboxing,
         dev_mode (bool): Should the algorithm run in development mode or
             production mode.
         sandboxing (bool): Should sandboxing be used or not.
-        jail (codejail.Jail): Jail object.
+        jail (codejail.Jail): Jail object, or `ZygoteJail` started for the
+            same algorithm and parameters.
+        return_stats (bool): Also return statistics measured inside the
+            sandbox, i.e. seconds spent in `parse` and `map`, `cpu` seconds
+            of the sandbox, and `max_rss` and `vm_peak`, the peak virtual
+            memory or 0 if unknown, in bytes. Not supported with
+            `ZygoteJail`.
+        profile (dict): Profile parsing and `map` inside the sandbox, with
+            cProfile and, if `profile['memory']` is true, with tracemalloc.
+            Implies `return_stats`, profiles are returned as `cprofile` and
+            `tracemalloc` rows of statistics.
+        staged (bool): `user_csv_file` is staged in a directory readable by
+            the sandbox, e.g. by `opalalgorithms.utils.staging.FileStager`,
+            and is read in place instead of being copied by codejail.
+        limits (dict): Limits of each algorithm when several algorithms are
+            run together, see `process_user_csv_fused`.
 
     Returns:
-        Result of the execution.
+        Result of the execution, or tuple of result and statistics if
+        `return_stats` is set to true.
 
     Raises:
         SafeExecException: If the execution wasn't successful.
 
     """
+    if isinstance(jail, ZygoteJail):
+        return jail(user_csv_file)
+    if isinstance(algorithm, list):
+        return process_user_csv_fused(
+            params, user_csv_file, algorithm, dev_mode, sandboxing, jail,
+            staged, limits)
     username = os.path.splitext(os.path.basename(user_csv_file))[0]
+    records_path, files = staged_records(user_csv_file, staged)
     globals_dict = {
         'params': params,
     }
-    user_specific_code = textwrap.dedent(
+    return_stats = return_stats or profile is not None
+    if return_stats:
+        user_specific_code = textwrap.dedent(
+            """
+            def run_code():
+                import time
+                import resource
+                import bandicoot
+
+                profiler = None
+                if {}:
+                    import cProfile
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                tracemalloc = None
+                if {}:
+                    try:
+                        import tracemalloc
+                        tracemalloc.start()
+                    except ImportError:
+                        pass
+                start_time = time.time()
+                algorithmobj = {}()
+                bandicoot_user = bandicoot.read_csv(
+                   '{}', {!r}, describe={}, warnings={})
+                parse_time = time.time()
+                result = algorithmobj.map(params, bandicoot_user)
+                stats['map'] = time.time() - parse_time
+                if profiler is not None:
+                    profiler.disable()
+                stats['parse'] = parse_time - start_time
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                stats['max_rss'] = usage.ru_maxrss * 1024
+                stats['cpu'] = usage.ru_utime + usage.ru_stime
+                stats['vm_peak'] = 0
+                try:
+                    with open('/proc/self/status') as status:
+                        for line in status:
+                            if line.startswith('VmPeak:'):
+                                stats['vm_peak'] = int(
+                                    line.split()[1]) * 1024
+                except (IOError, OSError):
+                    pass
+                if profiler is not None:
+                    import pstats
+                    stats['cprofile'] = [
+                        list(function) + list(timings[:4]) for
+                        function, timings in pstats.Stats(
+                            profiler).stats.items()]
+                if tracemalloc is not None:
+                    snapshot = tracemalloc.take_snapshot()
+                    stats['tracemalloc'] = [
+                        [stat.traceback[0].filename,
+                         stat.traceback[0].lineno, stat.size, stat.count]
+                        for stat in snapshot.statistics('lineno')[:100]]
+                    stats['tracemalloc_peak'] = (
+                        tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                return result
+            stats = {{}}
+            result = run_code()
+            """.format(
+                profile is not None,
+                profile is not None and bool(profile.get('memory')),
+                algorithm['className'], username, records_path,
+                str(dev_mode), str(dev_mode)))
+    else:
+        user_specific_code = textwrap.dedent(
+            """
+            def run_code():
+                import bandicoot
+
+                algorithmobj = {}()
+                bandicoot_user = bandicoot.read_csv(
+                   '{}', {!r}, describe={}, warnings={})
+                return algorithmobj.map(params, bandicoot_user)
+            result = run_code()
+            """.format(
+                algorithm['className'], username, records_path,
+                str(dev_mode), str(dev_mode)))
+    if has_shared_params(params):
+        user_specific_code = "{}{}\n{}".format(
+            resolver_code(), "params = resolve_shared_params(params)",
+            user_specific_code)
+    code = "{}\n{}".format(algorithm['code'], user_specific_code)
+    if sandboxing:
+        jail.safe_exec(
+            code, globals_dict, files=files)
+    else:
+        not_safe_exec(
+            code, globals_dict, files=files)
+    result = globals_dict['result']
+    if return_stats:
+        return result, globals_dict['stats']
+    return result
+
+
+def jail_limits(limits, algorithm):
+    """Return limits of the jailed process running `algorithm`.
+
+    Several algorithms run together get the CPU and realtime limits of a
+    single algorithm each, so the limits of their jailed process are
+    scaled by their number.
+
+    Args:
+        limits (dict): Limits of a single algorithm.
+        algorithm (dict): Algorithm, or list of algorithms run together.
+
+    Returns:
+        dict: Limits of the jailed process.
+
+    """
+    if not isinstance(algorithm, list):
+        return limits
+    return dict(limits, **dict(
+        (name, limits[name] * len(algorithm))
+        for name in ('CPU', 'REALTIME') if limits.get(name)))
+
+
+def process_user_csv_fused(params_list, user_csv_file, algorithms, dev_mode,
+                           sandboxing, jail, staged=False, limits=None,
+                           return_errors=False):
+    """Process a single user csv file with several algorithms.
+
+    The user is read once and `map` of every algorithm is run on its own
+    copy of the bandicoot user. Code of each algorithm is executed in its
+    own namespace, so algorithms may use the same class names. An algorithm
+    which fails, runs out of memory or exceeds the CPU or realtime limit of
+    a single algorithm, enforced with interval timers, gets None as result
+    without affecting the others. The jailed process, with limits from
+    `jail_limits`, still stops algorithms which can not be interrupted,
+    e.g. while in C code.
+
+    Args:
+        params_list (list): Parameters of each algorithm.
+        user_csv_file (string): Path to user csv file.
+        algorithms (list): List of dictionaries with keys `code` and
+            `className`.
+        limits (dict): Limits of a single algorithm, with keys `CPU` and
+            `REALTIME`.
+        return_errors (bool): Also return the error of each algorithm, None
+            for algorithms which succeeded.
+
+    Note:
+        Rest of the arguments are same as `process_user_csv`.
+
+    Returns:
+        list: Result of each algorithm, None for algorithms which failed,
+        or tuple of results and errors if `return_errors` is set to true.
+
+    Raises:
+        SafeExecException: If the user could not be read.
+
+    """
+    limits = limits or {}
+    username = os.path.splitext(os.path.basename(user_csv_file))[0]
+    records_path, files = staged_records(user_csv_file, staged)
+    shared = any(has_shared_params(params) for params in params_list)
+    globals_dict = {
+        'algorithms': [
+            [algorithm['code'], algorithm['className'], params]
+            for algorithm, params in zip(algorithms, params_list)],
+    }
+    code = textwrap.dedent(
         """
         def run_code():
+            import copy
+            import signal
+            import traceback
+
             import bandicoot
 
-            algorithmobj = {}()
+            class LimitExceeded(BaseException):
+                pass
+
+            def on_limit(signum, frame):
+                raise LimitExceeded('Limit of the algorithm exceeded')
+
+            def run_algorithm(code, class_name, params, user):
+                if {}:
+                    params = resolve_shared_params(params)
+                namespace = {{'__name__': '__opalalgorithm__'}}
+                exec(code, namespace)
+                algorithmobj = namespace[class_name]()
+                return algorithmobj.map(params, user)
+
+            timers = [(signal.ITIMER_PROF, signal.SIGPROF, {!r}),
+                      (signal.ITIMER_REAL, signal.SIGALRM, {!r})]
+            timers = [timer for timer in timers if timer[2]]
+            try:
+                previous_handlers = [
+                    (signum, signal.signal(signum, on_limit))
+                    for _, signum, _ in timers]
+            except ValueError:
+                # signals can only be handled in the main thread
+                timers = previous_handlers = []
             bandicoot_user = bandicoot.read_csv(
-               '{}', '', describe={}, warnings={})
-            return algorithmobj.map(params, bandicoot_user)
-        result = run_code()
-        """.format(
-            algorithm['className'], username,
-            str(dev_mode), str(dev_mode)))
-    code = "{}\n{}".format(algorithm['code'], user_specific_code)
+               '{}', {!r}, describe={}, warnings={})
+            results = []
+            errors = []
+            try:
+                for index, (code, class_name, params) in enumerate(
+                        algorithms):
+                    user = bandicoot_user
+                    if index < len(algorithms) - 1:
+                        user = copy.deepcopy(bandicoot_user)
+                    try:
+                        for which, _, seconds in timers:
+                            signal.setitimer(which, seconds)
+                        try:
+                            result = run_algorithm(
+                                code, class_name, params, user)
+                        finally:
+                            for which, _, _ in timers:
+                                signal.setitimer(which, 0)
+                    except (Exception, LimitExceeded):
+                        results.append(None)
+                        errors.append(traceback.format_exc())
+                    else:
+                        results.append(result)
+                        errors.append(None)
+            finally:
+                for signum, handler in previous_handlers:
+                    signal.signal(signum, handler)
+            return results, errors
+        result, errors = run_code()
+        """.format(shared, limits.get('CPU'), limits.get('REALTIME'),
+                   username, records_path, str(dev_mode), str(dev_mode)))
+    if shared:
+        code = resolver_code() + code
     if sandboxing:
         jail.safe_exec(
-            code, globals_dict, files=[user_csv_file])
+            code, globals_dict, files=files)
     else:
         not_safe_exec(
-            code, globals_dict, files=[user_csv_file])
-    result = globals_dict['result']
+            code, globals_dict, files=files)
+    if dev_mode:
+        for index, error in enumerate(globals_dict['errors']):
+            if error:
+                print("Error in algorithm {} for user {}: {}".format(
+                    index, username, error))
+    if return_errors:
+        return globals_dict['result'], globals_dict['errors']
+    return globals_dict['result']
+
+
+def process_user_csv_cached(result_cache, job_key, params, user_csv_file,
+                            algorithm, dev_mode, sandboxing, jail,
+                            staged=False, limits=None):
+    """Process a single user csv file, reusing cached result if available.
+
+    Results of several algorithms run together are only cached if every
+    algorithm succeeded, so that failures are retried by the next run.
+
+    Args:
+        result_cache (opalalgorithms.utils.resultcache.ResultCache): Cache
+            of results, if None the result is always computed.
+        job_key (str): Key of the job returned by `ResultCache.job_key`.
+
+    Note:
+        Rest of the arguments are same as `process_user_csv`.
+
+    Returns:
+        Result of the execution.
+
+    """
+    if result_cache is None:
+        return process_user_csv(
+            params, user_csv_file, algorithm, dev_mode, sandboxing, jail,
+            staged=staged, limits=limits)
+    found, result = result_cache.get(job_key, user_csv_file)
+    if found:
+        return result
+    if isinstance(algorithm, list):
+        result, errors = process_user_csv_fused(
+            params, user_csv_file, algorithm, dev_mode, sandboxing, jail,
+            staged, limits, return_errors=True)
+        if not any(errors):
+            result_cache.set(job_key, user_csv_file, result)
+        return result
+    result = process_user_csv(
+        params, user_csv_file, algorithm, dev_mode, sandboxing, jail,
+        staged=staged)
+    result_cache.set(job_key, user_csv_file, result)
+    return result
+
+
+def is_limit_exceeded(exc, elapsed, limits):
+    """Check if the jailed execution failed by exceeding its limits.
+
+    Args:
+        exc (SafeExecException): Exception raised by the execution.
+        elapsed (float): Wall clock seconds taken by the execution.
+        limits (dict): Limits of the jailed process.
+
+    Returns:
+        bool: Whether execution was stopped for exceeding a limit.
+
+    """
+    realtime_limit = limits.get('REALTIME')
+    if realtime_limit and elapsed >= realtime_limit:
+        return True
+    message = str(exc)
+    if 'MemoryError' in message:
+        return True
+    status = re.search(r'status code: (-?\d+)', message)
+    return bool(status) and int(status.group(1)) in LIMIT_STATUS_CODES
+
+
+def process_user_csv_limited(report, limits, result_cache, job_key, params,
+                             user_csv_file, algorithm, dev_mode, sandboxing,
+                             jail, profile=None, stager=None):
+    """Process a single user csv file, skipping user if it exceeds limits.
+
+    Args:
+        report (JobReport): Report in which time taken by the user, or the
+            reason for skipping the user, is recorded.
+        limits (dict): Limits of the jailed process of a single algorithm.
+        profile (dict): Profiling options with keys `sample`, the fraction
+            of users to be profiled, and `memory`. Profiles of sampled users
+            are added to `report.profile`, their results are not cached.
+        stager (opalalgorithms.utils.staging.FileStager): Stager exposing
+            the user file to the sandbox without copying, None to let
+            codejail copy it.
+
+    Note:
+        Rest of the arguments are same as `process_user_csv_cached`.
+
+    Returns:
+        Result of the execution, None if user was skipped.
+
+    Raises:
+        SafeExecException: If the execution failed for any other reason.
+
+    """
+    username = os.path.splitext(os.path.basename(user_csv_file))[0]
+    start_time = time.time()
+    staged = stager is not None
+    if staged:
+        user_csv_file = stager.stage(user_csv_file)
+    try:
+        if profile is not None and should_profile(
+                username, profile['sample']):
+            result, stats = process_user_csv(
+                params, user_csv_file, algorithm, dev_mode, sandboxing,
+                jail, profile=profile, staged=staged)
+            report.profile.add(stats)
+        else:
+            result = process_user_csv_cached(
+                result_cache, job_key, params, user_csv_file, algorithm,
+                dev_mode, sandboxing, jail, staged=staged, limits=limits)
+    except SafeExecException as exc:
+        elapsed = time.time() - start_time
+        if not is_limit_exceeded(
+                exc, elapsed, jail_limits(limits, algorithm)):
+            raise
+        report.add_skipped(username, 'Limit exceeded after {:.2f}s'.format(
+            elapsed))
+        return None
+    finally:
+        if staged:
+            stager.release(user_csv_file)
+    report.add_time(username, time.time() - start_time)
     return result
 
 
 def mapper(writing_queue, params, file_queue, algorithm,
-           dev_mode=False, sandboxing=True, python_version=2):
+           dev_mode=False, sandboxing=True, python_version=2,
+           result_cache=None, limits=None, num_slowest=10, zygote=False,
+           profile=None, weights_store=None, prefetch=None, online=False,
+           staging='copy', time_window=None, sorted_files=None,
+           max_users=None, max_rss=None, cpus=None):
     """Call the map function and insert result into the queue if valid.
 
     Args:
-        writing_queue (mp.manager.Queue): Queue for inserting results.
-        params (dict): Parameters to be used by each map of the algorithm.
+        writing_queue (mp.manager.Queue): Queue for inserting results, as
+            tuples of result, scaler and index of the algorithm.
+        params (dict): Parameters to be used by each map of the algorithm,
+            list of parameters of each algorithm if `algorithm` is a list.
         users_csv_files (list): List of paths of csv files of users.
         algorithm (dict): Dictionary with keys `code` and `className`
-            specifying algorithm code and className.
+            specifying algorithm code and className, or list of such
+            dictionaries to run several algorithms on each user.
         dev_mode (bool): Should the algorithm run in development mode or
             production mode.
         sandboxing (bool): Should sandboxing be used or not.
         python_version (int): Python version being used for sandboxing.
+        result_cache (opalalgorithms.utils.resultcache.ResultCache): Cache
+            of results of users.
+        limits (dict): Limits of the jailed process of each user.
+        num_slowest (int): Number of slowest users to be reported.
+        zygote (opalalgorithms.utils.options.ZygoteOptions): Run users in
+            children forked from a `ZygoteJail` instead of a new sandbox for
+            every user, None to not use a zygote.
+        profile (dict): Profiling options, see `process_user_csv_limited`.
+        weights_store (opalalgorithms.utils.weights.WeightsStore): Store
+            from which weights are looked up for files queued without a
+            weight.
+        prefetch (dict): Keyword arguments of `FilePrefetcher` used to read
+            ahead upcoming files while the current one is processed, None
+            for no prefetching.
+        online (bool): Put an item in the writing queue for every user,
+            with None as result if the user has no valid result, so that
+            processed users can be counted.
+        staging (str): `copy` to let codejail copy each user file into the
+            sandbox, or `link` to expose it through a hard link in a
+            staging directory of the mapper, see
+            `opalalgorithms.utils.staging.FileStager`. The zygote always
+            stages files with hard links.
+        time_window (tuple): `(start, end)` datetimes, only records in the
+            window are staged for the sandbox, None for all records.
+        sorted_files (set): Paths of users whose records are sorted by
+            time, see `opalalgorithms.utils.userindex.TimeIndex`.
+        max_users (int): Number of users after which the mapper stops, so
+            that its process can be replaced, None for no limit.
+        max_rss (int): Resident memory in bytes above which the mapper
+            stops after the current user, None for no limit.
+        cpus (list): Cpus to which the mapper and the sandboxes it starts
+            are pinned while it runs, None to not pin them.
+
+    Returns:
+        JobReport: Report of users processed by the mapper, with
+        `num_recycled` set if it stopped before the queue was empty. Files
+        taken for prefetching are then put back to the queue.
 
     """
-    jail = get_jail(python_version)
-    while not file_queue.empty():
-        filepath = None
-        scaler = None
-        try:
-            result = file_queue.get(timeout=1)
-            filepath, scaler = result
-        except Exception as exc:
-            print(exc)
-            break
-        result = process_user_csv(
-            params, filepath, algorithm, dev_mode,
-            sandboxing, jail)
-        if result and is_valid_result(result):
-            writing_queue.put((result, scaler))
+    limits = dict(DEFAULT_LIMITS, **(limits or {}))
+    report = JobReport(num_slowest)
+    usage = MemoryUsage('mapper')
+    usage.sample()
+    report.memory.append(usage)
+    # set before starting the zygote, which inherits the affinity
+    previous_cpus = set_affinity(cpus) if cpus else None
+    if zygote:
+        jail = get_zygote(algorithm, params, dev_mode, sandboxing, limits,
+                          zygote.warm)
+    else:
+        jail = get_jail(python_version, jail_limits(limits, algorithm))
+    job_key = None
+    if result_cache is not None:
+        job_key = result_cache.job_key(algorithm, params, time_window)
+    prefetcher = None
+    if prefetch:
+        prefetcher = FilePrefetcher(**prefetch)
+    stager = get_stager(staging, zygote, time_window, sorted_files)
+    # results of algorithms with a vocabulary are summed before sending
+    dense = [DenseReducer(algo['vocabulary']) if algo.get('vocabulary')
+             else None for algo in (
+                 algorithm if isinstance(algorithm, list) else [algorithm])]
+    pending = collections.deque()
+    num_users = 0
+    try:
+        for filepath, scaler in iter_file_queue(
+                file_queue, prefetcher, pending):
+            if scaler is None:
+                scaler = weights_store.get(
+                    os.path.splitext(os.path.basename(filepath))[0])
+            result = process_user_csv_limited(
+                report, limits, result_cache, job_key, params, filepath,
+                algorithm, dev_mode, sandboxing, jail, profile, stager)
+            if online:
+                if not (result and is_valid_result(result)):
+                    result = None
+                writing_queue.put((result, scaler, 0))
+            else:
+                put_results(writing_queue, algorithm, result, scaler, dense,
+                            dev_mode)
+            num_users += 1
+            rss = usage.sample()
+            if (max_users and num_users >= max_users) or (
+                    max_rss and rss > max_rss):
+                # files taken for prefetching are left to other mappers
+                while pending:
+                    file_queue.put(pending.popleft())
+                report.num_recycled += 1
+                break
+        for index, reducer in enumerate(dense):
+            if reducer is not None and reducer.num_users:
+                writing_queue.put((reducer, 1, index))
+    finally:
+        if zygote:
+            release_zygote(jail)
+        if prefetcher is not None:
+            prefetcher.close()
+        if stager is not None:
+            stager.close()
+        if previous_cpus is not None:
+            set_affinity(previous_cpus)
+    return report
+
+
+def put_results(writing_queue, algorithm, result, scaler, dense, dev_mode):
+    """Put valid results of a user in the writing queue.
+
+    Results of algorithms with a `DenseReducer` are added to it instead.
+
+    """
+    results = result if isinstance(algorithm, list) else [result]
+    for index, result in enumerate(results or []):
+        if result and dense[index] is not None:
+            if not dense[index].add(result, scaler) and dev_mode:
+                print("Error in result {}".format(result))
+        elif result and is_valid_result(result):
+            writing_queue.put((result, scaler, index))
         elif result and dev_mode:
             print("Error in result {}".format(result))
 
@@ -174,32 +730,89 @@ def scale_result(result, scaler):
     return scaled_result
 
 
-def collector(writing_queue, params, dev_mode=False):
+def collector(writing_queue, params, dev_mode=False, local_reduce=False,
+              sinks=None, vocabularies=None, max_rss=None, cpus=None):
     """Collect the results in writing queue and post to aggregator.
 
     Args:
         writing_queue (mp.manager.Queue): Queue from which collect results.
-        results_csv_path (str): CSV where we have to save results.
+        params (dict): Dictionary of parameters, or list of parameters of
+            each algorithm when several algorithms are run together.
         dev_mode (bool): Whether to run algorithm in development mode.
+        local_reduce (bool): Whether to reduce results locally.
+        sinks (list): `opalalgorithms.utils.sinks.ResultSink` of each
+            algorithm to which results are written, None to not use sinks.
+        vocabularies (list): Vocabulary of each algorithm, None for
+            algorithms without vocabulary.
+        max_rss (int): Resident memory in bytes above which a
+            `RuntimeWarning` is issued, None for no limit. The collector
+            holds state which cannot be handed off, hence it is not
+            recycled.
+        cpus (list): Cpus to which the collector is pinned while it runs,
+            None to not pin it.
 
     Returns:
-        bool: True on successful exit if `dev_mode` is set to False.
+        tuple: Result, which is True on successful exit if `dev_mode` is
+        set to False, and `opalalgorithms.utils.memory.MemoryUsage` of the
+        collector.
 
     Note:
         If `dev_mode` is set to true, then collector will just return all the
-        results in a list format.
+        results in a list format. If `local_reduce` is set to true, then
+        collector will return a `StreamingReducer` with reduced results.
+        If `sinks` are given, collector will return the closed sinks.
+        Results of algorithms with a vocabulary are always summed to a
+        `opalalgorithms.utils.dense.DenseReducer`.
+        If `params` is a list, results of each algorithm are processed
+        separately and a list with the result of each algorithm is returned.
 
     """
-    result_processor = ResultProcessor(params, dev_mode)
+    params_list = params if isinstance(params, list) else [params]
+    sinks = sinks or [None] * len(params_list)
+    vocabularies = vocabularies or [None] * len(params_list)
+    result_processors = [
+        ResultProcessor(
+            algorithm_params, dev_mode, local_reduce, sink, vocabulary)
+        for algorithm_params, sink, vocabulary in zip(
+            params_list, sinks, vocabularies)]
+    usage = MemoryUsage('collector')
+    previous_cpus = set_affinity(cpus) if cpus else None
+    try:
+        results = _collect(writing_queue, result_processors, usage, max_rss)
+    finally:
+        if previous_cpus is not None:
+            set_affinity(previous_cpus)
+    return (results if isinstance(params, list) else results[0]), usage
+
+
+def _collect(writing_queue, result_processors, usage, max_rss):
+    """Process results of the writing queue until it is killed."""
+    num_results = 0
     while True:
         # wait for result to appear in the queue
         processed_result = writing_queue.get()
         # if got signal 'kill' exit the loop
         if processed_result == 'kill':
             break
-        result, scaler = processed_result
-        result_processor(result, scaler=scaler)
-    return result_processor.get_result()
+        result, scaler, index = processed_result
+        result_processors[index](result, scaler=scaler)
+        num_results += 1
+        if num_results % COLLECTOR_SAMPLE_INTERVAL == 1:
+            check_collector_memory(usage, max_rss)
+    results = [processor.get_result() for processor in result_processors]
+    check_collector_memory(usage, max_rss)
+    return results
+
+
+def check_collector_memory(usage, max_rss):
+    """Sample memory of the collector and warn once above `max_rss`."""
+    previous_peak = usage.peak
+    rss = usage.sample()
+    if max_rss and rss > max_rss >= previous_peak:
+        warnings.warn(
+            'Collector uses {:.0f} MB of memory, above the limit of '
+            '{:.0f} MB'.format(rss / 2 ** 20, max_rss / 2 ** 20),
+            RuntimeWarning)
 
 
 def is_valid_result(result):
@@ -212,7 +825,9 @@ def is_valid_result(result):
         Result is valid if it is a dict. All keys of the dict must be
         be a string. All values must be numbers. These results are sent to
         reducer which will sum, count, mean, median, mode of the values
-        belonging to same key.
+        belonging to same key, either the aggregation service or
+        `opalalgorithms.utils.reducer.StreamingReducer` if results are
+        reduced locally.
 
         Example:
             - {"alpha1": 1, "ant199": 1, ..}
@@ -238,25 +853,124 @@ def is_valid_result(result):
     return True
 
 
+class JobReport(object):
+    """Report of users processed during a job.
+
+    Args:
+        num_slowest (int): Number of slowest users to be kept.
+
+    Attributes:
+        skipped_users (list): List of `(user, reason)` of users skipped for
+            exceeding limits.
+        slowest_users (list): List of `(user, seconds)` of the slowest users,
+            slowest first.
+        profile (ProfileReport): Profile aggregated across profiled users.
+        memory (list): `opalalgorithms.utils.memory.MemoryUsage` of every
+            mapper, including recycled ones, and of the collector.
+        num_recycled (int): Number of mappers stopped to be replaced.
+        num_replaced (int): Number of recycled mappers replaced, mappers
+            recycled once no files are left are not replaced.
+
+    """
+
+    def __init__(self, num_slowest=10):
+        """Initialize report."""
+        self.num_slowest = num_slowest
+        self.skipped_users = []
+        self.memory = []
+        self.num_recycled = 0
+        self.num_replaced = 0
+        self._user_times = []  # min heap of (seconds, user)
+        self.profile = ProfileReport()
+
+    def add_time(self, user, seconds):
+        """Record time taken by a user."""
+        heapq.heappush(self._user_times, (seconds, user))
+        if len(self._user_times) > self.num_slowest:
+            heapq.heappop(self._user_times)
+
+    def add_skipped(self, user, reason):
+        """Record a user skipped for `reason`."""
+        self.skipped_users.append((user, reason))
+
+    def merge(self, other):
+        """Merge report of another mapper into this report."""
+        self.skipped_users.extend(other.skipped_users)
+        for seconds, user in other._user_times:
+            self.add_time(user, seconds)
+        self.profile.merge(other.profile)
+        self.memory.extend(other.memory)
+        self.num_recycled += other.num_recycled
+        self.num_replaced += other.num_replaced
+
+    @property
+    def slowest_users(self):
+        """Return list of `(user, seconds)`, slowest first."""
+        return [(user, seconds) for seconds, user in sorted(
+            self._user_times, reverse=True)]
+
+    def summary(self):
+        """Return JSON serializable summary of the report.
+
+        Returns:
+            dict: Skipped and slowest users, number of recycled and
+            replaced mappers and memory of each worker, with `name`, `pid`
+            and `peak` and `mean` resident memory in bytes.
+
+        """
+        return {
+            'skipped_users': [list(item) for item in self.skipped_users],
+            'slowest_users': [list(item) for item in self.slowest_users],
+            'num_recycled': self.num_recycled,
+            'num_replaced': self.num_replaced,
+            'memory': [
+                {'name': usage.name, 'pid': usage.pid, 'peak': usage.peak,
+                 'mean': usage.mean} for usage in self.memory],
+        }
+
+    def format_memory(self):
+        """Return table of peak and mean resident memory of each worker."""
+        lines = ['{:<10} {:>8} {:>10} {:>10} {:>8}'.format(
+            'worker', 'pid', 'peak MB', 'mean MB', 'samples')]
+        for usage in self.memory:
+            lines.append('{:<10} {:>8} {:>10.1f} {:>10.1f} {:>8}'.format(
+                usage.name, usage.pid, usage.peak / 2 ** 20,
+                usage.mean / 2 ** 20, usage.num_samples))
+        return '\n'.join(lines)
+
+
 class ResultProcessor(object):
     """Process results.
 
     Args:
         params (dict): Dictionary of parameters.
         dev_mode (bool): Specify if dev_mode is on.
+        local_reduce (bool): Specify if results are reduced locally.
+        sink (opalalgorithms.utils.sinks.ResultSink): Sink to which results
+            are written.
+        vocabulary (list): Keys of results of an algorithm returning
+            results of fixed vocabulary, which are then summed as arrays.
 
     """
 
-    def __init__(self, params, dev_mode):
+    def __init__(self, params, dev_mode, local_reduce=False, sink=None,
+                 vocabulary=None):
         """Initialize result processor."""
         self.params = params
         self.dev_mode = dev_mode
         self.result_list = []
+        self.reducer = StreamingReducer() if local_reduce else None
+        self.sink = sink
+        self.dense = DenseReducer(vocabulary) if vocabulary else None
 
     def __call__(self, result, scaler=1):
         """Process the result.
 
-        If dev_mode is set to true, it appends the result to a list.
+        If the algorithm has a vocabulary, it adds the result, or a partial
+        `DenseReducer` of a mapper, to the dense reducer.
+        Else if results are reduced locally, it adds the result to the
+        reducer. Else if a sink is set, it writes the result to the sink.
+        Else if dev_mode is set to true, it appends the result to a list.
         Else it send the post request to `aggregationServiceUrl`.
 
         Args:
@@ -264,12 +978,28 @@ class ResultProcessor(object):
             scaler (int): Scale results by what value.
 
         """
+        if self.dense is not None:
+            if isinstance(result, DenseReducer):
+                self.dense.merge(result)
+            else:
+                self.dense.add(result, scaler)
+            return
         result = scale_result(result, scaler)
-        if self.dev_mode:
+        if self.reducer is not None:
+            self.reducer(result)
+        elif self.sink is not None:
+            self.sink.write(result)
+        elif self.dev_mode:
             self.result_list.append(result)
         else:
             self._send_request(result)
 
+    def is_valid(self, result):
+        """Check if result is valid, see `is_valid_result`."""
+        if self.dense is not None:
+            return self.dense.is_valid(result)
+        return is_valid_result(result)
+
     def _send_request(self, result):
         """Send request to aggregationServiceUrl.
 
@@ -277,6 +1007,8 @@ class ResultProcessor(object):
             result (dict): Result to be sent as an update.
 
         """
+        import requests  # deferred, only needed outside of dev_mode
+
         response = requests.post(
             self.params['aggregationServiceUrl'], json={'update': result})
         if response.status_code != 200:
@@ -288,9 +1020,23 @@ class ResultProcessor(object):
         """Return the result after processing.
 
         Returns:
-            dict: if dev_mode is set to true else returns `True`
+            dict: if dev_mode is set to true else returns `True`. If results
+            are reduced locally, returns `StreamingReducer`. If a sink is
+            set, returns the closed sink. If the algorithm has a vocabulary,
+            returns `DenseReducer` in dev_mode or with local reduce, else
+            posts the sum of each key as a single update and returns `True`.
 
         """
+        if self.dense is not None:
+            if self.dev_mode or self.reducer is not None:
+                return self.dense
+            self._send_request(self.dense.totals())
+            return True
+        if self.reducer is not None:
+            return self.reducer
+        if self.sink is not None:
+            self.sink.close()
+            return self.sink
         if self.dev_mode:
             return self.result_list
         return True
@@ -300,22 +1046,145 @@ class AlgorithmRunner(object):
     """Algorithm runner.
 
     Args:
-        algorithm (dict): Dictionary containing `code` and `className`.
+        algorithm (dict): Dictionary containing `code` and `className`, or
+            list of such dictionaries, each with optional `params`, to run
+            several algorithms over the same data in a single pass. Each user
+            is then read once for all algorithms and results of each
+            algorithm are collected separately. An algorithm may declare
+            `vocabulary`, the list of keys it may emit, and then return a
+            list with the value of each key or a dict with keys from the
+            vocabulary. Its results are summed as arrays in mappers and the
+            run returns a `opalalgorithms.utils.dense.DenseReducer` with
+            sum, count and mean of each key in `dev_mode` or with
+            `local_reduce`, else the sums are sent to the aggregation
+            service as a single update.
         dev_mode (bool): Development mode switch
         multiprocess (bool): Use multiprocessing or single process for
             complete execution.
         sandboxing (bool): Use sandboxing for execution or execute in unsafe
             environment.
+        local_reduce (bool): Reduce results in the collector to sum, count,
+            mean, median and mode of each key instead of sending them to the
+            aggregation service.
+        result_cache (opalalgorithms.utils.resultcache.ResultCache): Cache
+            of results of users. Results of users whose csv file is
+            unchanged since a previous run with same algorithm and
+            parameters are reused instead of being recomputed.
+        limits (opalalgorithms.utils.options.Limits): Limits of the sandbox
+            of each user, by default 15 CPU seconds.
+        num_slowest (int): Number of slowest users to be reported.
+        zygote (opalalgorithms.utils.options.ZygoteOptions): Run users in
+            forked children of a zygote, None to start a new sandbox for
+            every user.
+        profile (opalalgorithms.utils.options.ProfileOptions): Profile a
+            sample of users inside the sandbox, None for no profiling. Only
+            available in `dev_mode` and without `zygote`.
+        pool (multiprocessing.Pool): Warm pool of worker processes to be used
+            instead of creating a new pool for every run. It must have more
+            processes than `num_threads`, one of them runs the collector.
+        manager (multiprocessing.Manager): Warm manager for the queues.
+        staging (opalalgorithms.utils.options.StagingOptions): How user
+            files are brought to the sandbox, by default copied by codejail
+            without read-ahead.
+        sink (opalalgorithms.utils.sinks.ResultSink): Sink to which results
+            are written instead of the aggregation service, e.g.
+            `JSONLinesSink`, or list with the sink of each algorithm when
+            several algorithms are run. The run then returns the closed
+            sink.
+        shared_params (list): Names of large read-only parameters, e.g.
+            lookup tables, which are published once per run to a memory
+            mapped file instead of being sent to the sandbox of every user.
+            Algorithms access them through a lazy dict-like view
+            `opalalgorithms.utils.sharedparams.SharedParams`. Each must be a
+            dict with string keys and JSON serializable values.
+        selection (opalalgorithms.utils.options.UserSelection): Restrict the
+            run to users in a time window or in locations, None to run all
+            users.
+        recycling (opalalgorithms.utils.options.RecyclingOptions): Replace
+            mappers by fresh ones after a number of users or above a
+            resident memory, None to keep mappers for the whole run.
+        pin_cpus (bool): Pin each mapper, and the sandboxes it starts, to
+            its own set of cores within a NUMA node and the collector to a
+            dedicated core, see `opalalgorithms.utils.affinity`. Requires
+            Linux and `multiprocess`, a `RuntimeWarning` is issued if
+            processes can not be pinned.
+
+    Attributes:
+        report (JobReport): Report of the last run, with users skipped for
+            exceeding limits, the slowest users and the aggregated profile,
+            which can be printed with `report.profile.format()`.
+        aggregator (opalalgorithms.utils.online.OnlineAggregator): Current
+            estimates of the last run started with `run_online`.
 
     """
 
     def __init__(self, algorithm, dev_mode=False, multiprocess=True,
-                 sandboxing=True):
+                 sandboxing=True, local_reduce=False, result_cache=None,
+                 limits=None, num_slowest=10, zygote=None, profile=None,
+                 pool=None, manager=None, staging=None, sink=None,
+                 shared_params=None, selection=None, recycling=None,
+                 pin_cpus=False):
         """Initialize class."""
         self.algorithm = algorithm
         self.dev_mode = dev_mode
         self.multiprocess = multiprocess
         self.sandboxing = sandboxing
+        self.local_reduce = local_reduce
+        self.result_cache = result_cache
+        self.limits = (limits or Limits()).as_codejail()
+        self.num_slowest = num_slowest
+        self.zygote = zygote
+        self.fused = isinstance(algorithm, list)
+        if self.fused and self.zygote:
+            raise ValueError('Zygote does not support several algorithms')
+        self.profile = None
+        if profile is not None:
+            if not dev_mode or self.zygote or self.fused:
+                raise ValueError(
+                    'Profiling requires dev_mode and is not supported with '
+                    'zygote or several algorithms')
+            self.profile = {'sample': profile.sample,
+                            'memory': profile.memory}
+        self.pool = pool
+        self.manager = manager
+        staging = staging or StagingOptions()
+        self.staging = staging.method
+        self.prefetch = staging.prefetch_config()
+        self.vocabularies = [algo.get('vocabulary') for algo in (
+            algorithm if self.fused else [algorithm])]
+        self.sinks = None
+        if sink is not None:
+            self.sinks = sink if self.fused else [sink]
+            if len(self.sinks) != (len(algorithm) if self.fused else 1):
+                raise ValueError('Every algorithm requires its own sink')
+            if local_reduce or any(self.vocabularies):
+                raise ValueError('Results reduced locally are not written '
+                                 'to a sink')
+        self.shared_params = shared_params
+        selection = selection or UserSelection()
+        self.time_window = selection.time_window
+        self.time_index = selection.time_index
+        self.sorted_files = None
+        self.locations = selection.locations
+        self.location_index = selection.location_index
+        recycling = recycling or RecyclingOptions()
+        self.worker_max_users = recycling.max_users
+        self.worker_max_rss = recycling.max_rss
+        if pool is not None and recycling.max_rss:
+            warnings.warn(
+                'Mappers are not recycled above max_rss in a warm pool, '
+                'whose processes are kept, only the collector warns',
+                RuntimeWarning)
+        self.pin_cpus = pin_cpus
+        if pin_cpus and not (multiprocess and affinity_supported()):
+            warnings.warn(
+                'Processes are not pinned to cpus, which requires '
+                'os.sched_setaffinity and multiprocess', RuntimeWarning)
+        self.aggregator = None
+        self.report = None
+        self.num_users = 0
+        self._num_processed = 0
+        self._file_queue = None
 
     def __call__(self, params, data_dir, num_threads, weights_file=None):
         """Run algorithm.
@@ -328,24 +1197,232 @@ class AlgorithmRunner(object):
 
         Args:
             params (dict): Dictionary containing all the parameters for the
-                algorithm
+                algorithm, used by algorithms without their own `params`
+                when several algorithms are run.
             data_dir (str): Data directory with csv files.
             num_threads (int): Number of threads
-            weights_file (str): Path to the json file containing weights.
+            weights_file (str): Path to the json file containing weights, or
+                to a weights store created by
+                `opalalgorithms.utils.weights.convert_weights`. Weights in a
+                store are looked up by the workers on demand instead of
+                being loaded by this process.
 
         Returns:
             int: Amount of time required for computation in microseconds.
+            List with the result of each algorithm if several algorithms
+            are run.
+
+        """
+        return self._run(params, data_dir, num_threads, weights_file)
+
+    def run_online(self, params, data_dir, num_threads, relative_error=0.05,
+                   time_budget=None, confidence=0.95, min_users=30,
+                   callback=None, publish_interval=1.0, seed=None,
+                   weights_file=None):
+        """Run algorithm with online aggregation and early stopping.
+
+        Users are processed in random order and the total of each key over
+        all users is estimated from the users processed so far, with
+        confidence intervals. Estimates are published to `callback` while
+        the run progresses, and the run stops early once the error target
+        or the time budget is reached. Results are scaled by weights like in
+        a complete run but not sent to the aggregation service.
+
+        Args:
+            params (dict): Dictionary containing all the parameters for the
+                algorithm.
+            data_dir (str): Data directory with csv files.
+            num_threads (int): Number of threads.
+            relative_error (float): Stop once the confidence interval of
+                every key is within this fraction of its estimate, None to
+                not stop on error.
+            time_budget (float): Stop after this many seconds, None for no
+                budget.
+            confidence (float): Confidence level of the intervals.
+            min_users (int): Minimum number of users before stopping on
+                error.
+            callback (callable): Function called with the
+                `opalalgorithms.utils.online.OnlineAggregator` whenever
+                estimates are published and once the run is finished.
+            publish_interval (float): Seconds between publishing estimates
+                and checking whether to stop.
+            seed (int): Seed for the random order of users.
+            weights_file (str): Path to weights, see `__call__`.
+
+        Returns:
+            opalalgorithms.utils.online.OnlineAggregator: Final estimates,
+            also available as `aggregator` during the run.
 
         """
+        if self.fused or self.vocabularies[0]:
+            raise ValueError(
+                'Online aggregation supports only a single algorithm '
+                'without vocabulary')
+        online = {
+            'relative_error': relative_error, 'time_budget': time_budget,
+            'confidence': confidence, 'min_users': min_users,
+            'callback': callback, 'publish_interval': publish_interval,
+            'seed': seed}
+        return self._run(params, data_dir, num_threads, weights_file, online)
+
+    def _run(self, params, data_dir, num_threads, weights_file, online=None):
         check_environ()
+        self.report = JobReport(self.num_slowest)
+        if self.fused:
+            params = [algorithm.get('params', params)
+                      for algorithm in self.algorithm]
         csv_files = [os.path.join(
             os.path.abspath(data_dir), f) for f in os.listdir(data_dir)
                      if f.endswith('.csv')]
-        csv2weights = self._get_weights(csv_files, weights_file)
-        if self.multiprocess:
-            return self._multiprocess(
-                params, num_threads, csv_files, csv2weights)
-        return self._singleprocess(params, csv_files, csv2weights)
+        if self.time_window is not None or self.locations is not None:
+            csv_files = self._select_users(csv_files, data_dir)
+        if online is not None:
+            random.Random(online['seed']).shuffle(csv_files)
+            self.aggregator = OnlineAggregator(
+                len(csv_files), online['confidence'],
+                online['relative_error'], online['time_budget'],
+                online['min_users'])
+        self.num_users = len(csv_files)
+        self._num_processed = 0
+        self._file_queue = None
+        weights_store = None
+        csv2weights = None
+        if weights_file and is_weights_store(weights_file):
+            weights_store = WeightsStore(weights_file)
+        else:
+            csv2weights = self._get_weights(csv_files, weights_file)
+        shared_dirs = []
+        try:
+            if self.shared_params:
+                params, shared_dirs = self._publish_shared_params(params)
+            if online is not None:
+                result = self._online(
+                    params, num_threads, csv_files, csv2weights,
+                    weights_store, online)
+            elif self.multiprocess:
+                result = self._multiprocess(
+                    params, num_threads, csv_files, csv2weights,
+                    weights_store)
+            else:
+                result = self._singleprocess(
+                    params, csv_files, csv2weights, weights_store)
+        finally:
+            for shared_dir in shared_dirs:
+                shutil.rmtree(shared_dir, ignore_errors=True)
+        if self.result_cache is not None:
+            self.result_cache.evict()
+        if self.dev_mode and self.report.memory:
+            print(self.report.format_memory())
+        return result
+
+    def progress(self):
+        """Return fraction of users of the current run taken for processing.
+
+        Returns:
+            float: Progress between 0 and 1.
+
+        """
+        if not self.num_users:
+            return 0.0
+        if self._file_queue is not None:
+            return 1 - self._file_queue.qsize() / self.num_users
+        return self._num_processed / self.num_users
+
+    def estimate(self, params, data_dir, num_threads=None, sample_size=20,
+                 num_strata=4, seed=None):
+        """Estimate cost of running the algorithm without running it fully.
+
+        Runs the algorithm on a sample of users stratified by size of their
+        csv files, measures time spent reading the file, in sandbox, parsing
+        and `map`, cpu time, memory and size of results, and extrapolates
+        them to all users of `data_dir`. Nothing is sent to the aggregation
+        service.
+
+        Args:
+            params (dict): Dictionary containing all the parameters for the
+                algorithm
+            data_dir (str): Data directory with csv files.
+            num_threads (int): Number of threads for which wall time is
+                estimated, by default the recommended number of threads.
+            sample_size (int): Approximate number of users to be run.
+            num_strata (int): Number of strata of users by file size.
+            seed (int): Seed for sampling users.
+
+        Returns:
+            dict: Estimated cost of the complete run and recommended
+            settings, see `opalalgorithms.utils.estimator.CostEstimator`.
+
+        """
+        if self.fused:
+            raise ValueError('Estimate supports only a single algorithm')
+        check_environ()
+        csv_files = [os.path.join(
+            os.path.abspath(data_dir), f) for f in os.listdir(data_dir)
+                     if f.endswith('.csv')]
+        estimator = CostEstimator()
+        jail = get_jail(python_version=2, limits=self.limits)
+        for num_users, sampled_files in stratified_sample(
+                csv_files, sample_size, num_strata, seed):
+            measurements = []
+            for fpath in sampled_files:
+                start_time = time.time()
+                with open(fpath, 'rb') as csv_file:
+                    while csv_file.read(2 ** 20):
+                        pass
+                read_seconds = time.time() - start_time
+                start_time = time.time()
+                try:
+                    result, stats = process_user_csv(
+                        params, fpath, self.algorithm, self.dev_mode,
+                        self.sandboxing, jail, return_stats=True)
+                except SafeExecException:
+                    estimator.num_failed += 1
+                    result, stats = None, {
+                        'parse': 0, 'map': 0, 'cpu': 0, 'max_rss': 0,
+                        'vm_peak': 0}
+                stats['total'] = time.time() - start_time
+                stats['read'] = read_seconds
+                stats['result_bytes'] = 0
+                if result and is_valid_result(result):
+                    stats['result_bytes'] = len(json.dumps(result))
+                measurements.append(stats)
+            estimator.add_stratum(num_users, measurements)
+        return estimator.estimate(num_threads)
+
+    def _select_users(self, csv_files, data_dir):
+        """Return users in the locations and with records in time window."""
+        data_dir = os.path.abspath(data_dir)
+        selected = csv_files
+        if self.locations is not None:
+            # only new users and the users found are read
+            index = LocationIndex(self.location_index, data_dir)
+            selected = index.select(csv_files, self.locations)
+        if self.time_window is not None:
+            # updated with all users, to not forget the others
+            index = TimeIndex(self.time_index, data_dir)
+            index.update(csv_files)
+            selected = index.select(selected, *self.time_window)
+            self.sorted_files = set(
+                fpath for fpath in selected if index.is_sorted(fpath))
+        return selected
+
+    def _publish_shared_params(self, params):
+        params_list = params if self.fused else [params]
+        published = []
+        shared_dirs = []
+        try:
+            for algorithm_params in params_list:
+                names = [name for name in self.shared_params
+                         if name in algorithm_params]
+                algorithm_params, shared_dir = publish_shared_params(
+                    algorithm_params, names)
+                published.append(algorithm_params)
+                shared_dirs.append(shared_dir)
+        except Exception:
+            for shared_dir in shared_dirs:
+                shutil.rmtree(shared_dir, ignore_errors=True)
+            raise
+        return (published if self.fused else published[0]), shared_dirs
 
     def _get_weights(self, csv_files, weights_file):
         """Return weights for each user if available, else return 1."""
@@ -362,50 +1439,291 @@ class AlgorithmRunner(object):
             csv2weights[file_path] = csv_weight
         return csv2weights
 
-    def _multiprocess(self, params, num_threads, csv_files, csv2weights):
-        # set up parallel processing
-        manager = mp.Manager()
-        writing_queue = manager.Queue()
+    def _queue_files(self, manager, csv_files, csv2weights):
         file_queue = manager.Queue()
         for fpath in csv_files:
-            file_queue.put((fpath, csv2weights[fpath]))
-        jobs = []
-
+            # without csv2weights, mappers look weights up in weights_store
+            scaler = None
+            if csv2weights is not None:
+                scaler = csv2weights[fpath]
+            file_queue.put((fpath, scaler))
+        self._file_queue = file_queue
+        return file_queue
+
+    def _get_pool(self, num_threads):
+        if self.pool is not None:
+            return self.pool, False
         # additional 1 process for writer
         signal.signal(signal.SIGINT, signal.SIG_IGN)
-        pool = mp.Pool(processes=num_threads + 1)
+        recycle = self.worker_max_users or self.worker_max_rss
+        pool = mp.Pool(processes=num_threads + 1,
+                       maxtasksperchild=1 if recycle else None)
         signal.signal(signal.SIGINT, sigint_handler)
+        return pool, True
+
+    def _multiprocess(self, params, num_threads, csv_files, csv2weights,
+                      weights_store=None):
+        # set up parallel processing, reusing warm manager and pool if given
+        manager = self.manager or mp.Manager()
+        writing_queue = manager.Queue()
+        file_queue = self._queue_files(manager, csv_files, csv2weights)
+        pool, own_pool = self._get_pool(num_threads)
+        collector_cpus, mapper_cpus = self._plan_affinity(num_threads)
+        finished = False
         try:
             collector_job = pool.apply_async(
-                collector, (writing_queue, params, self.dev_mode))
-
-            # Compute the density
-            for _ in range(num_threads):
-                jobs.append(pool.apply_async(mapper, (
-                    writing_queue, params, file_queue, self.algorithm,
-                    self.dev_mode, self.sandboxing)))
-
-            # Clean up parallel processing (close pool, wait for processes to
-            # finish, kill writing_queue, wait for queue to be killed)
-            pool.close()
-            for job in jobs:
-                job.get()
-            writing_queue.put('kill')  # stop collection
-            result = collector_job.get()
-            pool.join()
+                collector, (writing_queue, params, self.dev_mode,
+                            self.local_reduce, self.sinks,
+                            self.vocabularies, self.worker_max_rss,
+                            collector_cpus))
+            try:
+                # Compute the density
+                jobs = self._start_mappers(
+                    pool, writing_queue, params, file_queue, weights_store,
+                    False, mapper_cpus)
+
+                # Wait for mappers to finish, if one fails the others stop
+                # after their current users
+                while self._poll_mappers(pool, jobs):
+                    time.sleep(0.05)
+                finished = True
+            finally:
+                if not finished:
+                    self._drain_file_queue(file_queue)
+                # stop collection, so that the collector never outlives
+                # the job in a warm pool
+                writing_queue.put('kill')
+            result, usage = collector_job.get()
+            self.report.memory.append(usage)
             return result
         except GracefulExit:
-            pool.terminate()
+            finished = False
+            print("Exiting")
+            raise RuntimeError("Received interrupt signal, exiting. Bye.")
+        finally:
+            self._release_pool(pool, own_pool, finished)
+
+    def _online(self, params, num_threads, csv_files, csv2weights,
+                weights_store, online):
+        aggregator = self.aggregator
+        callback = online['callback']
+        manager = None
+        pool = None
+        own_pool = False
+        if self.multiprocess:
+            manager = self.manager or mp.Manager()
+            writing_queue = manager.Queue()
+            file_queue = self._queue_files(manager, csv_files, csv2weights)
+            pool, own_pool = self._get_pool(num_threads)
+        stopped = False
+        finished = False
+        expected = len(csv_files)
+        last_check = time.time()
+        try:
+            if self.multiprocess:
+                _, mapper_cpus = self._plan_affinity(num_threads)
+                jobs = self._start_mappers(
+                    pool, writing_queue, params, file_queue, weights_store,
+                    True, mapper_cpus)
+                items = self._iter_online_items(writing_queue, pool, jobs)
+            else:
+                items = self._iter_online_singleprocess(
+                    params, csv_files, csv2weights, weights_store)
+            for item in items:
+                result, scaler, _ = item or (None, None, None)
+                if item is not None:
+                    aggregator.update(
+                        None if result is None else
+                        scale_result(result, scaler))
+                if (stopped or time.time() - last_check <
+                        online['publish_interval']):
+                    if aggregator.num_users >= expected:
+                        break
+                    continue
+                last_check = time.time()
+                if callback is not None:
+                    callback(aggregator)
+                if aggregator.should_stop():
+                    stopped = True
+                    if not self.multiprocess:
+                        break
+                    # mappers finish after their current users
+                    expected -= self._drain_file_queue(file_queue)
+                if aggregator.num_users >= expected:
+                    break
+            if self.multiprocess:
+                while self._poll_mappers(pool, jobs):
+                    time.sleep(0.05)
+            finished = True
+        except GracefulExit:
             print("Exiting")
-            pool.join()
             raise RuntimeError("Received interrupt signal, exiting. Bye.")
+        finally:
+            if self.multiprocess:
+                if not finished:
+                    self._drain_file_queue(file_queue)
+                self._release_pool(pool, own_pool, finished)
+        aggregator.finish(stopped)
+        if callback is not None:
+            callback(aggregator)
+        return aggregator
+
+    def _plan_affinity(self, num_threads):
+        """Return cpus of the collector and of each mapper, None if not."""
+        if not self.pin_cpus:
+            return None, [None] * num_threads
+        return plan_affinity(num_threads)
+
+    def _start_mappers(self, pool, writing_queue, params, file_queue,
+                       weights_store, online, mapper_cpus):
+        """Start a mapper for each cpu set, return `(job, args)` of each."""
+        jobs = []
+        for cpus in mapper_cpus:
+            args = (writing_queue, params, file_queue, self.algorithm,
+                    self.dev_mode, self.sandboxing, 2, self.result_cache,
+                    self.limits, self.num_slowest, self.zygote, self.profile,
+                    weights_store, self.prefetch, online, self.staging,
+                    self.time_window, self.sorted_files,
+                    self.worker_max_users,
+                    None if self.pool is not None else self.worker_max_rss,
+                    cpus)
+            jobs.append((pool.apply_async(mapper, args), args))
+        return jobs
+
+    def _release_pool(self, pool, own_pool, finished):
+        """Close the pool if it was created for this run.
+
+        Pools passed to the runner are left running for later jobs, pools
+        of the runner are terminated if the run did not finish.
 
-    def _singleprocess(self, params, csv_files, csv2weights):
-        result_processor = ResultProcessor(params, self.dev_mode)
-        jail = get_jail(python_version=2)
-        for fpath in csv_files:
-            scaler = csv2weights[fpath]
-            result = process_user_csv(
-                params, fpath, self.algorithm, self.dev_mode, self.sandboxing, jail)
-            result_processor(result, scaler=scaler)
-        return result_processor.get_result()
+        """
+        if not own_pool:
+            return
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()
+
+    def _poll_mappers(self, pool, jobs):
+        """Merge reports of finished mappers and replace recycled ones.
+
+        Replacements get the arguments, hence the cpus, of the mapper they
+        replace. Mappers recycled once no files are queued are not replaced.
+
+        Returns:
+            bool: Whether any mapper is still running.
+
+        """
+        for item in [item for item in jobs if item[0].ready()]:
+            jobs.remove(item)
+            job, args = item
+            report = job.get()
+            self.report.merge(report)
+            if report.num_recycled and not self._file_queue.empty():
+                self.report.num_replaced += 1
+                jobs.append((pool.apply_async(mapper, args), args))
+        return bool(jobs)
+
+    def _iter_online_items(self, writing_queue, pool, jobs):
+        """Yield items of mappers, None while waiting for them."""
+        while True:
+            try:
+                yield writing_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self._poll_mappers(pool, jobs) and \
+                        writing_queue.empty():
+                    return
+                yield None
+
+    def _iter_online_singleprocess(self, params, csv_files, csv2weights,
+                                   weights_store):
+        """Process users one by one and yield items like mappers."""
+        if self.zygote:
+            jail = get_zygote(self.algorithm, params, self.dev_mode,
+                              self.sandboxing, self.limits, self.zygote.warm)
+        else:
+            jail = get_jail(python_version=2, limits=jail_limits(
+                self.limits, self.algorithm))
+        stager = get_stager(self.staging, self.zygote, self.time_window,
+                            self.sorted_files)
+        job_key = None
+        if self.result_cache is not None:
+            job_key = self.result_cache.job_key(
+                self.algorithm, params, self.time_window)
+        try:
+            for fpath in csv_files:
+                if csv2weights is not None:
+                    scaler = csv2weights[fpath]
+                else:
+                    scaler = weights_store.get(
+                        os.path.splitext(os.path.basename(fpath))[0])
+                result = process_user_csv_limited(
+                    self.report, self.limits, self.result_cache, job_key,
+                    params, fpath, self.algorithm, self.dev_mode,
+                    self.sandboxing, jail, self.profile, stager)
+                self._num_processed += 1
+                if not (result and is_valid_result(result)):
+                    result = None
+                yield result, scaler, 0
+        finally:
+            if self.zygote:
+                release_zygote(jail)
+            if stager is not None:
+                stager.close()
+
+    def _drain_file_queue(self, file_queue):
+        """Remove files not yet taken by mappers and return their number."""
+        num_drained = 0
+        while True:
+            try:
+                file_queue.get_nowait()
+            except queue.Empty:
+                return num_drained
+            num_drained += 1
+
+    def _singleprocess(self, params, csv_files, csv2weights,
+                       weights_store=None):
+        params_list = params if self.fused else [params]
+        sinks = self.sinks or [None] * len(params_list)
+        result_processors = [
+            ResultProcessor(
+                algorithm_params, self.dev_mode, self.local_reduce, sink,
+                vocabulary)
+            for algorithm_params, sink, vocabulary in zip(
+                params_list, sinks, self.vocabularies)]
+        if self.zygote:
+            jail = get_zygote(self.algorithm, params, self.dev_mode,
+                              self.sandboxing, self.limits, self.zygote.warm)
+        else:
+            jail = get_jail(python_version=2, limits=jail_limits(
+                self.limits, self.algorithm))
+        stager = get_stager(self.staging, self.zygote, self.time_window,
+                            self.sorted_files)
+        job_key = None
+        if self.result_cache is not None:
+            job_key = self.result_cache.job_key(
+                self.algorithm, params, self.time_window)
+        try:
+            for fpath in csv_files:
+                if csv2weights is not None:
+                    scaler = csv2weights[fpath]
+                else:
+                    scaler = weights_store.get(
+                        os.path.splitext(os.path.basename(fpath))[0])
+                result = process_user_csv_limited(
+                    self.report, self.limits, self.result_cache, job_key,
+                    params, fpath, self.algorithm, self.dev_mode,
+                    self.sandboxing, jail, self.profile, stager)
+                self._num_processed += 1
+                results = result if self.fused else [result]
+                for index, result in enumerate(results or []):
+                    if result and result_processors[index].is_valid(result):
+                        result_processors[index](result, scaler=scaler)
+        finally:
+            if self.zygote:
+                release_zygote(jail)
+            if stager is not None:
+                stager.close()
+        results = [processor.get_result() for processor in result_processors]
+        return results if self.fused else results[0]
@@ -1,16 +1,101 @@
 """Data generator class for generating data for testing purposes."""
 from __future__ import division, print_function
+import bisect
+import datetime
 import random
 import string
 import time
 
+import six
 
-__all__ = ["OPALDataGenerator"]
+
+__all__ = ["OPALDataGenerator", "PROFILES"]
+
+DEFAULT_PROFILE = {
+    'records_exponent': None,
+    'max_records_factor': 100,
+    'antenna_exponent': None,
+    'correspondent_exponent': None,
+    'num_correspondents': 20,
+    'daily_cycle': False,
+    'weekly_cycle': False,
+}
+# named workload profiles, overriding `DEFAULT_PROFILE`
+PROFILES = {
+    'uniform': {},
+    'realistic': {
+        'records_exponent': 2.5,
+        'antenna_exponent': 1.0,
+        'correspondent_exponent': 1.2,
+        'num_correspondents': 50,
+        'daily_cycle': True,
+        'weekly_cycle': True,
+    },
+    'heavy_tail': {
+        'records_exponent': 1.5,
+        'max_records_factor': 1000,
+        'antenna_exponent': 1.5,
+        'correspondent_exponent': 1.5,
+        'num_correspondents': 200,
+        'daily_cycle': True,
+        'weekly_cycle': True,
+    },
+}
+# relative activity of each hour of the day and each day of the week
+HOURLY_WEIGHTS = [
+    0.3, 0.2, 0.1, 0.1, 0.1, 0.2, 0.4, 0.7, 1.0, 1.1, 1.1, 1.2,
+    1.3, 1.2, 1.1, 1.1, 1.2, 1.4, 1.6, 1.7, 1.6, 1.3, 0.9, 0.5]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 1.0, 1.0, 1.1, 0.8, 0.6]
+START_DATE = datetime.datetime(2016, 1, 1)
+NUM_DAYS = 366
+
+
+def _cumulative(weights):
+    """Return cumulative sums of weights."""
+    total = 0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def _zipf_cumulative(num, exponent):
+    """Return cumulative weights of ranks 1 to `num` with Zipf's law."""
+    return _cumulative(1 / rank ** exponent for rank in range(1, num + 1))
+
+
+def _choose_index(rng, cumulative):
+    """Return index drawn with cumulative weights."""
+    return min(bisect.bisect_right(cumulative, rng.random() * cumulative[-1]),
+               len(cumulative) - 1)
 
 
 class OPALDataGenerator(object):
     """Generate data as per OPAL formats for testing purposes.
 
+    By default every user has exactly `num_records_per_user` records spread
+    uniformly over the year, and antennas and correspondents are chosen
+    uniformly. A workload profile makes the data skewed like production
+    data, where a few users dominate runtime. Profiles are dicts with the
+    following keys, or names of `PROFILES`:
+
+    * `records_exponent`: Exponent of the power law of the number of
+      records per user, whose mean is `num_records_per_user`. Must be
+      larger than 1, smaller values give heavier tails. None for exactly
+      `num_records_per_user` records.
+    * `max_records_factor`: Users have at most this many times
+      `num_records_per_user` records.
+    * `antenna_exponent`: Exponent of Zipf's law of the popularity of
+      antennas across users and of the antennas of each user, None for
+      uniform choice.
+    * `correspondent_exponent`: Exponent of Zipf's law of the popularity of
+      the correspondents of each user, None for uniform choice.
+    * `num_correspondents`: Number of correspondents of each user.
+    * `daily_cycle`: Make records more frequent during the day than at
+      night.
+    * `weekly_cycle`: Make records less frequent during weekends.
+
     Args:
         num_antennas (int): Total number of antennas available.
         num_antennas_per_user (int): Total number of different antennas a user
@@ -19,6 +104,12 @@ class OPALDataGenerator(object):
             over the complete year.
         bandicoot_extended (bool): To use bandicoot extended format or
             old format.
+        profile (str): Name of a profile in `PROFILES`, or dict overriding
+            keys of the default uniform profile.
+        seed (int): Seed of the generated data. Data of each user depends
+            only on the seed and the user id passed to `generate_data`, so
+            that it does not depend on how users are split between
+            processes. None for different data on every call.
 
     Todo:
         * Remove bandicoot extended once that library is fixed.
@@ -26,7 +117,8 @@ class OPALDataGenerator(object):
     """
 
     def __init__(self, num_antennas, num_antennas_per_user,
-                 num_records_per_user, bandicoot_extended=True):
+                 num_records_per_user, bandicoot_extended=True,
+                 profile=None, seed=None):
         """Initialize data generator class."""
         self.num_antennas = num_antennas
         self.num_antennas_per_user = num_antennas_per_user
@@ -42,19 +134,63 @@ class OPALDataGenerator(object):
             "Lazzio,Roma", "Veneto,Venice", "Bruxelles,Bruxelles",
             "Flandesr,Brugges", "Maharashtra,Mumbai"]
         self.bandicoot_extended = bandicoot_extended
+        if isinstance(profile, six.string_types):
+            if profile not in PROFILES:
+                raise ValueError('Unknown profile {!r}'.format(profile))
+            profile = PROFILES[profile]
+        unknown = set(profile or {}) - set(DEFAULT_PROFILE)
+        if unknown:
+            raise ValueError('Unknown profile keys {}'.format(
+                ', '.join(sorted(unknown))))
+        self.profile = dict(DEFAULT_PROFILE, **(profile or {}))
+        if (self.profile['records_exponent'] is not None and
+                self.profile['records_exponent'] <= 1):
+            raise ValueError('Exponent of records must be larger than 1')
+        self.seed = seed
+        self.__antenna_weights = None
+        self.__user_antenna_weights = None
+        if self.profile['antenna_exponent'] is not None:
+            self.__antenna_weights = _zipf_cumulative(
+                num_antennas, self.profile['antenna_exponent'])
+            self.__user_antenna_weights = _zipf_cumulative(
+                num_antennas_per_user, self.profile['antenna_exponent'])
+        self.__correspondent_weights = None
+        if self.profile['correspondent_exponent'] is not None:
+            self.__correspondent_weights = _zipf_cumulative(
+                self.profile['num_correspondents'],
+                self.profile['correspondent_exponent'])
+        self.__day_weights = None
+        if self.profile['weekly_cycle']:
+            self.__day_weights = _cumulative(
+                WEEKDAY_WEIGHTS[(START_DATE + datetime.timedelta(day))
+                                .weekday()]
+                for day in range(NUM_DAYS))
+        self.__hour_weights = None
+        if self.profile['daily_cycle']:
+            self.__hour_weights = _cumulative(HOURLY_WEIGHTS)
+
+    def generate_data(self, user_id=None):
+        """Generate data for a single user.
+
+        Args:
+            user_id (str): Id of the user, from which data of the user is
+                derived together with `seed`.
 
-    def generate_data(self):
-        """Generate data for a single user."""
-        antennas = [str(random.randint(0, self.num_antennas - 1))
-                    for i in range(self.num_antennas_per_user)]
-        latitude = [str(round(random.random()*90, 6))
+        """
+        rng = random.Random(
+            None if self.seed is None else '{}:{}'.format(self.seed, user_id))
+        antennas = [str(self.__choose(
+            rng, self.num_antennas, self.__antenna_weights))
+            for i in range(self.num_antennas_per_user)]
+        latitude = [str(round(rng.random()*90, 6))
                     for i in antennas]
-        longitude = [str(round(random.random()*180, 6))
+        longitude = [str(round(rng.random()*180, 6))
                      for i in antennas]
-        location = [self.__levels[random.randint(0, 15)]
+        location = [self.__levels[rng.randint(0, 15)]
                     for i in antennas]
-        users = [random.choice(string.ascii_letters) + random.choice(
-            string.ascii_letters) for j in range(20)]
+        users = [rng.choice(string.ascii_letters) + rng.choice(
+            string.ascii_letters)
+            for j in range(self.profile['num_correspondents'])]
         lines = []
         if self.bandicoot_extended:
             lines.append('interaction,direction,correspondent_id,datetime,'
@@ -63,28 +199,60 @@ class OPALDataGenerator(object):
         else:
             lines.append('interaction,direction,correspondent_id,datetime,'
                          'call_duration,antenna_id')
-        date_props = [random.random() for i in range(
-            self.num_records_per_user)]
-        date_props.sort()
-        for k in range(self.num_records_per_user):
+        for date in self.__generate_dates(rng):
             lines.append(self.__generate_single_line(
-                antennas, users, date_props[k], latitude, longitude, location))
+                rng, antennas, users, date, latitude, longitude, location))
         return '\n'.join(lines) + '\n'
 
+    def __num_records(self, rng):
+        """Draw number of records of a user from the profile."""
+        exponent = self.profile['records_exponent']
+        if exponent is None:
+            return self.num_records_per_user
+        # Pareto distribution with mean `num_records_per_user`
+        scale = self.num_records_per_user * (exponent - 1) / exponent
+        return max(1, min(
+            int(scale * rng.paretovariate(exponent)),
+            self.profile['max_records_factor'] * self.num_records_per_user))
+
+    def __choose(self, rng, num, cumulative):
+        """Choose index below `num`, with weights if given."""
+        if cumulative is None:
+            return rng.randint(0, num - 1)
+        return _choose_index(rng, cumulative)
+
+    def __generate_dates(self, rng):
+        """Generate sorted dates of records of a user."""
+        num_records = self.__num_records(rng)
+        if self.__day_weights is None and self.__hour_weights is None:
+            date_props = [rng.random() for i in range(num_records)]
+            date_props.sort()
+            return [self.__random_date(
+                "2016-01-01 00:00:01", "2016-12-31 23:59:59", date_prop)
+                for date_prop in date_props]
+        dates = []
+        for _ in range(num_records):
+            day = self.__choose(rng, NUM_DAYS, self.__day_weights)
+            hour = self.__choose(rng, 24, self.__hour_weights)
+            dates.append(START_DATE + datetime.timedelta(
+                days=day, hours=hour, seconds=rng.randint(0, 3599)))
+        dates.sort()
+        return [date.strftime('%Y-%m-%d %H:%M:%S') for date in dates]
+
     def __generate_single_line(
-            self, antennas, users, date_prop,
+            self, rng, antennas, users, date,
             latitude, longitude, location):
         """Generate a single call data record."""
-        interaction = random.choice(self.__interactions)
-        direction = random.choice(self.__directions)
-        user = users[random.randint(0, 19)]
-        date = self.__random_date(
-            "2016-01-01 00:00:01", "2016-12-31 23:59:59", date_prop)
+        interaction = rng.choice(self.__interactions)
+        direction = rng.choice(self.__directions)
+        user = users[self.__choose(
+            rng, len(users), self.__correspondent_weights)]
         call_length = ''
         if interaction == "call":
             call_length = str(
-                random.randint(0, self.num_antennas - 1))
-        antenna_index = random.randint(0, self.num_antennas_per_user - 1)
+                rng.randint(0, self.num_antennas - 1))
+        antenna_index = self.__choose(
+            rng, self.num_antennas_per_user, self.__user_antenna_weights)
         antenna_id = antennas[antenna_index]
         line = ''
         if self.bandicoot_extended:
@@ -0,0 +1,135 @@
+"""Array backed results of algorithms with a fixed vocabulary of keys.
+
+An algorithm declaring its `vocabulary`, the list of keys it may emit,
+returns either a list of numbers with the value of each key of the
+vocabulary in order, or a dict with keys from the vocabulary. Results are
+converted to fixed-length arrays, hence validation, scaling and summation are
+vectorised and mappers send a single pre-summed array to the collector
+instead of a dict per user.
+"""
+from __future__ import division, print_function
+
+import numpy as np
+import six
+
+
+__all__ = ["DenseReducer", "to_dense"]
+
+
+def to_dense(result, index):
+    """Convert a result to an array of values of each key of a vocabulary.
+
+    Args:
+        result (list or dict): List of numbers of the length of the
+            vocabulary or dict with keys from the vocabulary.
+        index (dict): Position of each key of the vocabulary.
+
+    Returns:
+        numpy.ndarray: Array of float64 values, None if result is invalid.
+
+    """
+    if isinstance(result, dict):
+        array = np.zeros(len(index))
+        try:
+            positions = [index[key] for key in result]
+        except (KeyError, TypeError):
+            return None
+        values = list(six.itervalues(result))
+    else:
+        array = None
+        values = result
+    try:
+        values = np.asarray(values)
+    except ValueError:
+        return None
+    # only integers and floats, like `is_valid_result`
+    if values.ndim != 1 or values.dtype.kind not in 'biuf':
+        return None
+    values = values.astype(np.float64)
+    if not np.isfinite(values).all():
+        return None
+    if array is None:
+        return values if len(values) == len(index) else None
+    array[positions] = values
+    return array
+
+
+class DenseReducer(object):
+    """Sum results of an algorithm with a fixed vocabulary of keys.
+
+    Args:
+        vocabulary (list): Keys which the algorithm may emit.
+
+    Attributes:
+        num_users (int): Number of results added.
+        sums (numpy.ndarray): Sum of the scaled values of each key.
+        counts (numpy.ndarray): Number of results emitting each key, zeros
+            included, like the count of `StreamingReducer`. A list result
+            emits every key of the vocabulary.
+
+    """
+
+    def __init__(self, vocabulary):
+        """Initialize reducer."""
+        self.vocabulary = list(vocabulary)
+        self.index = dict((key, i) for i, key in enumerate(self.vocabulary))
+        if len(self.index) != len(self.vocabulary):
+            raise ValueError('Vocabulary must not contain duplicate keys')
+        self.num_users = 0
+        self.sums = np.zeros(len(self.vocabulary))
+        self.counts = np.zeros(len(self.vocabulary), dtype=np.int64)
+
+    def is_valid(self, result):
+        """Check if result is valid for the vocabulary."""
+        return to_dense(result, self.index) is not None
+
+    def add(self, result, scaler=1):
+        """Add a result scaled by `scaler`.
+
+        Args:
+            result (list or dict): Result of the algorithm for a user.
+            scaler (number): Factor by which the result is scaled.
+
+        Returns:
+            bool: Whether the result was valid and added.
+
+        """
+        array = to_dense(result, self.index)
+        if array is None:
+            return False
+        self.num_users += 1
+        self.sums += scaler * array
+        if isinstance(result, dict):
+            self.counts[[self.index[key] for key in result]] += 1
+        else:
+            self.counts += 1
+        return True
+
+    def merge(self, other):
+        """Merge another reducer of the same vocabulary."""
+        if other.vocabulary != self.vocabulary:
+            raise ValueError('Reducers have different vocabularies')
+        self.num_users += other.num_users
+        self.sums += other.sums
+        self.counts += other.counts
+
+    def totals(self):
+        """Return sum of each key emitted by any result as a dict."""
+        return dict((self.vocabulary[i], float(self.sums[i]))
+                    for i in np.flatnonzero(self.counts))
+
+    def summary(self):
+        """Return sum, count and mean of each key emitted by any result.
+
+        Returns:
+            dict: Dictionary with key as result key and value as dictionary
+            with `sum`, `count` and `mean`, the sum divided by the number of
+            results emitting the key.
+
+        """
+        return dict(
+            (self.vocabulary[i], {
+                'sum': float(self.sums[i]),
+                'count': int(self.counts[i]),
+                'mean': float(self.sums[i] / self.counts[i])})
+            for i in np.flatnonzero(self.counts))
@@ -0,0 +1,183 @@
+"""Estimate cost of running an algorithm from a sample of users."""
+from __future__ import division, print_function
+import math
+import multiprocessing as mp
+import os
+import random
+
+
+__all__ = ["stratified_sample", "CostEstimator"]
+
+MEASURED_FIELDS = ('total', 'read', 'parse', 'map', 'cpu', 'max_rss',
+                   'result_bytes')
+# recommended limits are the largest sampled value times these margins
+TIME_LIMIT_MARGIN = 3
+MEMORY_LIMIT_MARGIN = 2
+# files are read ahead once reading takes this share of the time of a user
+PREFETCH_MIN_SHARE = 0.05
+
+
+def stratified_sample(csv_files, sample_size, num_strata=4, seed=None):
+    """Sample csv files stratified by their size.
+
+    Files are sorted by size and split into `num_strata` strata with equal
+    number of files. Each stratum is sampled proportionally to its size, with
+    at least one file per stratum.
+
+    Args:
+        csv_files (list): List of paths of csv files of users.
+        sample_size (int): Approximate number of files to be sampled.
+        num_strata (int): Number of strata.
+        seed (int): Seed for sampling.
+
+    Returns:
+        list: List of `(num_files_in_stratum, sampled_files)`.
+
+    """
+    rng = random.Random(seed)
+    sorted_files = sorted(csv_files, key=os.path.getsize)
+    num_strata = max(1, min(num_strata, len(sorted_files)))
+    strata = []
+    for i in range(num_strata):
+        stratum = sorted_files[i * len(sorted_files) // num_strata:
+                               (i + 1) * len(sorted_files) // num_strata]
+        num_sampled = max(1, int(round(
+            sample_size * len(stratum) / len(sorted_files))))
+        strata.append((len(stratum), rng.sample(
+            stratum, min(num_sampled, len(stratum)))))
+    return strata
+
+
+def _available_memory():
+    """Return available physical memory in bytes, None if unknown."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class CostEstimator(object):
+    """Extrapolate cost of a complete run from measurements of a sample.
+
+    Each measurement is a dict with `total` seconds in the sandbox, `read`
+    seconds of reading the csv file, `parse` and `map` seconds, `cpu`
+    seconds of the sandbox, `max_rss` and `vm_peak` bytes of the sandbox
+    and `result_bytes` of the serialized result. Time spent outside parse
+    and map is accounted as sandbox cost.
+
+    The estimate contains `cpu_seconds` measured in the sandboxes and
+    `total_user_seconds`, the sum of wall clock seconds of every user,
+    which divided by the number of threads gives `wall_seconds`. Settings
+    of the batch are recommended as follows:
+
+    * `recommended_num_threads`: As many threads as cpus, one cpu being
+      left for the collector, and fitting in available memory.
+    * `recommended_limits`: Keyword arguments `cpu`, `realtime` and
+      `memory` of `opalalgorithms.utils.options.Limits`, a margin above the
+      largest sampled user, so that only outliers are skipped. `memory` is
+      None if virtual memory could not be measured.
+    * `recommended_prefetch`: Number of files read ahead by each mapper,
+      0 unless reading files takes a noticeable share of the time.
+    * `recommended_zygote`: Whether sandbox startup dominates the cost.
+
+    """
+
+    def __init__(self):
+        """Initialize estimator."""
+        self.strata = []
+        self.num_failed = 0
+
+    def add_stratum(self, num_users, measurements):
+        """Add measurements of the users sampled from a stratum.
+
+        Args:
+            num_users (int): Number of users in the stratum.
+            measurements (list): List of measurements of sampled users.
+
+        """
+        self.strata.append((num_users, measurements))
+
+    @property
+    def num_users(self):
+        """Return total number of users in all strata."""
+        return sum(num_users for num_users, _ in self.strata)
+
+    def _extrapolate(self, field):
+        """Return estimated total of `field` over all users."""
+        total = 0
+        for num_users, measurements in self.strata:
+            if measurements:
+                total += num_users * sum(
+                    m.get(field, 0) for m in measurements) / len(measurements)
+        return total
+
+    def _max(self, field):
+        """Return largest sampled value of `field`."""
+        return max([m.get(field, 0) for _, measurements in self.strata
+                    for m in measurements] or [0])
+
+    def _recommended_limits(self):
+        """Return limits a margin above the largest sampled user."""
+        vm_peak = self._max('vm_peak')
+        return {
+            'cpu': int(math.ceil(
+                max(self._max('cpu'), 1) * TIME_LIMIT_MARGIN)),
+            'realtime': int(math.ceil(
+                max(self._max('total'), 1) * TIME_LIMIT_MARGIN)),
+            'memory': int(vm_peak * MEMORY_LIMIT_MARGIN)
+            if vm_peak else None,
+        }
+
+    def estimate(self, num_threads=None):
+        """Return estimated cost and recommended settings.
+
+        Args:
+            num_threads (int): Number of threads for which wall time is
+                estimated, by default the recommended number of threads.
+
+        Returns:
+            dict: Estimated cost of the complete run.
+
+        """
+        num_users = self.num_users
+        per_user = dict(
+            (field, self._extrapolate(field) / num_users if num_users else 0)
+            for field in MEASURED_FIELDS)
+        per_user['sandbox'] = max(
+            per_user['total'] - per_user['parse'] - per_user['map'], 0)
+        peak_rss = self._max('max_rss')
+        # one cpu is left for the collector
+        max_threads = max(1, mp.cpu_count() - 1)
+        available_memory = _available_memory()
+        if available_memory and peak_rss:
+            max_threads = min(max_threads, available_memory // peak_rss)
+        recommended_num_threads = int(max(1, min(max_threads, num_users)))
+        num_threads = num_threads or recommended_num_threads
+        total_user_seconds = self._extrapolate('total')
+        recommended_prefetch = 0
+        if per_user['total'] and per_user['read'] >= PREFETCH_MIN_SHARE * (
+                per_user['read'] + per_user['total']):
+            # enough files to keep reading while a user is processed
+            recommended_prefetch = 1 + int(math.ceil(
+                per_user['read'] / per_user['total']))
+        return {
+            'num_users': num_users,
+            'num_sampled': sum(len(m) for _, m in self.strata),
+            'num_failed': self.num_failed,
+            'per_user_seconds': dict(
+                (field, per_user[field])
+                for field in ('sandbox', 'read', 'parse', 'map', 'total',
+                              'cpu')),
+            'cpu_seconds': self._extrapolate('cpu'),
+            'total_user_seconds': total_user_seconds,
+            'num_threads': num_threads,
+            'wall_seconds': total_user_seconds / num_threads,
+            'peak_memory_bytes': peak_rss * num_threads,
+            'result_bytes': self._extrapolate('result_bytes'),
+            'recommended_num_threads': recommended_num_threads,
+            'recommended_limits': self._recommended_limits(),
+            'recommended_prefetch': recommended_prefetch,
+            'recommended_zygote': bool(
+                per_user['total'] and
+                per_user['sandbox'] > per_user['total'] / 2),
+        }
@@ -0,0 +1,245 @@
+"""Vectorised privacy mechanisms operating on whole arrays of values.
+
+Mechanisms are `OPALPrivacy` algorithms, hence they can be used with
+`PrivacyAlgorithmRunner` like any other privacy algorithm. Keys and values
+of the result are converted to arrays once, and noise and thresholds are
+applied to the whole array. As every key is processed independently,
+`PrivacyAlgorithmRunner` may split very large results into partitions of
+keys processed in parallel.
+
+Parameters of the request override parameters given to the mechanism, e.g.
+`params['epsilon']` overrides `epsilon` of `LaplaceMechanism`.
+"""
+from __future__ import division, print_function
+import hashlib
+import math
+
+import numpy as np
+import six
+
+from opalalgorithms.core import OPALPrivacy
+
+
+__all__ = ["VectorizedPrivacy", "LaplaceMechanism", "GaussianMechanism",
+           "SuppressionMechanism", "ComposedMechanism", "salted_uniforms"]
+
+
+def salted_uniforms(keys, salt, num=1, domain=b''):
+    """Return uniform numbers in (0, 1) derived from salt and each key.
+
+    The same key and salt always give the same numbers, so that repeated
+    requests cannot average noise away. Mechanisms pass their own `domain`,
+    so that the noise of different mechanisms is independent.
+
+    Args:
+        keys (list): Keys of the result.
+        salt (str): Salt of the request.
+        num (int): Number of uniform numbers per key, at most 4.
+        domain (bytes): Separator of the mechanism using the numbers.
+
+    Returns:
+        numpy.ndarray: Array of shape `(len(keys), num)`.
+
+    """
+    salt = salt.encode('utf-8') if isinstance(
+        salt, six.text_type) else salt or b''
+    prefix = hashlib.sha256(domain).digest() + hashlib.sha256(salt).digest()
+    digests = b''.join(
+        hashlib.sha256(prefix + key.encode('utf-8')).digest()
+        for key in keys)
+    words = np.frombuffer(digests, dtype='<u8').reshape(len(keys), 4)
+    # 53 bits for an exactly representable uniform in the open interval
+    return ((words[:, :num] >> np.uint64(11)).astype(np.float64) + 0.5) / (
+        2.0 ** 53)
+
+
+class VectorizedPrivacy(OPALPrivacy):
+    """Base class of privacy mechanisms operating on arrays.
+
+    Subclasses implement `apply`, which takes keys and values of a result or
+    of a partition of it.
+
+    """
+
+    def __call__(self, params, result, salt):
+        """Apply mechanism to a result.
+
+        Args:
+            params (dict): Parameters of the request.
+            result (dict): Result with string keys and number values.
+            salt (str): Salt of the request.
+
+        Returns:
+            dict: Private result.
+
+        Raises:
+            ValueError: If the result does not map strings to numbers.
+
+        """
+        from .privacyrunner import invalid_result_reason
+
+        reason = invalid_result_reason(result)
+        if reason is not None:
+            raise ValueError('Invalid result: {}'.format(reason))
+        keys = list(result)
+        values = np.fromiter(
+            (result[key] for key in keys), dtype=np.float64, count=len(keys))
+        keys, values = self.apply(params, keys, values, salt)
+        return dict(zip(keys, values.tolist()))
+
+    def apply(self, params, keys, values, salt, seed=None):
+        """Apply mechanism to arrays of keys and values.
+
+        Args:
+            params (dict): Parameters of the request.
+            keys (list): Keys of the result.
+            values (numpy.ndarray): Values of each key.
+            salt (str): Salt of the request.
+            seed (int): Seed of random noise, None for fresh randomness.
+
+        Returns:
+            tuple: Keys and values after applying the mechanism.
+
+        """
+        raise NotImplementedError
+
+
+class _NoiseMechanism(VectorizedPrivacy):
+    """Add noise to every value, random or derived from the salt."""
+
+    # separates salted noise of each mechanism, see `salted_uniforms`
+    domain = b''
+
+    def __init__(self, salted=False):
+        """Initialize mechanism."""
+        super(_NoiseMechanism, self).__init__()
+        self.salted = salted
+
+    def apply(self, params, keys, values, salt, seed=None):
+        """Add noise to values, see `VectorizedPrivacy.apply`."""
+        if params.get('salted', self.salted):
+            noise = self._salted_noise(params, keys, salt)
+        else:
+            noise = self._random_noise(
+                params, len(keys), np.random.RandomState(seed))
+        return keys, values + noise
+
+
+class LaplaceMechanism(_NoiseMechanism):
+    """Add Laplace noise of scale `sensitivity / epsilon`.
+
+    Args:
+        epsilon (float): Privacy budget.
+        sensitivity (float): Sensitivity of each value.
+        salted (bool): Derive noise of each key deterministically from the
+            salt instead of drawing it at random.
+
+    """
+
+    domain = b'opalalgorithms.LaplaceMechanism'
+
+    def __init__(self, epsilon=1.0, sensitivity=1.0, salted=False):
+        """Initialize mechanism."""
+        super(LaplaceMechanism, self).__init__(salted)
+        self.epsilon = epsilon
+        self.sensitivity = sensitivity
+
+    def _scale(self, params):
+        return (params.get('sensitivity', self.sensitivity) /
+                params.get('epsilon', self.epsilon))
+
+    def _random_noise(self, params, size, rng):
+        return rng.laplace(0.0, self._scale(params), size)
+
+    def _salted_noise(self, params, keys, salt):
+        uniforms = salted_uniforms(keys, salt, domain=self.domain)
+        centered = uniforms[:, 0] - 0.5
+        # inverse of the cumulative distribution function
+        return -self._scale(params) * np.sign(centered) * np.log1p(
+            -2 * np.abs(centered))
+
+
+class GaussianMechanism(_NoiseMechanism):
+    """Add Gaussian noise calibrated to (`epsilon`, `delta`) privacy.
+
+    Args:
+        epsilon (float): Privacy budget.
+        delta (float): Probability of exceeding the privacy budget.
+        sensitivity (float): L2 sensitivity of the values.
+        salted (bool): Derive noise of each key deterministically from the
+            salt instead of drawing it at random.
+
+    """
+
+    domain = b'opalalgorithms.GaussianMechanism'
+
+    def __init__(self, epsilon=1.0, delta=1e-5, sensitivity=1.0,
+                 salted=False):
+        """Initialize mechanism."""
+        super(GaussianMechanism, self).__init__(salted)
+        self.epsilon = epsilon
+        self.delta = delta
+        self.sensitivity = sensitivity
+
+    def _sigma(self, params):
+        return (params.get('sensitivity', self.sensitivity) * math.sqrt(
+            2 * math.log(1.25 / params.get('delta', self.delta))) /
+            params.get('epsilon', self.epsilon))
+
+    def _random_noise(self, params, size, rng):
+        return rng.normal(0.0, self._sigma(params), size)
+
+    def _salted_noise(self, params, keys, salt):
+        uniforms = salted_uniforms(keys, salt, num=2, domain=self.domain)
+        # Box-Muller transform
+        return self._sigma(params) * np.sqrt(
+            -2 * np.log(uniforms[:, 0])) * np.cos(2 * np.pi * uniforms[:, 1])
+
+
+class SuppressionMechanism(VectorizedPrivacy):
+    """Remove keys whose value is below a threshold.
+
+    Args:
+        threshold (float): Keys with smaller values are removed, e.g. counts
+            of fewer users than `threshold`.
+
+    """
+
+    def __init__(self, threshold=10):
+        """Initialize mechanism."""
+        super(SuppressionMechanism, self).__init__()
+        self.threshold = threshold
+
+    def apply(self, params, keys, values, salt, seed=None):
+        """Remove small values, see `VectorizedPrivacy.apply`."""
+        kept = np.flatnonzero(
+            values >= params.get('threshold', self.threshold))
+        return [keys[i] for i in kept], values[kept]
+
+
+class ComposedMechanism(VectorizedPrivacy):
+    """Apply several mechanisms one after another.
+
+    The following adds salted Laplace noise and then suppresses small
+    noisy counts::
+
+        ComposedMechanism([LaplaceMechanism(0.5, salted=True),
+                           SuppressionMechanism(10)])
+
+    Args:
+        mechanisms (list): Vectorised mechanisms in order of application.
+
+    """
+
+    def __init__(self, mechanisms):
+        """Initialize mechanism."""
+        super(ComposedMechanism, self).__init__()
+        self.mechanisms = mechanisms
+
+    def apply(self, params, keys, values, salt, seed=None):
+        """Apply every mechanism, see `VectorizedPrivacy.apply`."""
+        for i, mechanism in enumerate(self.mechanisms):
+            keys, values = mechanism.apply(
+                params, keys, values, salt,
+                None if seed is None else seed + i)
+        return keys, values
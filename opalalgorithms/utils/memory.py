@@ -0,0 +1,60 @@
+"""Resident memory of worker processes during long running jobs."""
+from __future__ import division, print_function
+import os
+import resource
+import sys
+
+
+__all__ = ["MemoryUsage", "current_rss"]
+
+
+def current_rss():
+    """Return resident set size of this process in bytes.
+
+    Read from `/proc/self/statm` where available, otherwise the peak
+    resident set size is returned.
+
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class MemoryUsage(object):
+    """Samples of resident memory of a worker process.
+
+    Args:
+        name (str): Name of the worker, e.g. `mapper` or `collector`.
+
+    Attributes:
+        pid (int): Process id of the worker.
+        peak (int): Largest sampled resident set size in bytes.
+        num_samples (int): Number of samples.
+
+    """
+
+    def __init__(self, name):
+        """Initialize usage of the current process."""
+        self.name = name
+        self.pid = os.getpid()
+        self.peak = 0
+        self.num_samples = 0
+        self._total = 0
+
+    def sample(self):
+        """Sample resident memory and return it in bytes."""
+        rss = current_rss()
+        self.peak = max(self.peak, rss)
+        self.num_samples += 1
+        self._total += rss
+        return rss
+
+    @property
+    def mean(self):
+        """Return mean sampled resident set size in bytes."""
+        return self._total / self.num_samples if self.num_samples else 0
@@ -0,0 +1,158 @@
+"""Online aggregation of results with confidence intervals.
+
+Users are processed in random order, hence the users processed so far are a
+simple random sample without replacement of all users. The total of each key
+over all users is estimated as `N * mean` of the values of the processed
+users, where users without the key count as 0, with a confidence interval
+from the normal approximation with finite population correction.
+"""
+from __future__ import division, print_function
+import math
+import time
+
+import six
+
+
+__all__ = ["OnlineAggregator", "normal_quantile"]
+
+
+def normal_quantile(confidence):
+    """Return z such that P(-z < Z < z) = `confidence` for standard normal Z.
+
+    Args:
+        confidence (float): Confidence level between 0 and 1.
+
+    Returns:
+        float: Quantile of the standard normal distribution.
+
+    """
+    low, high = 0.0, 40.0
+    for _ in range(100):
+        mid = (low + high) / 2
+        if math.erf(mid / math.sqrt(2)) < confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
+
+
+class OnlineAggregator(object):
+    """Estimate totals of each key from the users processed so far.
+
+    Args:
+        population (int): Number of users of the complete run.
+        confidence (float): Confidence level of the intervals.
+        relative_error (float): Stop once the half width of the confidence
+            interval of every key is within this fraction of its estimate,
+            None to not stop on error.
+        time_budget (float): Stop once this many seconds have elapsed, None
+            for no budget.
+        min_users (int): Minimum number of users before stopping on error.
+
+    Attributes:
+        num_users (int): Number of users processed so far.
+        stopped_early (bool): Whether the run stopped before all users were
+            processed.
+
+    """
+
+    def __init__(self, population, confidence=0.95, relative_error=0.05,
+                 time_budget=None, min_users=30):
+        """Initialize aggregator."""
+        self.population = population
+        self.confidence = confidence
+        self.relative_error = relative_error
+        self.time_budget = time_budget
+        self.min_users = min_users
+        self.num_users = 0
+        self.stopped_early = False
+        self.start_time = time.time()
+        self.end_time = None
+        self._z = normal_quantile(confidence)
+        self._sums = {}
+        self._squares = {}
+
+    def update(self, result):
+        """Add the scaled result of a processed user.
+
+        Args:
+            result (dict): Scaled result of the user, None if the user has no
+                valid result, which counts as 0 for every key.
+
+        """
+        self.num_users += 1
+        for key, val in six.iteritems(result or {}):
+            self._sums[key] = self._sums.get(key, 0) + val
+            self._squares[key] = self._squares.get(key, 0) + val * val
+
+    def estimates(self):
+        """Return current estimates of the total of each key.
+
+        Returns:
+            dict: Dictionary with key as result key and value as dictionary
+            with `estimate`, `low` and `high` ends of the confidence interval
+            and `relative_error`, the half width relative to the estimate,
+            None if the estimate is 0.
+
+        """
+        num = self.num_users
+        if not num:
+            return {}
+        # finite population correction, 0 once every user is processed
+        correction = max(1 - num / self.population, 0)
+        estimates = {}
+        for key, total in six.iteritems(self._sums):
+            mean = total / num
+            variance = 0.0
+            if num > 1:
+                variance = max(
+                    self._squares[key] - num * mean * mean, 0) / (num - 1)
+            half_width = self._z * self.population * math.sqrt(
+                correction * variance / num)
+            estimate = self.population * mean
+            estimates[key] = {
+                'estimate': estimate,
+                'low': estimate - half_width,
+                'high': estimate + half_width,
+                'relative_error': (half_width / abs(estimate)
+                                   if estimate else None),
+            }
+        return estimates
+
+    def max_relative_error(self):
+        """Return largest relative error over all keys."""
+        errors = [stats['relative_error']
+                  for stats in six.itervalues(self.estimates())]
+        return max([float('inf') if error is None else error
+                    for error in errors] or [0.0])
+
+    def elapsed(self):
+        """Return seconds elapsed since the aggregator was created."""
+        return (self.end_time or time.time()) - self.start_time
+
+    def finish(self, stopped_early=False):
+        """Mark the run as finished."""
+        self.stopped_early = stopped_early
+        self.end_time = time.time()
+
+    def should_stop(self):
+        """Check if the error target or the time budget has been reached."""
+        if self.num_users >= self.population:
+            return False
+        if (self.time_budget is not None and
+                self.elapsed() >= self.time_budget):
+            return True
+        return (self.relative_error is not None and
+                self.num_users >= self.min_users and
+                self.max_relative_error() <= self.relative_error)
+
+    def summary(self):
+        """Return JSON serializable summary of the current estimates."""
+        return {
+            'num_users': self.num_users,
+            'population': self.population,
+            'confidence': self.confidence,
+            'stopped_early': self.stopped_early,
+            'elapsed': self.elapsed(),
+            'estimates': self.estimates(),
+        }
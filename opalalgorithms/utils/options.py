@@ -0,0 +1,187 @@
+"""Groups of options of `opalalgorithms.utils.AlgorithmRunner`.
+
+Each group of related options is passed to the runner as a single object,
+e.g.::
+
+    AlgorithmRunner(
+        algorithm, limits=Limits(cpu=5, memory=2 ** 30),
+        staging=StagingOptions('link', prefetch=4),
+        recycling=RecyclingOptions(max_users=1000))
+
+Options are validated when the object is created.
+"""
+from __future__ import division, print_function
+
+from .userindex import LOCATION_FIELDS
+
+
+__all__ = ["Limits", "ProfileOptions", "RecyclingOptions", "StagingOptions",
+           "UserSelection", "ZygoteOptions"]
+
+STAGING_METHODS = ('copy', 'link')
+
+
+class Limits(object):
+    """Limits of the sandbox of each user.
+
+    Users exceeding a limit are skipped and reported.
+
+    Args:
+        cpu (int): CPU seconds allowed to the sandbox of each user.
+        realtime (int): Wall clock seconds allowed to the sandbox of each
+            user, None for no limit.
+        memory (int): Bytes of virtual memory allowed to the sandbox of each
+            user, None for no limit.
+
+    """
+
+    def __init__(self, cpu=15, realtime=None, memory=None):
+        """Initialize limits."""
+        self.cpu = cpu
+        self.realtime = realtime
+        self.memory = memory
+
+    def as_codejail(self):
+        """Return limits with the names of codejail."""
+        return {'CPU': self.cpu, 'REALTIME': self.realtime,
+                'VMEM': self.memory}
+
+
+class ZygoteOptions(object):
+    """Run users in forked children of a zygote, see `ZygoteJail`.
+
+    A single sandboxed zygote is started per process, with bandicoot and
+    the modules of the algorithm preloaded, and a child is forked from it
+    for every user instead of starting a new sandbox.
+
+    Args:
+        warm (bool): Keep the zygote of each process running after the job,
+            and load later jobs into it, see
+            `opalalgorithms.utils.zygote.get_zygote`. Only useful with a warm
+            `pool` and a `manager` reused between jobs, or without
+            `multiprocess`.
+
+    """
+
+    def __init__(self, warm=False):
+        """Initialize zygote options."""
+        self.warm = warm
+
+
+class ProfileOptions(object):
+    """Profile parsing and `map` of a sample of users inside the sandbox.
+
+    Only available in `dev_mode` and without zygote.
+
+    Args:
+        sample (float): Fraction of users profiled with cProfile.
+        memory (bool): Also profile memory with tracemalloc.
+
+    """
+
+    def __init__(self, sample=0.1, memory=False):
+        """Initialize profiling options."""
+        if not 0 < sample <= 1:
+            raise ValueError('Sample of profiled users must be in (0, 1]')
+        self.sample = sample
+        self.memory = memory
+
+
+class StagingOptions(object):
+    """How user files are brought to the sandbox.
+
+    Args:
+        method (str): `copy` to let codejail copy every file, or `link` to
+            expose files through hard links in a staging directory of each
+            process, without writing their data. Files which cannot be
+            linked are copied.
+        prefetch (int): Number of upcoming files each mapper reads ahead
+            while the current user is processed, 0 for no read-ahead.
+        prefetch_bytes (int): Maximum total size of files read ahead by each
+            mapper.
+        prefetch_threads (int): Number of threads reading ahead in each
+            mapper, 0 to use `posix_fadvise` read-ahead where available.
+
+    """
+
+    def __init__(self, method='copy', prefetch=0,
+                 prefetch_bytes=64 * 2 ** 20, prefetch_threads=0):
+        """Initialize staging options."""
+        if method not in STAGING_METHODS:
+            raise ValueError('Unknown staging {!r}'.format(method))
+        self.method = method
+        self.prefetch = prefetch
+        self.prefetch_bytes = prefetch_bytes
+        self.prefetch_threads = prefetch_threads
+
+    def prefetch_config(self):
+        """Return keyword arguments of `FilePrefetcher`, None if disabled."""
+        if not self.prefetch:
+            return None
+        return {'window': self.prefetch, 'max_bytes': self.prefetch_bytes,
+                'num_threads': self.prefetch_threads}
+
+
+class UserSelection(object):
+    """Restrict a run to users in a time window or in locations.
+
+    Users are selected with indexes of
+    `opalalgorithms.utils.userindex`.
+
+    Args:
+        time_window (tuple): `(start, end)` datetimes as strings of the form
+            '%Y-%m-%d %H:%M:%S', inclusive. Only users with records in the
+            window are run, and only their records in the window are
+            staged for the sandbox.
+        time_index (str): Path where the time index of the data is stored
+            and incrementally updated between runs, None to scan all users
+            on every run.
+        locations (dict): Values of `location_level_1`, `location_level_2`
+            or `antenna_id` to which the run is restricted, e.g.
+            `{'location_level_1': ['Maharashtra']}`. Only users with one of
+            the values of every given field are run, on all their records.
+        location_index (str): Directory where the location index of the
+            data is stored and incrementally updated between runs, None to
+            scan all users on every run.
+
+    """
+
+    def __init__(self, time_window=None, time_index=None, locations=None,
+                 location_index=None):
+        """Initialize user selection."""
+        if time_window is not None:
+            start, end = time_window
+            if start > end:
+                raise ValueError('Time window ends before it starts')
+            time_window = (start, end)
+        if locations is not None:
+            unknown = set(locations) - set(LOCATION_FIELDS)
+            if unknown:
+                raise ValueError('Locations of unknown fields {}'.format(
+                    ', '.join(sorted(unknown))))
+        self.time_window = time_window
+        self.time_index = time_index
+        self.locations = locations
+        self.location_index = location_index
+
+
+class RecyclingOptions(object):
+    """Replace mappers by fresh ones during long running jobs.
+
+    Args:
+        max_users (int): Number of users after which a mapper is replaced
+            by a fresh one, None to keep mappers for the whole run.
+        max_rss (int): Resident memory in bytes above which a mapper is
+            replaced after its current user, and the collector warns, None
+            for no limit. Files a replaced mapper has taken from the queue
+            but not processed are put back. Processes of a pool created by
+            the runner are then replaced too. Processes of a warm `pool` are
+            kept, hence replacing their mappers would not release memory,
+            and with a warm pool only the collector warns.
+
+    """
+
+    def __init__(self, max_users=None, max_rss=None):
+        """Initialize recycling options."""
+        self.max_users = max_users
+        self.max_rss = max_rss
@@ -0,0 +1,133 @@
+"""Read-ahead of user files which are going to be processed next."""
+from __future__ import division, print_function
+import collections
+import os
+import threading
+
+from six.moves import queue
+
+
+__all__ = ["FilePrefetcher", "iter_file_queue"]
+
+
+class FilePrefetcher(object):
+    """Warm the page cache with files before they are processed.
+
+    Files are prefetched either with `posix_fadvise(POSIX_FADV_WILLNEED)`,
+    which lets the kernel read ahead asynchronously, or by reader threads
+    which read the files in chunks. Reader threads are useful on network
+    storage where read-ahead advice may be ignored. The window of prefetched
+    but not yet processed files is bounded by number of files and bytes.
+
+    Args:
+        window (int): Maximum number of files prefetched ahead.
+        max_bytes (int): Maximum total size of files prefetched ahead, a
+            single file larger than `max_bytes` is still prefetched.
+        num_threads (int): Number of reader threads, 0 to use
+            `posix_fadvise` if available.
+        chunk_size (int): Bytes read at once by a reader thread.
+
+    """
+
+    def __init__(self, window=4, max_bytes=64 * 2 ** 20, num_threads=0,
+                 chunk_size=2 ** 20):
+        """Initialize prefetcher."""
+        self.window = window
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.num_files = 0
+        self.num_bytes = 0
+        self._sizes = {}
+        self._use_fadvise = num_threads == 0 and hasattr(os, 'posix_fadvise')
+        self._paths = queue.Queue()
+        self._threads = []
+        if not self._use_fadvise:
+            for _ in range(max(num_threads, 1)):
+                thread = threading.Thread(target=self._read_files)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def has_room(self):
+        """Check if another file can be prefetched within the window."""
+        return self.num_files < self.window and (
+            self.num_files == 0 or self.num_bytes < self.max_bytes)
+
+    def prefetch(self, path):
+        """Start prefetching file at `path`."""
+        size = os.path.getsize(path)
+        self._sizes[path] = size
+        self.num_files += 1
+        self.num_bytes += size
+        if self._use_fadvise:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        else:
+            self._paths.put(path)
+
+    def release(self, path):
+        """Remove file at `path` from the window once it is processed."""
+        self.num_files -= 1
+        self.num_bytes -= self._sizes.pop(path)
+
+    def _read_files(self):
+        while True:
+            path = self._paths.get()
+            if path is None:
+                return
+            try:
+                with open(path, 'rb') as user_file:
+                    while user_file.read(self.chunk_size):
+                        pass
+            except (IOError, OSError):
+                pass  # the mapper reports errors when processing the file
+
+    def close(self):
+        """Stop reader threads."""
+        for _ in self._threads:
+            self._paths.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+def iter_file_queue(file_queue, prefetcher=None, pending=None):
+    """Yield items of the file queue, prefetching the upcoming files.
+
+    Args:
+        file_queue (mp.manager.Queue): Queue of `(filepath, scaler)`.
+        prefetcher (FilePrefetcher): Prefetcher of upcoming files, if None
+            items are taken from the queue one at a time.
+        pending (collections.deque): Deque holding items taken from the
+            queue for prefetching but not yet yielded, so that a consumer
+            stopping early can put them back.
+
+    Yields:
+        tuple: `(filepath, scaler)` of the next file to be processed.
+
+    """
+    if pending is None:
+        pending = collections.deque()
+    while True:
+        while prefetcher is not None and prefetcher.has_room():
+            try:
+                item = file_queue.get_nowait()
+            except queue.Empty:
+                break
+            prefetcher.prefetch(item[0])
+            pending.append(item)
+        if pending:
+            item = pending.popleft()
+            prefetcher.release(item[0])
+        else:
+            if file_queue.empty():
+                return
+            try:
+                item = file_queue.get(timeout=1)
+            except Exception as exc:
+                print(exc)
+                return
+        yield item
@@ -1,4 +1,41 @@
 """Privacy algorithm runner."""
+from __future__ import division, print_function
+import multiprocessing as mp
+import numbers
+import warnings
+
+import numpy as np
+import six
+
+from .mechanisms import VectorizedPrivacy
+
+
+def _apply_partition(task):
+    """Apply vectorised mechanism to a partition of keys."""
+    algorithm, params, keys, values, salt, seed = task
+    return algorithm.apply(params, keys, values, salt, seed)
+
+
+def invalid_result_reason(result):
+    """Return why a result can not be made private, None if it is valid.
+
+    Valid results map string keys to real numbers, including numpy scalars.
+
+    Args:
+        result: Result of an algorithm or of a privacy algorithm.
+
+    Returns:
+        str: Reason for which the result is invalid, or None.
+
+    """
+    if not isinstance(result, dict):
+        return 'result is a {}, not a dict'.format(type(result).__name__)
+    for key, val in six.iteritems(result):
+        if not isinstance(key, six.string_types):
+            return 'key {!r} is not a string'.format(key)
+        if isinstance(val, bool) or not isinstance(val, numbers.Real):
+            return 'value {!r} of key {!r} is not a number'.format(val, key)
+    return None
 
 
 class PrivacyAlgorithmRunner(object):
@@ -8,17 +45,35 @@ class PrivacyAlgorithmRunner(object):
         algorithm (opalalgorithms.core.OPALPrivacy): OPALPrivacy object
         params (dict): Dictionary of parameters
         salt (string): Salt for the algorithm
+        num_partitions (int): Number of partitions of keys which vectorised
+            mechanisms, see `opalalgorithms.utils.mechanisms`, process
+            separately.
+        num_threads (int): Number of processes applying a vectorised
+            mechanism to partitions in parallel.
+        seed (int): Seed of random noise of vectorised mechanisms, None for
+            fresh randomness.
+        pool (multiprocessing.Pool): Warm pool of worker processes applying
+            partitions, by default a pool of `num_threads` processes is
+            started on the first call with several partitions and reused by
+            later calls until `close`.
 
     Notes:
         To use the class, initialize and then call the instance with the
-        result object.
+        result object. Results which are not dicts of string keys and
+        numbers are rejected with a `RuntimeWarning` and an empty result.
     """
 
-    def __init__(self, algorithm, params, salt):
+    def __init__(self, algorithm, params, salt, num_partitions=1,
+                 num_threads=1, seed=None, pool=None):
         """Initialize the algorithm runner."""
         self.algorithm = algorithm
         self.params = params
         self.salt = salt
+        self.num_partitions = num_partitions
+        self.num_threads = num_threads
+        self.seed = seed
+        self.pool = pool
+        self._own_pool = False
 
     def __call__(self, result):
         """Run the algorithm, check if result is valid and return.
@@ -29,10 +84,64 @@ class PrivacyAlgorithmRunner(object):
         Return:
             dict: Privacy ensured dictionary
         """
+        if self._is_vectorized():
+            if not self._validate_result(result, 'input'):
+                return {}
+            # built from arrays of numbers, hence always valid
+            return self._apply_vectorized(result)
         result = self.algorithm(self.params, result, self.salt)
         if self._validate_result(result):
-            return result
+            return dict((key, val.item() if isinstance(val, np.generic)
+                         else val) for key, val in six.iteritems(result))
         return {}
 
-    def _validate_result(self, result):
-        return isinstance(result, dict)
+    def close(self):
+        """Stop the pool started by the runner, if any."""
+        if self._own_pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+            self._own_pool = False
+
+    def _is_vectorized(self):
+        """Whether the algorithm is a mechanism applied on arrays.
+
+        Mechanisms overriding `__call__` are run through `__call__` like
+        other privacy algorithms.
+
+        """
+        return isinstance(self.algorithm, VectorizedPrivacy) and \
+            type(self.algorithm).__call__ is VectorizedPrivacy.__call__
+
+    def _get_pool(self):
+        if self.pool is None:
+            self.pool = mp.Pool(processes=self.num_threads)
+            self._own_pool = True
+        return self.pool
+
+    def _apply_vectorized(self, result):
+        keys = list(result)
+        values = np.fromiter(
+            (result[key] for key in keys), dtype=np.float64, count=len(keys))
+        num_partitions = max(1, min(self.num_partitions, len(keys)))
+        bounds = np.linspace(0, len(keys), num_partitions + 1).astype(int)
+        tasks = [
+            (self.algorithm, self.params, keys[start:end],
+             values[start:end], self.salt,
+             None if self.seed is None else self.seed + i)
+            for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))]
+        if self.num_threads > 1 and len(tasks) > 1:
+            outputs = self._get_pool().map(_apply_partition, tasks)
+        else:
+            outputs = [_apply_partition(task) for task in tasks]
+        private_result = {}
+        for keys, values in outputs:
+            private_result.update(zip(keys, values.tolist()))
+        return private_result
+
+    def _validate_result(self, result, stage='output'):
+        reason = invalid_result_reason(result)
+        if reason is not None:
+            warnings.warn('Rejected {} of privacy algorithm {}: {}'.format(
+                stage, type(self.algorithm).__name__, reason), RuntimeWarning)
+        return reason is None
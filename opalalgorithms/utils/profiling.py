@@ -0,0 +1,110 @@
+"""Aggregate profiles of algorithms collected inside the sandbox."""
+from __future__ import division, print_function
+import zlib
+
+import six
+
+
+__all__ = ["ProfileReport", "should_profile"]
+
+
+def should_profile(username, sample):
+    """Check if user belongs to the sample of profiled users.
+
+    The decision depends only on the username, so that mappers pick the
+    same users without any coordination.
+
+    Args:
+        username (str): Name of the user.
+        sample (float): Fraction of users to be profiled.
+
+    Returns:
+        bool: Whether the user must be profiled.
+
+    """
+    user_hash = zlib.crc32(username.encode('utf-8')) & 0xffffffff
+    return user_hash / 2 ** 32 < sample
+
+
+class ProfileReport(object):
+    """Profile of an algorithm aggregated across users.
+
+    Statistics returned by `process_user_csv` with profiling on are added to
+    the report. `cprofile` rows are `[filename, line, function, primitive
+    calls, total calls, total time, cumulative time]` and `tracemalloc` rows
+    are `[filename, line, size, count]`.
+
+    """
+
+    def __init__(self):
+        """Initialize report."""
+        self.num_users = 0
+        self.functions = {}
+        self.allocations = {}
+        self.peak_memory = 0
+
+    def add(self, stats):
+        """Add statistics of a single user.
+
+        Args:
+            stats (dict): Statistics measured inside the sandbox.
+
+        """
+        self.num_users += 1
+        for row in stats.get('cprofile', []):
+            self._add_function(tuple(row[:3]), row[3:])
+        for row in stats.get('tracemalloc', []):
+            self._add_allocation(tuple(row[:2]), row[2:])
+        self.peak_memory = max(
+            self.peak_memory, stats.get('tracemalloc_peak', 0))
+
+    def _add_function(self, function, timings):
+        totals = self.functions.setdefault(function, [0, 0, 0, 0])
+        for i, value in enumerate(timings):
+            totals[i] += value
+
+    def _add_allocation(self, line, sizes):
+        totals = self.allocations.setdefault(line, [0, 0])
+        for i, value in enumerate(sizes):
+            totals[i] += value
+
+    def merge(self, other):
+        """Merge report of another mapper into this report."""
+        self.num_users += other.num_users
+        for function, timings in six.iteritems(other.functions):
+            self._add_function(function, timings)
+        for line, sizes in six.iteritems(other.allocations):
+            self._add_allocation(line, sizes)
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+
+    def format(self, top=20):
+        """Return human readable report of the hot spots.
+
+        Args:
+            top (int): Number of functions and lines to be shown.
+
+        Returns:
+            str: Functions sorted by cumulative time and lines sorted by
+            allocated memory.
+
+        """
+        lines = ['Profiled users: {}'.format(self.num_users)]
+        if self.functions:
+            lines.append('{:>10} {:>10} {:>10}  {}'.format(
+                'ncalls', 'tottime', 'cumtime', 'filename:lineno(function)'))
+            for function, timings in sorted(
+                    six.iteritems(self.functions),
+                    key=lambda x: x[1][3], reverse=True)[:top]:
+                lines.append('{:>10} {:>10.4f} {:>10.4f}  {}:{}({})'.format(
+                    timings[1], timings[2], timings[3], *function))
+        if self.allocations:
+            lines.append('Peak traced memory: {} bytes'.format(
+                self.peak_memory))
+            lines.append('{:>12} {:>10}  {}'.format(
+                'size', 'count', 'filename:lineno'))
+            for line, sizes in sorted(
+                    six.iteritems(self.allocations),
+                    key=lambda x: x[1][0], reverse=True)[:top]:
+                lines.append('{:>12} {:>10}  {}:{}'.format(
+                    sizes[0], sizes[1], *line))
+        return '\n'.join(lines)
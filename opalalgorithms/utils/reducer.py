@@ -0,0 +1,323 @@
+"""Memory bounded streaming reducers for results of algorithms.
+
+Results emitted by ``map`` are reduced per key to sum, count, mean, median
+and mode. Sum, count and mean are exact. Median (and any other quantile) is
+approximated with a KLL quantile sketch and mode with a Misra-Gries
+frequent items summary, so memory per key is bounded irrespective of the
+number of users. All states can be merged, which allows partial reductions
+from different workers or different runs to be combined.
+"""
+from __future__ import division, print_function
+import math
+import random
+
+import six
+
+
+__all__ = ["QuantileSketch", "FrequentItems", "KeyStatistics",
+           "StreamingReducer"]
+
+
+class QuantileSketch(object):
+    """Mergeable KLL sketch for approximate quantiles.
+
+    Args:
+        k (int): Capacity of the top compactor. Rank error is roughly
+            ``1.7 / k`` and memory is ``O(k)``.
+        seed (int): Seed for the random coin used while compacting.
+
+    """
+
+    def __init__(self, k=200, seed=None):
+        """Initialize the sketch."""
+        self.k = k
+        self.n = 0
+        self.compactors = [[]]
+        self._rng = random.Random(seed)
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * (2 / 3) ** depth)) + 1
+
+    def _grow(self):
+        self.compactors.append([])
+        self._max_size = sum(
+            self._capacity(h) for h in range(len(self.compactors)))
+
+    def _size(self):
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def _compress(self):
+        while self._size() >= self._max_size:
+            for height, compactor in enumerate(self.compactors):
+                if len(compactor) < self._capacity(height):
+                    continue
+                if height + 1 >= len(self.compactors):
+                    self._grow()
+                compactor.sort()
+                keep = [compactor.pop()] if len(compactor) % 2 else []
+                offset = int(self._rng.random() < 0.5)
+                self.compactors[height + 1].extend(compactor[offset::2])
+                self.compactors[height] = keep
+                break
+
+    def update(self, value):
+        """Add a value to the sketch."""
+        self.compactors[0].append(value)
+        self.n += 1
+        if self._size() >= self._max_size:
+            self._compress()
+
+    def merge(self, other):
+        """Merge another sketch into this sketch.
+
+        Args:
+            other (QuantileSketch): Sketch to be merged.
+
+        """
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.n += other.n
+        self._compress()
+
+    def quantile(self, q):
+        """Return approximate value at quantile `q`.
+
+        Args:
+            q (float): Quantile between 0 and 1.
+
+        Returns:
+            float: Approximate quantile, None if sketch is empty.
+
+        """
+        items = sorted(
+            (value, 2 ** height)
+            for height, compactor in enumerate(self.compactors)
+            for value in compactor)
+        if not items:
+            return None
+        total = sum(weight for _, weight in items)
+        cumulative = 0
+        for value, weight in items:
+            cumulative += weight
+            if cumulative >= q * total:
+                return value
+        return items[-1][0]
+
+    def to_dict(self):
+        """Return a JSON serializable state of the sketch."""
+        return {'k': self.k, 'n': self.n,
+                'compactors': [list(c) for c in self.compactors]}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Create sketch from the state returned by `to_dict`."""
+        sketch = cls(k=state['k'])
+        sketch.n = state['n']
+        sketch.compactors = [list(c) for c in state['compactors']]
+        sketch._max_size = sum(
+            sketch._capacity(h) for h in range(len(sketch.compactors)))
+        return sketch
+
+
+class FrequentItems(object):
+    """Mergeable Misra-Gries summary for heavy hitters.
+
+    Any item with frequency above ``n / (k + 1)`` is guaranteed to be kept,
+    and counts are underestimated by at most ``n / (k + 1)``.
+
+    Args:
+        k (int): Maximum number of counters kept.
+
+    """
+
+    def __init__(self, k=64):
+        """Initialize the summary."""
+        self.k = k
+        self.counters = {}
+
+    def update(self, item, count=1):
+        """Add `count` occurrences of `item`."""
+        self.counters[item] = self.counters.get(item, 0) + count
+        if len(self.counters) > self.k:
+            self._prune()
+
+    def _prune(self):
+        counts = sorted(six.itervalues(self.counters), reverse=True)
+        threshold = counts[self.k]
+        self.counters = dict(
+            (item, count - threshold)
+            for item, count in six.iteritems(self.counters)
+            if count > threshold)
+
+    def merge(self, other):
+        """Merge another summary into this summary.
+
+        Args:
+            other (FrequentItems): Summary to be merged.
+
+        """
+        for item, count in six.iteritems(other.counters):
+            self.counters[item] = self.counters.get(item, 0) + count
+        if len(self.counters) > self.k:
+            self._prune()
+
+    def most_common(self, num=1):
+        """Return `num` most frequent items with their estimated counts."""
+        return sorted(six.iteritems(self.counters),
+                      key=lambda x: (-x[1], x[0]))[:num]
+
+    def mode(self):
+        """Return approximate mode, None if summary is empty."""
+        most_common = self.most_common(1)
+        return most_common[0][0] if most_common else None
+
+    def to_dict(self):
+        """Return a JSON serializable state of the summary."""
+        return {'k': self.k, 'counters': [
+            [item, count] for item, count in six.iteritems(self.counters)]}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Create summary from the state returned by `to_dict`."""
+        summary = cls(k=state['k'])
+        summary.counters = dict(
+            (item, count) for item, count in state['counters'])
+        return summary
+
+
+class KeyStatistics(object):
+    """Statistics of the values belonging to a single key.
+
+    Args:
+        sketch_size (int): Size of the quantile sketch.
+        num_frequent (int): Number of counters for frequent items.
+
+    """
+
+    def __init__(self, sketch_size=200, num_frequent=64):
+        """Initialize statistics."""
+        self.count = 0
+        self.sum = 0
+        self.quantiles = QuantileSketch(k=sketch_size)
+        self.frequent = FrequentItems(k=num_frequent)
+
+    def update(self, value):
+        """Add a value."""
+        self.count += 1
+        self.sum += value
+        self.quantiles.update(value)
+        self.frequent.update(value)
+
+    def merge(self, other):
+        """Merge statistics of the same key from another reducer."""
+        self.count += other.count
+        self.sum += other.sum
+        self.quantiles.merge(other.quantiles)
+        self.frequent.merge(other.frequent)
+
+    def summary(self):
+        """Return sum, count, mean, median and mode as a dict."""
+        return {
+            'sum': self.sum,
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'median': self.quantiles.quantile(0.5),
+            'mode': self.frequent.mode(),
+        }
+
+    def to_dict(self):
+        """Return a JSON serializable state of the statistics."""
+        return {'count': self.count, 'sum': self.sum,
+                'quantiles': self.quantiles.to_dict(),
+                'frequent': self.frequent.to_dict()}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Create statistics from the state returned by `to_dict`."""
+        stats = cls()
+        stats.count = state['count']
+        stats.sum = state['sum']
+        stats.quantiles = QuantileSketch.from_dict(state['quantiles'])
+        stats.frequent = FrequentItems.from_dict(state['frequent'])
+        return stats
+
+
+class StreamingReducer(object):
+    """Reduce results to sum, count, mean, median and mode of each key.
+
+    The reducer can be used in the following way::
+
+        reducer = StreamingReducer()
+        for result in results:
+            reducer(result)
+        reducer.merge(other_reducer)
+        summary = reducer.summary()
+
+    Args:
+        sketch_size (int): Size of the quantile sketch used for each key.
+        num_frequent (int): Number of counters used for mode of each key.
+
+    """
+
+    def __init__(self, sketch_size=200, num_frequent=64):
+        """Initialize reducer."""
+        self.sketch_size = sketch_size
+        self.num_frequent = num_frequent
+        self.keys = {}
+
+    def _get(self, key):
+        if key not in self.keys:
+            self.keys[key] = KeyStatistics(
+                self.sketch_size, self.num_frequent)
+        return self.keys[key]
+
+    def __call__(self, result):
+        """Add a valid result of an algorithm to the reducer.
+
+        Args:
+            result (dict): Result with keys as string and values as numbers.
+
+        """
+        for key, val in six.iteritems(result):
+            self._get(key).update(val)
+
+    def merge(self, other):
+        """Merge partial state of another reducer into this reducer.
+
+        Args:
+            other (StreamingReducer): Reducer to be merged.
+
+        """
+        for key, stats in six.iteritems(other.keys):
+            self._get(key).merge(stats)
+
+    def summary(self):
+        """Return reduced values.
+
+        Returns:
+            dict: Dictionary with key as result key and value as dictionary
+            with `sum`, `count`, `mean`, `median` and `mode`.
+
+        """
+        return dict((key, stats.summary())
+                    for key, stats in six.iteritems(self.keys))
+
+    def to_dict(self):
+        """Return a JSON serializable state of the reducer."""
+        return {'sketch_size': self.sketch_size,
+                'num_frequent': self.num_frequent,
+                'keys': dict((key, stats.to_dict())
+                             for key, stats in six.iteritems(self.keys))}
+
+    @classmethod
+    def from_dict(cls, state):
+        """Create reducer from the state returned by `to_dict`."""
+        reducer = cls(state['sketch_size'], state['num_frequent'])
+        reducer.keys = dict(
+            (key, KeyStatistics.from_dict(stats))
+            for key, stats in six.iteritems(state['keys']))
+        return reducer
@@ -0,0 +1,173 @@
+"""Cache of map results of users for incremental recomputation."""
+from __future__ import division, print_function
+import hashlib
+import json
+import os
+import tempfile
+
+import six
+
+from .sharedparams import SHARED_KEY, is_shared_ref
+
+
+__all__ = ["ResultCache", "file_fingerprint"]
+
+# Parameters which do not change the output of `map`.
+IGNORED_PARAMS = ('aggregationServiceUrl',)
+
+
+def file_fingerprint(path):
+    """Return fingerprint of a file which changes when the file changes.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: Fingerprint made of name, size and modification time.
+
+    """
+    stat = os.stat(path)
+    return '{}:{}:{}'.format(
+        os.path.basename(path), stat.st_size, int(stat.st_mtime * 1e6))
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class ResultCache(object):
+    """Cache results of `map` of each user on disk.
+
+    An entry is keyed by hash of algorithm code, class name, parameters and
+    fingerprint of user csv file. Therefore, any change in algorithm,
+    parameters or data of the user makes the old entry unreachable, which is
+    then eventually evicted. Entries are evicted in least recently used order
+    once the cache goes beyond `max_entries` or `max_bytes`.
+
+    The cache can be shared by multiple processes, entries are written
+    atomically.
+
+    Args:
+        cache_dir (str): Directory where cache entries are stored.
+        max_entries (int): Maximum number of entries, None for no limit.
+        max_bytes (int): Maximum size of all entries, None for no limit.
+
+    """
+
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None):
+        """Initialize cache."""
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def job_key(self, algorithm, params, time_window=None):
+        """Return key identifying the algorithm and the parameters.
+
+        Args:
+            algorithm (dict): Dictionary with keys `code` and `className`,
+                or list of such dictionaries for algorithms run together.
+            params (dict): Parameters for the request, or list of parameters
+                of each algorithm.
+            time_window (tuple): `(start, end)` of records the algorithm is
+                run on, None for all records.
+
+        Returns:
+            str: Key to be used with `get` and `set`.
+
+        """
+        if isinstance(algorithm, list):
+            return _sha256(''.join(
+                self.job_key(algo, algo_params, time_window)
+                for algo, algo_params in zip(algorithm, params)))
+        # published parameters are identified by digest, not by path
+        canonical_params = json.dumps(
+            dict((key, {SHARED_KEY: val[SHARED_KEY]}
+                  if is_shared_ref(val) else val)
+                 for key, val in six.iteritems(params)
+                 if key not in IGNORED_PARAMS),
+            sort_keys=True, separators=(',', ':'))
+        parts = [_sha256(algorithm['code']), algorithm['className'],
+                 canonical_params]
+        if time_window is not None:
+            parts.append(json.dumps(list(time_window)))
+        return _sha256('\n'.join(parts))
+
+    def _entry_path(self, job_key, user_csv_file):
+        digest = _sha256(job_key + file_fingerprint(user_csv_file))
+        return os.path.join(self.cache_dir, digest[:2], digest + '.json')
+
+    def get(self, job_key, user_csv_file):
+        """Return cached result of a user.
+
+        Args:
+            job_key (str): Key returned by `job_key`.
+            user_csv_file (str): Path to user csv file.
+
+        Returns:
+            tuple: `(True, result)` if result is cached else `(False, None)`.
+
+        """
+        entry_path = self._entry_path(job_key, user_csv_file)
+        try:
+            with open(entry_path) as entry:
+                result = json.load(entry)['result']
+            os.utime(entry_path, None)
+        except (IOError, OSError, ValueError, KeyError):
+            return False, None
+        return True, result
+
+    def set(self, job_key, user_csv_file, result):
+        """Store result of a user.
+
+        Args:
+            job_key (str): Key returned by `job_key`.
+            user_csv_file (str): Path to user csv file.
+            result: Output of `map` of the algorithm.
+
+        """
+        entry_path = self._entry_path(job_key, user_csv_file)
+        entry_dir = os.path.dirname(entry_path)
+        if not os.path.exists(entry_dir):
+            try:
+                os.makedirs(entry_dir)
+            except OSError:
+                pass  # created by another process
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as entry:
+            json.dump({'result': result}, entry)
+        os.rename(tmp_path, entry_path)
+
+    def evict(self):
+        """Evict least recently used entries beyond the limits.
+
+        Returns:
+            int: Number of entries evicted.
+
+        """
+        if self.max_entries is None and self.max_bytes is None:
+            return 0
+        entries = []
+        for root, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                stat = os.stat(os.path.join(root, filename))
+                entries.append(
+                    (stat.st_mtime, stat.st_size,
+                     os.path.join(root, filename)))
+        entries.sort(reverse=True)
+        num_entries = len(entries)
+        total_bytes = sum(size for _, size, _ in entries)
+        num_evicted = 0
+        while entries and (
+                (self.max_entries is not None and
+                 num_entries > self.max_entries) or
+                (self.max_bytes is not None and total_bytes > self.max_bytes)):
+            _, size, path = entries.pop()
+            os.remove(path)
+            num_entries -= 1
+            total_bytes -= size
+            num_evicted += 1
+        return num_evicted
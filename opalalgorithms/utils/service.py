@@ -0,0 +1,468 @@
+"""Long running service running algorithms with warm workers.
+
+The service keeps a pool of worker processes and a manager alive between
+jobs, so that a job does not pay for spinning them up. Jobs are submitted
+over a small HTTP API and run one after another by priority.
+
+Start the service with::
+
+    python -m opalalgorithms.utils.service --num_threads 4 --port 8000
+
+and use the following endpoints:
+
+    - `POST /jobs` with JSON body with keys `algorithm`, `params`,
+      `data_dir` and optional `priority`, `num_threads`, `weights_file` and
+      `options` (keyword arguments of `AlgorithmRunner` listed in
+      `JOB_OPTIONS`, option objects given as dicts of their arguments).
+      Returns `job_id`, or status 400 if the request is invalid.
+    - `GET /jobs` returns status of all jobs.
+    - `GET /jobs/<job_id>` returns status, progress and result of a job.
+
+Besides the workers, jobs share the state the service keeps warm for them:
+zygotes of jobs run with a `zygote` stay running in the workers and load
+the next job, together with their staging directory, and indexes of users
+selected by time window or locations are kept in the `index_dir` of the
+service and updated incrementally by every job on the same data.
+"""
+from __future__ import division, print_function
+import argparse
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+import traceback
+
+import six
+from six.moves import BaseHTTPServer, socketserver
+
+from .options import (
+    Limits, ProfileOptions, RecyclingOptions, StagingOptions, UserSelection,
+    ZygoteOptions)
+
+
+__all__ = ["RunnerService", "JOB_OPTIONS", "validate_request"]
+
+
+def _job_zygote():
+    """Return zygote options of a job, zygotes are kept warm by workers."""
+    return ZygoteOptions(warm=True)
+
+
+def _job_selection(time_window=None, locations=None):
+    """Return user selection of a job, indexes are kept by the service."""
+    return UserSelection(time_window=time_window, locations=locations)
+
+
+# keyword arguments of `AlgorithmRunner` which jobs may set, with the option
+# object built from their dict, sandboxing is always on and the pool,
+# manager, indexes and objects of the runner are not exposed
+JOB_OPTIONS = {
+    'dev_mode': None,
+    'local_reduce': None,
+    'num_slowest': None,
+    'pin_cpus': None,
+    'limits': Limits,
+    'zygote': _job_zygote,
+    'profile': ProfileOptions,
+    'staging': StagingOptions,
+    'selection': _job_selection,
+    'recycling': RecyclingOptions,
+}
+
+
+class Job(object):
+    """Job submitted to the service.
+
+    Args:
+        job_id (int): Identifier of the job.
+        request (dict): Request of the job.
+        priority (int): Jobs with higher priority are run first.
+
+    """
+
+    def __init__(self, job_id, request, priority=0):
+        """Initialize job."""
+        self.job_id = job_id
+        self.request = request
+        self.priority = priority
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.runner = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        """Return JSON serializable status of the job."""
+        progress = 1.0 if self.status == 'done' else 0.0
+        if self.status == 'running' and hasattr(self.runner, 'progress'):
+            progress = self.runner.progress()
+        return {
+            'job_id': self.job_id,
+            'priority': self.priority,
+            'status': self.status,
+            'progress': progress,
+            'result': _serializable(self.result),
+            'error': self.error,
+            'report': None if getattr(self.runner, 'report', None) is None
+            else self.runner.report.summary(),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+def _serializable(result):
+    """Convert result of a run to a JSON serializable value."""
+    if isinstance(result, list):
+        return [_serializable(res) for res in result]
+    if hasattr(result, 'summary'):
+        return result.summary()
+    return result
+
+
+class RunnerService(object):
+    """Run jobs one by one by priority using warm worker processes.
+
+    Args:
+        num_threads (int): Number of mapper processes kept warm.
+        host (str): Host on which HTTP API listens.
+        port (int): Port on which HTTP API listens, 0 for any free port.
+        runner_factory (callable): Function taking a job request, the pool
+            and the manager and returning the runner of the job. By default
+            an `AlgorithmRunner` is created with the `options` of the
+            request.
+        index_dir (str): Directory in which indexes of users of every data
+            directory are kept between jobs, None to scan all users of
+            every job selecting users.
+
+    """
+
+    def __init__(self, num_threads, host='127.0.0.1', port=0,
+                 runner_factory=None, index_dir=None):
+        """Initialize service."""
+        self.num_threads = num_threads
+        self.host = host
+        self.port = port
+        self.index_dir = index_dir
+        self.runner_factory = runner_factory or functools.partial(
+            default_runner_factory, index_dir=index_dir)
+        self.pool = None
+        self.manager = None
+        self.jobs = {}
+        self._queue = []
+        self._job_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._threads = []
+        self._server = None
+
+    def submit(self, request, priority=0):
+        """Queue a job.
+
+        Args:
+            request (dict): Request with keys `algorithm`, `params`,
+                `data_dir` and optional `num_threads`, `weights_file` and
+                `options`.
+            priority (int): Jobs with higher priority are run first, jobs
+                with same priority are run in order of submission.
+
+        Returns:
+            int: Identifier of the job.
+
+        Raises:
+            ValueError: If the request or priority is invalid, see
+                `validate_request`.
+
+        """
+        validate_request(dict(request, priority=priority))
+        with self._condition:
+            job = Job(next(self._job_ids), request, priority)
+            self.jobs[job.job_id] = job
+            heapq.heappush(self._queue, (-priority, job.job_id))
+            self._condition.notify()
+        return job.job_id
+
+    def status(self, job_id=None):
+        """Return status of a job, or of all jobs if `job_id` is None."""
+        if job_id is None:
+            return [job.to_dict() for _, job in sorted(
+                six.iteritems(self.jobs))]
+        return self.jobs[job_id].to_dict()
+
+    def start(self, serve=True):
+        """Start warm workers, the job loop and the HTTP API.
+
+        Args:
+            serve (bool): Start HTTP API or only accept jobs via `submit`.
+
+        """
+        if self.index_dir is not None and not os.path.isdir(self.index_dir):
+            os.makedirs(self.index_dir)
+        self.manager = mp.Manager()
+        # additional 1 process for collector
+        self.pool = mp.Pool(processes=self.num_threads + 1)
+        self._threads.append(threading.Thread(target=self._run_jobs))
+        if serve:
+            self._server = _ThreadingHTTPServer(
+                (self.host, self.port), _RequestHandler)
+            self._server.service = self
+            self.port = self._server.server_address[1]
+            self._threads.append(threading.Thread(
+                target=self._server.serve_forever))
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Stop the service after the running job, if any, finishes.
+
+        Jobs still queued are cancelled.
+
+        """
+        with self._condition:
+            self._stopped = True
+            while self._queue:
+                _, job_id = heapq.heappop(self._queue)
+                self.jobs[job_id].status = 'cancelled'
+                self.jobs[job_id].finished_at = time.time()
+            self._condition.notify_all()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.pool.close()
+        self.pool.join()
+        self.manager.shutdown()
+
+    def _next_job(self):
+        with self._condition:
+            while not self._queue and not self._stopped:
+                self._condition.wait()
+            if self._stopped:
+                return None
+            _, job_id = heapq.heappop(self._queue)
+            return self.jobs[job_id]
+
+    def _run_jobs(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            request = job.request
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                job.runner = self.runner_factory(
+                    request, self.pool, self.manager)
+                job.result = job.runner(
+                    request['params'], request['data_dir'],
+                    min(request.get('num_threads', self.num_threads),
+                        self.num_threads),
+                    request.get('weights_file'))
+                job.status = 'done'
+            except Exception:
+                job.error = traceback.format_exc()
+                job.status = 'failed'
+            job.finished_at = time.time()
+
+
+def _check_integer(request, key, positive=False):
+    """Raise ValueError unless `key` of `request` is a (positive) integer."""
+    value = request[key]
+    if isinstance(value, bool) or not isinstance(
+            value, six.integer_types) or (positive and value <= 0):
+        raise ValueError('{} must be {}'.format(
+            key, 'a positive integer' if positive else 'an integer'))
+
+
+def validate_request(request):
+    """Check that a job request can be run.
+
+    Args:
+        request (dict): Request of the job, with keys `algorithm`,
+            `params`, `data_dir` and optional `priority`, `num_threads`,
+            `weights_file` and `options`.
+
+    Raises:
+        ValueError: If the request is not a dict, misses keys, `priority`
+            is not an integer, `num_threads` is not a positive integer or
+            the options are invalid.
+
+    """
+    if not isinstance(request, dict):
+        raise ValueError('Request must be a JSON object')
+    missing = [key for key in ('algorithm', 'params', 'data_dir')
+               if key not in request]
+    if missing:
+        raise ValueError('Missing {}'.format(', '.join(missing)))
+    if not isinstance(request['params'], dict):
+        raise ValueError('Params must be a dict')
+    if 'priority' in request:
+        _check_integer(request, 'priority')
+    if 'num_threads' in request:
+        _check_integer(request, 'num_threads', positive=True)
+    job_options(request)
+
+
+def job_indexes(index_dir, data_dir):
+    """Return paths of the time and location indexes of a data directory.
+
+    Args:
+        index_dir (str): Directory in which indexes are kept.
+        data_dir (str): Data directory of a job.
+
+    Returns:
+        tuple: Path of the `TimeIndex` and directory of the
+        `LocationIndex`.
+
+    """
+    key = hashlib.sha1(os.path.abspath(data_dir).encode('utf-8')).hexdigest()
+    return (os.path.join(index_dir, key + '-time.json.gz'),
+            os.path.join(index_dir, key + '-locations'))
+
+
+def job_options(request, index_dir=None):
+    """Return keyword arguments of `AlgorithmRunner` of a job request.
+
+    Args:
+        request (dict): Request of the job.
+        index_dir (str): Directory in which indexes of users selected by
+            the job are kept, see `job_indexes`, None to not keep them.
+
+    Returns:
+        dict: `options` of the request, with option objects built from
+        their dicts and sandboxing always on.
+
+    Raises:
+        ValueError: If options are not a dict, are not in `JOB_OPTIONS` or
+            are invalid.
+
+    """
+    options = request.get('options', {})
+    if not isinstance(options, dict):
+        raise ValueError('Options must be a dict')
+    unknown = set(options) - set(JOB_OPTIONS)
+    if unknown:
+        raise ValueError('Unknown options {}'.format(
+            ', '.join(sorted(unknown))))
+    kwargs = {'sandboxing': True}
+    for name, value in six.iteritems(options):
+        factory = JOB_OPTIONS[name]
+        if factory is None:
+            kwargs[name] = value
+            continue
+        if not isinstance(value, dict):
+            raise ValueError('Option {} must be a dict'.format(name))
+        try:
+            kwargs[name] = factory(**value)
+        except TypeError as exc:
+            raise ValueError('Invalid option {}: {}'.format(name, exc))
+    if index_dir is not None and 'selection' in kwargs:
+        selection = kwargs['selection']
+        selection.time_index, selection.location_index = job_indexes(
+            index_dir, request['data_dir'])
+    return kwargs
+
+
+def default_runner_factory(request, pool, manager, index_dir=None):
+    """Return sandboxed `AlgorithmRunner` using the warm pool and manager.
+
+    Indexes of users are kept in `index_dir`, see `job_options`.
+
+    """
+    from .algorithmrunner import AlgorithmRunner
+
+    return AlgorithmRunner(
+        request['algorithm'], pool=pool, manager=manager,
+        **job_options(request, index_dir))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handle requests of the HTTP API."""
+
+    def _respond(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        """Return status of jobs."""
+        service = self.server.service
+        parts = self.path.strip('/').split('/')
+        if parts == ['jobs']:
+            self._respond(200, service.status())
+        elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit():
+            if int(parts[1]) not in service.jobs:
+                self._respond(404, {'error': 'Unknown job'})
+            else:
+                self._respond(200, service.status(int(parts[1])))
+        else:
+            self._respond(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        """Submit a job."""
+        if self.path.strip('/') != 'jobs':
+            self._respond(404, {'error': 'Not found'})
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            self._respond(400, {'error': 'Invalid JSON'})
+            return
+        try:
+            validate_request(request)
+        except ValueError as exc:
+            self._respond(400, {'error': str(exc)})
+            return
+        job_id = self.server.service.submit(
+            request, request.get('priority', 0))
+        self._respond(201, {'job_id': job_id})
+
+    def log_message(self, format, *args):
+        """Silence logging of every request."""
+
+
+def main():
+    """Run the service until interrupted."""
+    parser = argparse.ArgumentParser(
+        description='Run algorithms submitted over HTTP with warm workers.')
+    parser.add_argument('--num_threads', type=int, required=True,
+                        help='Number of mapper processes.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Host on which the service listens.')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='Port on which the service listens.')
+    parser.add_argument('--index_dir',
+                        help='Directory in which indexes of users are kept.')
+    args = parser.parse_args()
+    service = RunnerService(args.num_threads, args.host, args.port,
+                            index_dir=args.index_dir)
+    service.start()
+    print('Listening on {}:{}'.format(args.host, service.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        service.stop()
+
+
+if __name__ == '__main__':
+    main()
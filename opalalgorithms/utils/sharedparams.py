@@ -0,0 +1,251 @@
+"""Large read-only parameters shared by all users of a job.
+
+Parameters like lookup tables of antennas are published once per job to a
+memory mapped file, instead of being serialized into the sandbox of every
+user. The parameter is replaced by a small reference, which is resolved
+inside the sandbox to `SharedParams`, a lazy read-only dict-like view.
+
+A published table is a binary file made of a header, offsets of the sorted
+keys, offsets of the values, the keys encoded in utf-8 and the values
+encoded as JSON. Lookups are binary searches over the memory mapped file
+and only the values which are accessed are decoded.
+
+Note:
+    The source of this module is run inside the sandbox, see
+    `resolver_code`, hence it must only import light modules and nothing
+    from `opalalgorithms`.
+"""
+from __future__ import division, print_function
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import textwrap
+
+import six
+from six.moves import collections_abc
+
+
+__all__ = ["SharedParams", "publish_shared_params",
+           "resolve_shared_params", "is_shared_ref", "resolver_code"]
+
+MAGIC = b'OPALSHP1'
+HEADER = struct.Struct('<8sQ')
+OFFSET = struct.Struct('<Q')
+# key of the reference which replaces a published parameter
+SHARED_KEY = '__opal_shared__'
+
+
+def is_shared_ref(value):
+    """Check if `value` is a reference to a published parameter."""
+    return isinstance(value, dict) and SHARED_KEY in value
+
+
+def write_table(table, path):
+    """Write a table to a file readable by `SharedParams`.
+
+    Args:
+        table (dict): Table with string keys and JSON serializable values.
+        path (str): Path where the table is written.
+
+    Returns:
+        str: SHA-256 digest of the written file.
+
+    """
+    items = sorted(
+        (key.encode('utf-8'),
+         json.dumps(value, sort_keys=True).encode('utf-8'))
+        for key, value in six.iteritems(table))
+    digest = hashlib.sha256()
+    with open(path, 'wb') as table_file:
+        def write(data):
+            table_file.write(data)
+            digest.update(data)
+
+        write(HEADER.pack(MAGIC, len(items)))
+        for index in (0, 1):
+            offset = 0
+            for item in items:
+                write(OFFSET.pack(offset))
+                offset += len(item[index])
+            write(OFFSET.pack(offset))
+        for index in (0, 1):
+            for item in items:
+                write(item[index])
+    return digest.hexdigest()
+
+
+def publish_shared_params(params, names, directory=None):
+    """Publish parameters to files readable from the sandbox.
+
+    Args:
+        params (dict): Parameters of the request.
+        names (list): Names of parameters to be published, each must be a
+            dict with string keys.
+        directory (str): Directory where parameters are published. By
+            default a new `codejail-shared-` directory is created in the
+            temporary directory, which the sandbox profile allows to read.
+
+    Returns:
+        tuple: Parameters with published ones replaced by references and the
+        directory, which should be removed once the job is done.
+
+    """
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='codejail-shared-')
+        os.chmod(directory, 0o755)
+    params = dict(params)
+    try:
+        for name in names:
+            if not isinstance(params[name], dict):
+                raise TypeError(
+                    'Shared parameter {!r} must be a dict'.format(name))
+            path = os.path.join(directory, '{}.bin'.format(
+                hashlib.sha256(name.encode('utf-8')).hexdigest()[:16]))
+            digest = write_table(params[name], path)
+            os.chmod(path, 0o644)
+            params[name] = {SHARED_KEY: digest, 'path': path}
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return params, directory
+
+
+def resolve_shared_params(params):
+    """Replace references in parameters by `SharedParams` views.
+
+    Args:
+        params (dict): Parameters possibly with references returned by
+            `publish_shared_params`.
+
+    Returns:
+        dict: Parameters with views of the published parameters.
+
+    """
+    if not any(is_shared_ref(value) for value in six.itervalues(params)):
+        return params
+    return dict(
+        (key, SharedParams(value['path']) if is_shared_ref(value) else value)
+        for key, value in six.iteritems(params))
+
+
+def resolver_code():
+    """Return code defining `resolve_shared_params` in the sandbox.
+
+    The code runs the source of this module, so that the sandbox needs
+    neither the package nor its `__init__` to resolve references.
+
+    Returns:
+        str: Python code to be run before references are resolved.
+
+    """
+    source = inspect.getsource(sys.modules[__name__])
+    return textwrap.dedent("""
+        _opal_shared = {{'__name__': '_opal_sharedparams'}}
+        exec(compile({!r}, '<sharedparams>', 'exec'), _opal_shared)
+        resolve_shared_params = _opal_shared['resolve_shared_params']
+        """).format(source)
+
+
+class SharedParams(collections_abc.Mapping):
+    """Read only dict-like view of a published parameter.
+
+    The file is memory mapped lazily on first access, so that the view can be
+    sent to other processes, each of which maps the file on its own.
+
+    Args:
+        path (str): Path to the published parameter.
+
+    """
+
+    def __init__(self, path):
+        """Initialize view."""
+        self.path = path
+        self._file = None
+        self._mmap = None
+        self._count = None
+
+    def __getstate__(self):
+        """Return state without the open file for pickling."""
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        """Restore view from pickled state."""
+        self.__init__(state['path'])
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(
+                '{} is not a published parameter'.format(self.path))
+        self._value_offsets = HEADER.size + OFFSET.size * (self._count + 1)
+        self._keys_start = self._value_offsets + OFFSET.size * (
+            self._count + 1)
+        self._values_start = self._keys_start + OFFSET.unpack_from(
+            self._mmap, self._value_offsets - OFFSET.size)[0]
+
+    def _slice(self, offsets, start, index):
+        begin, end = struct.unpack_from(
+            '<QQ', self._mmap, offsets + OFFSET.size * index)
+        return self._mmap[start + begin:start + end]
+
+    def _key(self, index):
+        return self._slice(HEADER.size, self._keys_start, index)
+
+    def _find(self, key):
+        if self._mmap is None:
+            self._open()
+        if not isinstance(key, six.string_types):
+            return None
+        key = key.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._count and self._key(low) == key:
+            return low
+        return None
+
+    def __getitem__(self, key):
+        """Return value of `key`, decoded on access."""
+        index = self._find(key)
+        if index is None:
+            raise KeyError(key)
+        return json.loads(self._slice(
+            self._value_offsets, self._values_start, index).decode('utf-8'))
+
+    def __contains__(self, key):
+        """Check if `key` is in the published parameter."""
+        return self._find(key) is not None
+
+    def __iter__(self):
+        """Iterate over keys in sorted order."""
+        if self._mmap is None:
+            self._open()
+        for index in range(self._count):
+            yield self._key(index).decode('utf-8')
+
+    def __len__(self):
+        """Return number of keys."""
+        if self._mmap is None:
+            self._open()
+        return self._count
+
+    def close(self):
+        """Close the memory mapped file."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
@@ -0,0 +1,279 @@
+"""Local sinks of results written with large buffered writes.
+
+Sinks are an alternative to posting every result to the aggregation
+service, e.g. for offline reprocessing. A sink is created in the process
+starting the run and sent to the collector, hence the underlying file or
+socket is opened lazily on the first write.
+
+New backends subclass `ResultSink` and implement `_write_buffer`, which is
+called with a large block of encoded results, and optionally `_encode`,
+`_open` and `_close`.
+"""
+from __future__ import division, print_function
+import csv
+import gzip
+import json
+import os
+import socket
+
+import six
+
+
+__all__ = ["ResultSink", "FileSink", "JSONLinesSink", "CSVSink",
+           "UnixSocketSink"]
+
+
+class ResultSink(object):
+    """Base class of sinks buffering encoded results.
+
+    Args:
+        buffer_size (int): Bytes of encoded results buffered before they are
+            written at once.
+
+    Attributes:
+        num_results (int): Number of results written during the last run.
+
+    """
+
+    def __init__(self, buffer_size=2 ** 20):
+        """Initialize sink."""
+        self.buffer_size = buffer_size
+        self.num_results = 0
+        self._buffer = []
+        self._buffered = 0
+        self._opened = False
+
+    def __getstate__(self):
+        """Return state without open handles and buffer for pickling."""
+        state = self.__dict__.copy()
+        state.update(self._closed_state())
+        state['_buffer'] = []
+        state['_buffered'] = 0
+        state['_opened'] = False
+        return state
+
+    def _closed_state(self):
+        """Return attributes of handles set when the sink is closed."""
+        return {}
+
+    def write(self, result):
+        """Buffer a result and write the buffer once it is full.
+
+        Args:
+            result (dict): Result of a single user.
+
+        """
+        if not self._opened:
+            self.num_results = 0
+            self._open()
+            self._opened = True
+        data = self._encode(result)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.num_results += 1
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered results."""
+        if self._buffer:
+            self._write_buffer(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def close(self):
+        """Write buffered results and close the sink."""
+        if self._opened:
+            self.flush()
+            self._close()
+            self._opened = False
+
+    def summary(self):
+        """Return JSON serializable summary of the last run."""
+        return {'num_results': self.num_results}
+
+    def _encode(self, result):
+        """Return result encoded as bytes."""
+        return (json.dumps(result, sort_keys=True) + '\n').encode('utf-8')
+
+    def _open(self):
+        """Open the underlying file or connection."""
+
+    def _write_buffer(self, data):
+        """Write a block of encoded results."""
+        raise NotImplementedError
+
+    def _close(self):
+        """Close the underlying file or connection."""
+
+
+class FileSink(ResultSink):
+    """Sink writing encoded results to files, optionally rotated.
+
+    Args:
+        path (str): Path of the file. If `max_bytes` is set, files are
+            numbered, e.g. `results.jsonl` becomes `results.00000.jsonl`,
+            `results.00001.jsonl` and so on.
+        compress (bool): Compress files with gzip. If None, files are
+            compressed if `path` ends with `.gz`.
+        max_bytes (int): Uncompressed size at which a new file is started,
+            None to write a single file.
+        buffer_size (int): Bytes buffered before they are written at once.
+
+    Attributes:
+        paths (list): Paths of files written during the last run.
+
+    """
+
+    def __init__(self, path, compress=None, max_bytes=None,
+                 buffer_size=2 ** 20):
+        """Initialize sink."""
+        super(FileSink, self).__init__(buffer_size)
+        self.path = path
+        self.compress = path.endswith('.gz') if compress is None else compress
+        self.max_bytes = max_bytes
+        self.paths = []
+        self._file = None
+        self._file_bytes = 0
+
+    def _closed_state(self):
+        return {'_file': None, '_file_bytes': 0}
+
+    def summary(self):
+        """Return JSON serializable summary of the last run."""
+        return dict(super(FileSink, self).summary(), paths=self.paths)
+
+    def _header(self):
+        """Return bytes written at the start of every file."""
+        return b''
+
+    def _next_path(self):
+        if self.max_bytes is None:
+            return self.path
+        root, ext = os.path.splitext(self.path)
+        if ext == '.gz':
+            root, inner_ext = os.path.splitext(root)
+            ext = inner_ext + ext
+        return '{}.{:05d}{}'.format(root, len(self.paths), ext)
+
+    def _open(self):
+        self.paths = []
+        self._open_file()
+
+    def _open_file(self):
+        path = self._next_path()
+        if self.compress:
+            self._file = gzip.open(path, 'wb')
+        else:
+            self._file = open(path, 'wb')
+        self.paths.append(path)
+        header = self._header()
+        self._file.write(header)
+        self._file_bytes = len(header)
+
+    def _write_buffer(self, data):
+        if self.max_bytes is not None and self._file_bytes > len(
+                self._header()) and self._file_bytes + len(
+                    data) > self.max_bytes:
+            self._file.close()
+            self._open_file()
+        self._file.write(data)
+        self._file_bytes += len(data)
+
+    def flush(self):
+        """Write buffered results, rotating files at `max_bytes`."""
+        if self.max_bytes is None or not self._buffer:
+            super(FileSink, self).flush()
+            return
+        # split the buffer at result boundaries to respect the file size
+        block = []
+        block_bytes = 0
+        for data in self._buffer:
+            if block and self._file_bytes + block_bytes + len(
+                    data) > self.max_bytes:
+                self._write_buffer(b''.join(block))
+                block = []
+                block_bytes = 0
+            block.append(data)
+            block_bytes += len(data)
+        self._write_buffer(b''.join(block))
+        self._buffer = []
+        self._buffered = 0
+
+    def _close(self):
+        self._file.close()
+        self._file = None
+
+
+class JSONLinesSink(FileSink):
+    """Sink writing every result as a line of JSON.
+
+    Args:
+        path (str): Path of the file, see `FileSink`.
+        compress (bool): Compress files with gzip, see `FileSink`.
+        max_bytes (int): Size at which files are rotated, see `FileSink`.
+        buffer_size (int): Bytes buffered before they are written at once.
+
+    """
+
+
+class CSVSink(FileSink):
+    """Sink writing results as rows of `result,key,value`.
+
+    Results are numbered in order of writing, so that rows of the same
+    result can be grouped back together.
+
+    Args:
+        path (str): Path of the file, see `FileSink`.
+        compress (bool): Compress files with gzip, see `FileSink`.
+        max_bytes (int): Size at which files are rotated, see `FileSink`.
+        buffer_size (int): Bytes buffered before they are written at once.
+
+    """
+
+    def _header(self):
+        return b'result,key,value\r\n'
+
+    def _encode(self, result):
+        rows = six.StringIO()
+        writer = csv.writer(rows)
+        for key, value in sorted(six.iteritems(result)):
+            writer.writerow([self.num_results, key, value])
+        data = rows.getvalue()
+        if isinstance(data, six.text_type):
+            data = data.encode('utf-8')
+        return data
+
+
+class UnixSocketSink(ResultSink):
+    """Sink streaming results as lines of JSON to a Unix domain socket.
+
+    A consumer, e.g. a local aggregator, must listen on the socket before
+    the run starts.
+
+    Args:
+        address (str): Path of the Unix domain socket.
+        buffer_size (int): Bytes buffered before they are sent at once.
+
+    """
+
+    def __init__(self, address, buffer_size=2 ** 20):
+        """Initialize sink."""
+        super(UnixSocketSink, self).__init__(buffer_size)
+        self.address = address
+        self._socket = None
+
+    def _closed_state(self):
+        return {'_socket': None}
+
+    def _open(self):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self.address)
+
+    def _write_buffer(self, data):
+        self._socket.sendall(data)
+
+    def _close(self):
+        self._socket.shutdown(socket.SHUT_WR)
+        self._socket.close()
+        self._socket = None
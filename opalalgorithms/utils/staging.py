@@ -0,0 +1,122 @@
+"""Staging of user files into a directory readable by the sandbox.
+
+Codejail copies every file passed to `safe_exec` into a fresh temporary
+directory. Instead, a worker prepares a single staging directory once and
+exposes each user file in it through a hard link, which costs no data write.
+Files which cannot be linked, e.g. because they are on another filesystem or
+not readable by the sandbox user, are copied. For jobs restricted to a time
+window, only the records in the window are staged.
+"""
+from __future__ import division, print_function
+import os
+import shutil
+import stat
+import tempfile
+
+from .userindex import slice_records
+
+
+__all__ = ["FileStager", "stage_file"]
+
+
+def stage_file(path, directory):
+    """Expose file at `path` in `directory` as a hard link or a copy.
+
+    A hard link shares permissions with the original file, hence files which
+    are not readable by other users are copied, so that the sandbox user can
+    read them without changing permissions of the data.
+
+    Args:
+        path (str): Path to the file.
+        directory (str): Directory in which file is exposed.
+
+    Returns:
+        tuple: Path of the staged file and whether it was linked.
+
+    """
+    staged_path = os.path.join(directory, os.path.basename(path))
+    if os.path.lexists(staged_path):
+        os.remove(staged_path)
+    if os.stat(path).st_mode & stat.S_IROTH:
+        try:
+            os.link(path, staged_path)
+            return staged_path, True
+        except OSError:
+            pass  # e.g. another filesystem, fall back to copying
+    # keep modification time, so that cached results are still found
+    shutil.copy2(path, staged_path)
+    os.chmod(staged_path, 0o644)
+    return staged_path, False
+
+
+class FileStager(object):
+    """Staging directory of a worker exposing user files without copying.
+
+    Args:
+        base_dir (str): Directory in which the staging directory is created,
+            by default `OPALALGO_STAGING_DIR` or the temporary directory.
+            Hard links require it to be on the same filesystem as the data,
+            and the sandbox profile must allow reading `codejail-*`
+            directories in it.
+        time_window (tuple): `(start, end)` datetimes, inclusive, to stage
+            only records in the window instead of the whole file.
+        sorted_files (set): Paths of users whose records are sorted by
+            time, which are sliced by binary search.
+
+    Attributes:
+        num_linked (int): Number of files staged as hard links.
+        num_copied (int): Number of files staged as copies.
+
+    """
+
+    def __init__(self, base_dir=None, time_window=None, sorted_files=None):
+        """Initialize stager and create the staging directory."""
+        base_dir = base_dir or os.environ.get('OPALALGO_STAGING_DIR')
+        # codejail- prefix lets the sandbox profile read staged files
+        self.directory = tempfile.mkdtemp(
+            prefix='codejail-staging-', dir=base_dir)
+        os.chmod(self.directory, 0o755)
+        self.time_window = time_window
+        self.sorted_files = sorted_files or set()
+        self.num_linked = 0
+        self.num_copied = 0
+
+    def stage(self, path):
+        """Expose a user file in the staging directory.
+
+        Args:
+            path (str): Path to user csv file.
+
+        Returns:
+            str: Path of the staged file, to be released once processed.
+
+        """
+        if self.time_window is not None:
+            return self._stage_slice(path)
+        staged_path, linked = stage_file(path, self.directory)
+        if linked:
+            self.num_linked += 1
+        else:
+            self.num_copied += 1
+        return staged_path
+
+    def _stage_slice(self, path):
+        staged_path = os.path.join(self.directory, os.path.basename(path))
+        start, end = self.time_window
+        slice_records(path, staged_path, start, end,
+                      path in self.sorted_files)
+        # keep modification time, so that cached results are still found
+        shutil.copystat(path, staged_path)
+        os.chmod(staged_path, 0o644)
+        self.num_copied += 1
+        return staged_path
+
+    def release(self, staged_path):
+        """Remove a staged file."""
+        os.remove(staged_path)
+
+    def close(self):
+        """Remove the staging directory."""
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
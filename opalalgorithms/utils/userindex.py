@@ -0,0 +1,455 @@
+"""Indexes of user files to select the users relevant for a job.
+
+An index keeps a small summary of every user file, together with the
+fingerprint of the file, so that only new or changed files are scanned when
+the index is updated. Indexes are stored as gzipped JSON. User files are
+identified by their path relative to the data directory.
+"""
+from __future__ import division, print_function
+import bisect
+import csv
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+import six
+
+from .resultcache import file_fingerprint
+
+
+__all__ = ["UserIndex", "TimeIndex", "LocationIndex", "slice_records"]
+
+DATETIME_FIELD = 'datetime'
+LOCATION_FIELDS = ('location_level_1', 'location_level_2', 'antenna_id')
+
+
+def _open_csv(path):
+    """Open csv file for reading with the csv module."""
+    if six.PY2:
+        return open(path, 'rb')
+    return open(path, newline='')
+
+
+def _column(header, field):
+    """Return position of `field` in the header of a user file."""
+    names = [name.strip() for name in header]
+    if field not in names:
+        raise ValueError('User file has no {!r} column'.format(field))
+    return names.index(field)
+
+
+def _read_state(path):
+    """Return JSON state stored in gzipped file `path`, None if missing."""
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rb') as index_file:
+        return json.loads(index_file.read().decode('utf-8'))
+
+
+def _write_state(path, state):
+    """Write JSON state to gzipped file `path` atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    with gzip.open(tmp_path, 'wb') as index_file:
+        index_file.write(json.dumps(state).encode('utf-8'))
+    os.rename(tmp_path, path)
+
+
+def _has_locations(values, locations):
+    """Check if values of a user have one of the values of every field.
+
+    Fields missing in the user file match any value.
+
+    """
+    for field, field_values in six.iteritems(locations):
+        if field in values and not set(values[field]) & set(
+                str(value) for value in field_values):
+            return False
+    return True
+
+
+class UserIndex(object):
+    """Base class of incrementally maintained indexes of user files.
+
+    Subclasses implement `_scan`, which returns a JSON serializable summary
+    of a user file.
+
+    Args:
+        path (str): Path where index is stored, None to keep the index only
+            in memory.
+        root (str): Data directory to which keys of user files are relative,
+            by default the directory of each file, hence keys are filenames.
+
+    Attributes:
+        entries (dict): Summary of each user file by key.
+
+    """
+
+    version = 2
+
+    def __init__(self, path=None, root=None):
+        """Initialize index, loading it from `path` if it exists."""
+        self.path = path
+        self.root = root
+        self.entries = {}
+        self._fingerprints = {}
+        state = _read_state(path) if path is not None else None
+        if state is not None and state.get('version') == self.version:
+            for key, (fingerprint, entry) in six.iteritems(state['users']):
+                self._fingerprints[key] = fingerprint
+                self.entries[key] = entry
+
+    def key(self, path):
+        """Return key of the user file at `path`."""
+        if self.root is None:
+            return os.path.basename(path)
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def update(self, csv_files):
+        """Scan new and changed user files and forget removed ones.
+
+        Args:
+            csv_files (list): Paths of all user files of the dataset.
+
+        Returns:
+            int: Number of user files scanned.
+
+        """
+        keys = set()
+        num_scanned = 0
+        removed = set(self.entries)
+        for path in csv_files:
+            key = self.key(path)
+            keys.add(key)
+            fingerprint = file_fingerprint(path)
+            if self._fingerprints.get(key) == fingerprint:
+                continue
+            self.entries[key] = self._scan(path)
+            self._fingerprints[key] = fingerprint
+            num_scanned += 1
+        removed -= keys
+        for key in removed:
+            del self.entries[key]
+            del self._fingerprints[key]
+        if self.path is not None and (
+                num_scanned or removed or not os.path.exists(self.path)):
+            self.save()
+        return num_scanned
+
+    def save(self):
+        """Write the index atomically to `path`."""
+        _write_state(self.path, {'version': self.version, 'users': dict(
+            (key, [self._fingerprints[key], entry])
+            for key, entry in six.iteritems(self.entries))})
+
+    def _scan(self, path):
+        raise NotImplementedError
+
+
+class TimeIndex(UserIndex):
+    """Index of first and last record time and number of records of users.
+
+    Datetimes are compared as strings of the form '%Y-%m-%d %H:%M:%S', which
+    sort in time order.
+
+    Args:
+        path (str): Path where index is stored, None to keep the index only
+            in memory.
+        root (str): Data directory to which keys of user files are relative.
+
+    """
+
+    def _scan(self, path):
+        """Return `[first, last, count, sorted]` of records of a user."""
+        first = last = previous = None
+        count = 0
+        in_order = True
+        with _open_csv(path) as user_file:
+            reader = csv.reader(user_file)
+            column = _column(next(reader), DATETIME_FIELD)
+            for row in reader:
+                if not row:
+                    continue
+                date = row[column]
+                if first is None or date < first:
+                    first = date
+                if last is None or date > last:
+                    last = date
+                if previous is not None and date < previous:
+                    in_order = False
+                previous = date
+                count += 1
+        return [first, last, count, in_order]
+
+    def select(self, csv_files, start, end):
+        """Return user files with records between `start` and `end`.
+
+        Args:
+            csv_files (list): Paths of user files, the index must be up to
+                date with them.
+            start (str): Start of the window, inclusive.
+            end (str): End of the window, inclusive.
+
+        Returns:
+            list: Paths of user files with records in the window.
+
+        """
+        selected = []
+        for path in csv_files:
+            first, last, count, _ = self.entries[self.key(path)]
+            if count and first <= end and last >= start:
+                selected.append(path)
+        return selected
+
+    def is_sorted(self, path):
+        """Check if records of the user file are sorted by time."""
+        return self.entries[self.key(path)][3]
+
+
+class LocationIndex(UserIndex):
+    """Inverted index from locations and antennas to users.
+
+    The index is a directory with a catalog of the fingerprint of every
+    indexed user file, and a file for every value of `location_level_1`,
+    `location_level_2` and `antenna_id` with the users having records with
+    the value. Only the files of the values looked up are loaded, and only
+    the files of the users found are checked for changes, hence selecting
+    the users of a region reads neither the other users nor their files.
+
+    User files without a location column are indexed with the columns they
+    have, and are selected by any value of the missing fields, so that the
+    algorithm decides whether they belong to the region.
+
+    `select` scans users which are new to the index, and rescans found users
+    whose files changed. A changed user which was not found, but now has
+    records in the region, is found once the index is refreshed with
+    `update`.
+
+    Args:
+        path (str): Directory where the index is stored, None to keep the
+            index only in memory.
+        root (str): Data directory to which keys of user files are relative.
+
+    Attributes:
+        entries (dict): Location fields missing in each user file by key.
+
+    """
+
+    def __init__(self, path=None, root=None):
+        """Initialize index, loading its catalog from `path` if it exists."""
+        super(LocationIndex, self).__init__(
+            None if path is None else os.path.join(path, 'catalog.json.gz'),
+            root)
+        self.directory = path
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+        # users of values which were looked up, or changed since saving
+        self._postings = {}
+        self._changed = set()
+
+    def _posting_path(self, field, value):
+        digest = hashlib.sha1(value.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}-{}.json.gz'.format(
+            field, digest))
+
+    def _posting(self, field, value):
+        """Return dict of users with `value` in `field` to fingerprints."""
+        if (field, value) not in self._postings:
+            state = None
+            if self.directory is not None:
+                state = _read_state(self._posting_path(field, value))
+            self._postings[field, value] = (
+                {} if state is None or state.get('version') != self.version
+                else state['users'])
+        return self._postings[field, value]
+
+    def _index(self, key, path):
+        """Scan a user file and add it to the postings of its values."""
+        values, missing = self._scan(path)
+        fingerprint = file_fingerprint(path)
+        self._fingerprints[key] = fingerprint
+        self.entries[key] = missing
+        for field, field_values in six.iteritems(values):
+            for value in field_values:
+                self._posting(field, value)[key] = fingerprint
+                self._changed.add((field, value))
+        return values
+
+    def update(self, csv_files):
+        """Scan new and changed user files and forget removed ones.
+
+        Postings of removed or changed users are left in place and ignored,
+        as their fingerprints no longer match the catalog.
+
+        Args:
+            csv_files (list): Paths of all user files of the dataset.
+
+        Returns:
+            int: Number of user files scanned.
+
+        """
+        keys = set()
+        num_scanned = 0
+        for path in csv_files:
+            key = self.key(path)
+            keys.add(key)
+            if self._fingerprints.get(key) != file_fingerprint(path):
+                self._index(key, path)
+                num_scanned += 1
+        removed = set(self.entries) - keys
+        for key in removed:
+            del self.entries[key]
+            del self._fingerprints[key]
+        if num_scanned or removed:
+            self.save()
+        return num_scanned
+
+    def save(self):
+        """Write the catalog and changed postings atomically."""
+        if self.directory is None:
+            return
+        for field, value in self._changed:
+            _write_state(self._posting_path(field, value), {
+                'version': self.version, 'field': field, 'value': value,
+                'users': self._postings[field, value]})
+        self._changed = set()
+        super(LocationIndex, self).save()
+
+    def _scan(self, path):
+        """Return distinct values of each location field of a user.
+
+        Returns:
+            tuple: Dict of sorted distinct values of each field present in
+            the file and list of fields missing in the file.
+
+        """
+        values = {}
+        with _open_csv(path) as user_file:
+            reader = csv.reader(user_file)
+            header = [name.strip() for name in next(reader, [])]
+            columns = [(field, header.index(field))
+                       for field in LOCATION_FIELDS if field in header]
+            for field, _ in columns:
+                values[field] = set()
+            for row in reader:
+                for field, column in columns:
+                    if column < len(row):
+                        values[field].add(row[column])
+        missing = [field for field in LOCATION_FIELDS if field not in values]
+        return (dict((field, sorted(field_values))
+                     for field, field_values in six.iteritems(values)),
+                missing)
+
+    def users(self, field, values):
+        """Return keys of users with any of `values` in `field`.
+
+        Users missing `field` are included, see `LocationIndex`.
+
+        Args:
+            field (str): One of `location_level_1`, `location_level_2` and
+                `antenna_id`.
+            values (list): Values of the field, compared as strings.
+
+        Returns:
+            set: Keys of matching users.
+
+        """
+        if field not in LOCATION_FIELDS:
+            raise ValueError('Field {!r} is not indexed'.format(field))
+        users = set(key for key, missing in six.iteritems(self.entries)
+                    if field in missing)
+        for value in values:
+            for key, fingerprint in six.iteritems(
+                    self._posting(field, str(value))):
+                if self._fingerprints.get(key) == fingerprint:
+                    users.add(key)
+        return users
+
+    def select(self, csv_files, locations):
+        """Return user files with records in the given locations.
+
+        Users new to the index are scanned, and found users whose files
+        changed are rescanned, see `LocationIndex`.
+
+        Args:
+            csv_files (list): Paths of user files of the dataset.
+            locations (dict): Values of each location field, e.g.
+                `{'location_level_1': ['Maharashtra']}`. Users must have
+                one of the values of every field in their records.
+
+        Returns:
+            list: Paths of matching user files.
+
+        """
+        paths = dict((self.key(path), path) for path in csv_files)
+        num_scanned = 0
+        for key, path in six.iteritems(paths):
+            if key not in self.entries:
+                self._index(key, path)
+                num_scanned += 1
+        selected = set(paths)
+        for field, values in six.iteritems(locations):
+            selected &= self.users(field, values)
+        for key in list(selected):
+            path = paths[key]
+            if self._fingerprints[key] == file_fingerprint(path):
+                continue
+            num_scanned += 1
+            if not _has_locations(self._index(key, path), locations):
+                selected.discard(key)
+        if num_scanned:
+            self.save()
+        return [path for path in csv_files if self.key(path) in selected]
+
+
+def slice_records(path, slice_path, start, end, is_sorted=False):
+    """Write records of a user file between `start` and `end`.
+
+    Args:
+        path (str): Path to user file.
+        slice_path (str): Path where header and records in the window are
+            written.
+        start (str): Start of the window, inclusive.
+        end (str): End of the window, inclusive.
+        is_sorted (bool): Records are sorted by time, the window is then
+            found by binary search instead of checking every record.
+
+    Returns:
+        int: Number of records written.
+
+    """
+    with open(path) as user_file:
+        header = user_file.readline()
+        lines = [line for line in user_file if line.strip()]
+    column = _column(next(csv.reader([header])), DATETIME_FIELD)
+
+    def date(line):
+        return next(csv.reader([line]))[column]
+
+    if is_sorted:
+        dates = _LineDates(lines, date)
+        selected = lines[bisect.bisect_left(dates, start):
+                         bisect.bisect_right(dates, end)]
+    else:
+        selected = [line for line in lines if start <= date(line) <= end]
+    with open(slice_path, 'w') as slice_file:
+        slice_file.write(header)
+        slice_file.writelines(selected)
+    return len(selected)
+
+
+class _LineDates(object):
+    """Sequence of dates of lines parsed on access, for binary search."""
+
+    def __init__(self, lines, date):
+        self.lines = lines
+        self.date = date
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __getitem__(self, index):
+        return self.date(self.lines[index])
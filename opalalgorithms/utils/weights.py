@@ -0,0 +1,141 @@
+"""Compact memory mapped store of weights of users.
+
+Weights are stored in a binary file made of a header, offsets of the sorted
+usernames, weights as float64 and the usernames encoded in utf-8. Lookups
+are binary searches over the memory mapped file, hence opening the store
+costs no memory in the process and weights are read only on demand.
+"""
+from __future__ import division, print_function
+import json
+import mmap
+import struct
+
+import six
+
+
+__all__ = ["WeightsStore", "convert_weights", "is_weights_store"]
+
+MAGIC = b'OPALWTS1'
+HEADER = struct.Struct('<8sQ')
+OFFSET = struct.Struct('<Q')
+WEIGHT = struct.Struct('<d')
+
+
+def is_weights_store(path):
+    """Check if file at `path` is a weights store and not a JSON file."""
+    with open(path, 'rb') as weights_file:
+        return weights_file.read(len(MAGIC)) == MAGIC
+
+
+def convert_weights(json_path, store_path):
+    """Convert JSON file of weights to a weights store.
+
+    Args:
+        json_path (str): Path to JSON file with username as key and weight as
+            value.
+        store_path (str): Path where weights store is written.
+
+    Returns:
+        int: Number of users in the store.
+
+    """
+    with open(json_path) as json_file:
+        weights = json.load(json_file)
+    users = sorted(
+        (user.encode('utf-8'), float(weight))
+        for user, weight in six.iteritems(weights))
+    with open(store_path, 'wb') as store:
+        store.write(HEADER.pack(MAGIC, len(users)))
+        offset = 0
+        for user, _ in users:
+            store.write(OFFSET.pack(offset))
+            offset += len(user)
+        store.write(OFFSET.pack(offset))
+        for _, weight in users:
+            store.write(WEIGHT.pack(weight))
+        for user, _ in users:
+            store.write(user)
+    return len(users)
+
+
+class WeightsStore(object):
+    """Read only weights store created by `convert_weights`.
+
+    The file is memory mapped lazily on the first lookup, so the store can be
+    sent to worker processes, each of which maps the file on its own.
+
+    Args:
+        path (str): Path to the weights store.
+
+    """
+
+    def __init__(self, path):
+        """Initialize store."""
+        self.path = path
+        self._file = None
+        self._mmap = None
+        self._count = None
+
+    def __getstate__(self):
+        """Return state without the open file for pickling."""
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        """Restore store from pickled state."""
+        self.__init__(state['path'])
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._mmap = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError('{} is not a weights store'.format(self.path))
+        self._weights_start = HEADER.size + OFFSET.size * (self._count + 1)
+        self._users_start = self._weights_start + WEIGHT.size * self._count
+
+    def __len__(self):
+        """Return number of users in the store."""
+        if self._mmap is None:
+            self._open()
+        return self._count
+
+    def _user(self, index):
+        start, end = struct.unpack_from(
+            '<QQ', self._mmap, HEADER.size + OFFSET.size * index)
+        return self._mmap[self._users_start + start:
+                          self._users_start + end]
+
+    def get(self, user, default=1):
+        """Return weight of the user.
+
+        Args:
+            user (str): Username.
+            default (number): Weight returned if user is not in the store.
+
+        Returns:
+            float: Weight of the user.
+
+        """
+        if self._mmap is None:
+            self._open()
+        key = user.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            mid = (low + high) // 2
+            if self._user(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self._count and self._user(low) == key:
+            return WEIGHT.unpack_from(
+                self._mmap, self._weights_start + WEIGHT.size * low)[0]
+        return default
+
+    def close(self):
+        """Close the memory mapped file."""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+            self._file = None
@@ -0,0 +1,285 @@
+"""Pre-forked sandbox importing bandicoot and algorithm modules only once."""
+from __future__ import division, print_function
+import inspect
+import json
+import multiprocessing.util
+import os
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from codejail.exceptions import SafeExecException
+
+from . import zygote_server
+from .sharedparams import is_shared_ref, resolver_code
+from .staging import stage_file
+
+
+__all__ = ["ZygoteJail", "get_zygote", "release_zygote"]
+
+# warm zygotes of the current process by sandboxing, FSIZE limit and cpus
+_warm_zygotes = {}
+_finalizers = []
+
+
+class ZygoteJail(object):
+    """Sandbox serving all users of a job from a single zygote process.
+
+    The zygote is started once as `OPALALGO_SANDBOX_USER` with the python of
+    `OPALALGO_SANDBOX_VENV`, the same configuration as used by `get_jail`. It
+    imports bandicoot and the algorithm and then forks a child for every
+    user, so each user is still isolated in its own process with its own
+    limits, at the cost of a copy-on-write fork instead of a new interpreter.
+
+    The jail can be used in the following way::
+
+        jail = ZygoteJail(algorithm, params)
+        result = jail(user_csv_file)
+        jail.close()
+
+    A zygote can serve several jobs one after another, see `load` and
+    `get_zygote`.
+
+    Args:
+        algorithm (dict): Dictionary with keys `code` and `className`
+            specifying algorithm code and className.
+        params (dict): Parameters for the request.
+        dev_mode (bool): Should the algorithm run in development mode or
+            production mode.
+        sandboxing (bool): Run the zygote as sandbox user or as current user.
+        limits (dict): Limits of each forked child with keys `CPU`,
+            `REALTIME`, `VMEM` and `FSIZE`. Children may not start processes
+            and only write files up to `FSIZE` bytes, 0 by default.
+
+    """
+
+    def __init__(self, algorithm, params, dev_mode=False, sandboxing=True,
+                 limits=None):
+        """Initialize and start the zygote."""
+        self.sandboxing = sandboxing
+        self.staging_dir = None
+        self.process = None
+        self.ready = False
+        self.warm = False
+        self.start(algorithm, params, dev_mode, limits)
+
+    def _command(self):
+        source = inspect.getsource(zygote_server)
+        if not self.sandboxing:
+            return [sys.executable, '-B', '-c', source]
+        sandbox_env = os.environ.get('OPALALGO_SANDBOX_VENV')
+        sandbox_user = os.environ.get('OPALALGO_SANDBOX_USER')
+        return ['sudo', '-u', sandbox_user,
+                os.path.join(sandbox_env, 'bin', 'python'),
+                '-E', '-B', '-c', source]
+
+    def start(self, algorithm, params, dev_mode=False, limits=None):
+        """Start the zygote and wait until it loaded the job."""
+        # codejail- prefix lets the sandbox profile read staged files
+        self.staging_dir = tempfile.mkdtemp(
+            prefix='codejail-', dir=os.environ.get('OPALALGO_STAGING_DIR'))
+        os.chmod(self.staging_dir, 0o755)
+        self.process = subprocess.Popen(
+            self._command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            cwd=self.staging_dir, universal_newlines=True)
+        try:
+            self.load(algorithm, params, dev_mode, limits)
+        except SafeExecException:
+            self.close()
+            raise
+
+    def load(self, algorithm, params, dev_mode=False, limits=None):
+        """Load a job in the running zygote and wait until it is ready.
+
+        Modules imported for earlier jobs stay imported. The limit of the
+        size of written files is set once for the zygote, by its first job.
+
+        Args:
+            algorithm (dict): Dictionary with keys `code` and `className`.
+            params (dict): Parameters for the request.
+            dev_mode (bool): Whether the algorithm runs in development mode.
+            limits (dict): Limits of each forked child.
+
+        Raises:
+            SafeExecException: If the algorithm could not be loaded.
+
+        """
+        self.algorithm = algorithm
+        self.params = params
+        self.dev_mode = dev_mode
+        self.limits = limits or {}
+        job = {
+            'code': self.algorithm['code'],
+            'className': self.algorithm['className'],
+            'params': self.params,
+            'dev_mode': self.dev_mode,
+            'limits': self.limits,
+        }
+        if any(is_shared_ref(value) for value in self.params.values()):
+            job['shared_params_code'] = resolver_code()
+        self._send(job)
+        # the top level code of the algorithm runs with the user limits
+        timeout = self.limits.get('REALTIME') or self.limits.get('CPU')
+        response = self._receive(timeout)
+        if 'error' in response:
+            raise SafeExecException(
+                "Couldn't start zygote: stderr: {!r}, with status code: "
+                "{}".format(response['error'], response['status']))
+        self.ready = True
+
+    def _send(self, message):
+        try:
+            self.process.stdin.write(json.dumps(message) + '\n')
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            raise self._exited()
+
+    def _exited(self):
+        """Return exception reporting that the zygote exited."""
+        status = self.process.wait()
+        if self.ready:
+            return SafeExecException(
+                "Zygote died, with status code: {}".format(status))
+        return SafeExecException(
+            "Couldn't start zygote, with status code: {}".format(status))
+
+    def _receive(self, timeout=None):
+        if timeout is not None:
+            ready, _, _ = select.select(
+                [self.process.stdout], [], [], timeout)
+            if not ready:
+                self._stop()
+                self.close()
+                raise SafeExecException(
+                    "Zygote not ready after {}s".format(timeout))
+        line = self.process.stdout.readline()
+        if not line:
+            raise self._exited()
+        return json.loads(line)
+
+    def __call__(self, user_csv_file):
+        """Run the algorithm on a user in a forked child of the zygote.
+
+        Args:
+            user_csv_file (string): Path to user csv file.
+
+        Returns:
+            Result of the execution.
+
+        Raises:
+            SafeExecException: If the execution wasn't successful.
+
+        """
+        filename = os.path.basename(user_csv_file)
+        staged_file, _ = stage_file(user_csv_file, self.staging_dir)
+        try:
+            self._send({
+                'directory': self.staging_dir,
+                'username': os.path.splitext(filename)[0]})
+            response = self._receive()
+        finally:
+            os.remove(staged_file)
+        if 'error' in response:
+            raise SafeExecException(
+                "Couldn't execute jailed code: stderr: {!r}, with status "
+                "code: {}".format(response['error'], response['status']))
+        return response['result']
+
+    def _stop(self):
+        """Stop the zygote without waiting for its users."""
+        # sudo relays SIGTERM to the zygote, but not SIGKILL
+        self.process.terminate()
+        deadline = time.time() + 1
+        while self.process.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+    def close(self):
+        """Stop the zygote and remove its staging directory."""
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except (IOError, OSError):
+                pass  # zygote already exited
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+        if self.staging_dir is not None:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.staging_dir = None
+
+
+def _warm_key(sandboxing, limits):
+    """Return key of the warm zygote serving jobs with these settings."""
+    cpus = None
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = tuple(sorted(os.sched_getaffinity(0)))
+    return sandboxing, (limits or {}).get('FSIZE') or 0, cpus
+
+
+def get_zygote(algorithm, params, dev_mode=False, sandboxing=True,
+               limits=None, warm=False):
+    """Return a zygote loaded with a job.
+
+    Warm zygotes are kept running in the current process between jobs, e.g.
+    in the workers of a warm pool, so that later jobs neither start a new
+    sandbox nor import bandicoot again. A warm zygote is only reused by jobs
+    with the same sandboxing, `FSIZE` limit and cpus, and replaced if it
+    died.
+
+    Args:
+        algorithm (dict): Dictionary with keys `code` and `className`.
+        params (dict): Parameters for the request.
+        dev_mode (bool): Whether the algorithm runs in development mode.
+        sandboxing (bool): Run the zygote as sandbox user or as current user.
+        limits (dict): Limits of each forked child, see `ZygoteJail`.
+        warm (bool): Reuse and keep a warm zygote of the current process.
+
+    Returns:
+        ZygoteJail: Zygote to be released with `release_zygote`.
+
+    """
+    if not warm:
+        return ZygoteJail(algorithm, params, dev_mode, sandboxing, limits)
+    key = _warm_key(sandboxing, limits)
+    jail = _warm_zygotes.pop(key, None)
+    if jail is not None and jail.process is not None and \
+            jail.process.poll() is None:
+        try:
+            jail.load(algorithm, params, dev_mode, limits)
+        finally:
+            _warm_zygotes[key] = jail
+        return jail
+    if jail is not None:
+        jail.close()  # died since its last job
+    elif not _finalizers:
+        _finalizers.append(multiprocessing.util.Finalize(
+            None, close_warm_zygotes, exitpriority=0))
+    jail = ZygoteJail(algorithm, params, dev_mode, sandboxing, limits)
+    jail.warm = True
+    _warm_zygotes[key] = jail
+    return jail
+
+
+def release_zygote(jail):
+    """Close a zygote returned by `get_zygote`, unless it is kept warm.
+
+    Warm zygotes which died are closed too.
+
+    """
+    if not jail.warm or jail.process is None or \
+            jail.process.poll() is not None:
+        _warm_zygotes.pop(_warm_key(jail.sandboxing, jail.limits), None)
+        jail.close()
+
+
+def close_warm_zygotes():
+    """Close warm zygotes of the current process."""
+    while _warm_zygotes:
+        _, jail = _warm_zygotes.popitem()
+        jail.close()
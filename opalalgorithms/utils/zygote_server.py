@@ -0,0 +1,255 @@
+"""Zygote server running inside the sandbox.
+
+The server is started by `opalalgorithms.utils.zygote.ZygoteJail` as the
+sandbox user. It imports bandicoot and the modules imported by the algorithm
+once, then forks a child for every user so that each user still runs in its
+own process.
+
+The zygote is started directly with the sandboxed python rather than through
+codejail, so it applies the limits of codejail itself. Code of the algorithm
+only ever runs in forked children, after the child dropped to the limits of
+a codejail process: no new processes, no written files and the configured
+CPU and memory limits. The zygote only compiles the algorithm and imports
+the modules it imports, with the same limits while it starts.
+
+Protocol, one JSON document per line:
+
+    - a line on stdin with keys `code`, `className`, `params`, `dev_mode`
+      and `limits` loads a job, answered with `ready` once the algorithm was
+      loaded in a child, or with `error` and `status`. The first line is a
+      job, and a warm zygote is sent further jobs, keeping modules imported
+      for earlier jobs.
+    - every other line on stdin is a user of the current job with keys
+      `directory` and `username`, answered on stdout with either `result`
+      or `error` and `status`.
+
+Note:
+    This file is executed as a script by the sandboxed python, hence it must
+    not import anything from `opalalgorithms`. Jobs with shared parameters
+    are sent `shared_params_code`, the code of
+    `opalalgorithms.utils.sharedparams.resolver_code`, which resolves them.
+"""
+from __future__ import division, print_function
+import ast
+import json
+import os
+import select
+import signal
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+def _set_limits(limits):
+    """Apply limits of a codejail process on the current process.
+
+    Like codejail, the process may not start new processes and may only
+    write files up to `FSIZE` bytes, 0 by default.
+
+    """
+    if resource is None:
+        return
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    fsize = limits.get('FSIZE') or 0
+    resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+    if limits.get('CPU'):
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (limits['CPU'], limits['CPU']))
+    if limits.get('VMEM'):
+        resource.setrlimit(
+            resource.RLIMIT_AS, (limits['VMEM'], limits['VMEM']))
+
+
+def _set_startup_limits(limits):
+    """Limit the zygote while it imports modules used by the algorithm.
+
+    The zygote may not write files for the whole job. Other limits are soft
+    limits, the CPU limit relative to the CPU time used so far, so that they
+    can be lifted again once the zygote is ready, as the zygote keeps
+    forking children for the whole job. The parent additionally stops a
+    zygote which is not ready in time.
+
+    Returns:
+        list: Previous limits, to be restored with `_restore_limits`.
+
+    """
+    if resource is None:
+        return []
+    fsize = limits.get('FSIZE') or 0
+    resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+    soft_limits = [(resource.RLIMIT_NPROC, 0)]
+    if limits.get('VMEM'):
+        soft_limits.append((resource.RLIMIT_AS, limits['VMEM']))
+    if limits.get('CPU'):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft_limits.append((resource.RLIMIT_CPU, int(
+            usage.ru_utime + usage.ru_stime) + 1 + limits['CPU']))
+    previous = []
+    for limit, soft in soft_limits:
+        old_soft, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        resource.setrlimit(limit, (soft, hard))
+        previous.append((limit, (old_soft, hard)))
+    return previous
+
+
+def _restore_limits(previous):
+    """Restore limits changed by `_set_startup_limits`."""
+    for limit, value in previous:
+        resource.setrlimit(limit, value)
+
+
+def _imported_modules(code):
+    """Return names of modules imported at the top level of `code`."""
+    names = []
+    for node in ast.parse(code).body:
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and \
+                not node.level:
+            names.append(node.module)
+    return names
+
+
+def _preload_modules(code):
+    """Import modules imported by the algorithm, without running it."""
+    for name in _imported_modules(code):
+        try:
+            __import__(name)
+        except Exception:
+            pass  # reported by the child running the algorithm
+
+
+def _load_algorithm(job, code):
+    """Run the top level code of the algorithm and return its class."""
+    namespace = {'__name__': '__opalalgorithm__'}
+    exec(code, namespace)
+    return namespace[job['className']]
+
+
+def _run_child(job, code, request, write_fd):
+    """Run map of the algorithm for a user and write result to `write_fd`.
+
+    Without a `request` the algorithm is only loaded, to report errors in
+    its top level code once.
+
+    """
+    status = 0
+    try:
+        _set_limits(job['limits'])
+        algorithm_class = _load_algorithm(job, code)
+        if request is None:
+            message = json.dumps({'ready': True})
+        else:
+            import bandicoot
+
+            os.chdir(request['directory'])
+            bandicoot_user = bandicoot.read_csv(
+                request['username'], '', describe=job['dev_mode'],
+                warnings=job['dev_mode'])
+            result = algorithm_class().map(job['params'], bandicoot_user)
+            message = json.dumps({'result': result})
+    except BaseException:
+        status = 1
+        message = json.dumps({'error': traceback.format_exc()})
+    with os.fdopen(write_fd, 'w') as output:
+        output.write(message)
+    os._exit(status)
+
+
+def _wait_child(pid, read_fd, realtime_limit):
+    """Read output of child, killing it if it exceeds `realtime_limit`."""
+    chunks = []
+    deadline = time.time() + realtime_limit if realtime_limit else None
+    while True:
+        timeout = None
+        if deadline is not None:
+            timeout = max(deadline - time.time(), 0)
+        ready, _, _ = select.select([read_fd], [], [], timeout)
+        if not ready:
+            os.kill(pid, signal.SIGKILL)
+            break
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        return {'error': 'Killed by signal',
+                'status': -os.WTERMSIG(status)}
+    output = b''.join(chunks).decode('utf-8')
+    try:
+        response = json.loads(output)
+    except ValueError:
+        response = {'error': 'Invalid output {!r}'.format(output)}
+    response['status'] = os.WEXITSTATUS(status)
+    return response
+
+
+def _fork_child(job, code, request):
+    """Run `_run_child` in a forked child and return its response."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _run_child(job, code, request, write_fd)
+    os.close(write_fd)
+    return _wait_child(pid, read_fd, job['limits'].get('REALTIME'))
+
+
+def _load_job(job):
+    """Prepare the zygote for a job and return its compiled code.
+
+    Returns:
+        tuple: Compiled code of the algorithm, None if it could not be
+        loaded, and the response to the job.
+
+    """
+    if job.get('shared_params_code'):
+        namespace = {}
+        exec(job['shared_params_code'], namespace)
+        job['params'] = namespace['resolve_shared_params'](job['params'])
+    previous_limits = _set_startup_limits(job['limits'])
+    try:
+        code = compile(job['code'], '<algorithm>', 'exec')
+        import bandicoot  # noqa: F401
+        import six  # noqa: F401
+        _preload_modules(job['code'])
+    except BaseException:
+        return None, {'error': traceback.format_exc(), 'status': 1}
+    finally:
+        _restore_limits(previous_limits)
+    response = _fork_child(job, code, None)
+    if 'error' in response:
+        return None, response
+    return code, response
+
+
+def main():
+    """Serve jobs and their users read from stdin until stdin is closed."""
+    # keep stdout for protocol, anything printed goes to stderr
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+    job = code = None
+    for line in iter(sys.stdin.readline, ''):
+        request = json.loads(line)
+        if 'code' in request:
+            job = request
+            code, response = _load_job(job)
+        elif code is None:
+            response = {'error': 'No job loaded', 'status': 1}
+        else:
+            response = _fork_child(job, code, request)
+        protocol.write(json.dumps(response) + '\n')
+        protocol.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,7 @@ setup(
     install_requires=[
         'setuptools',
         'six',
+        'numpy',
         'configargparse',
         'requests',
         'codejail',
@@ -0,0 +1,82 @@
+"""Compare scaling of pinned and unpinned mappers with number of threads.
+
+Scaling efficiency is the single thread time divided by `num_threads`
+times the time with `num_threads`, 1.0 being perfect scaling.
+
+python benchmarks/benchmark_affinity.py --data_path data --num_users 200
+"""
+from __future__ import division, print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from opalalgorithms.utils import AlgorithmRunner
+from opalalgorithms.utils.affinity import available_cpus
+
+
+parser = argparse.ArgumentParser(
+    description='Benchmark scaling of mappers pinned to cores.')
+parser.add_argument('--data_path', default='data',
+                    help='Data path with generated csv files.')
+parser.add_argument('--num_users', type=int, default=200,
+                    help='Number of users to be processed.')
+parser.add_argument('--max_threads', type=int, default=None,
+                    help='Largest number of threads, by default the number '
+                    'of cores left after the collector.')
+parser.add_argument('--algorithm', default='sample_algos/algo1.py',
+                    help='Path to algorithm to be run.')
+parser.add_argument('--class_name', default='SampleAlgo1',
+                    help='Class name of the algorithm.')
+
+
+def thread_counts(max_threads):
+    """Return powers of two up to `max_threads`, and `max_threads`."""
+    counts = []
+    num_threads = 1
+    while num_threads < max_threads:
+        counts.append(num_threads)
+        num_threads *= 2
+    return counts + [max_threads]
+
+
+def benchmark(algorithm, data_dir, num_threads, pin_cpus):
+    """Return seconds taken by a multiprocess run."""
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=False, local_reduce=True, pin_cpus=pin_cpus)
+    start_time = time.time()
+    algorunner({'resolution': 'location_level_1'}, data_dir, num_threads)
+    return time.time() - start_time
+
+
+def main(args):
+    """Run benchmark over a subset of users."""
+    algorithm = dict(code=open(args.algorithm).read(),
+                     className=args.class_name)
+    max_threads = args.max_threads or max(1, len(available_cpus()) - 1)
+    data_dir = tempfile.mkdtemp()
+    try:
+        csv_files = sorted(
+            f for f in os.listdir(args.data_path) if f.endswith('.csv'))
+        for filename in csv_files[:args.num_users]:
+            shutil.copy(os.path.join(args.data_path, filename), data_dir)
+        print('{:>7} {:>10} {:>10} {:>10} {:>10}'.format(
+            'threads', 'free s', 'pinned s', 'free eff', 'pinned eff'))
+        single = {}
+        for num_threads in thread_counts(max_threads):
+            times = {}
+            for pin_cpus in (False, True):
+                times[pin_cpus] = benchmark(
+                    algorithm, data_dir, num_threads, pin_cpus)
+                single.setdefault(pin_cpus, times[pin_cpus])
+            print('{:>7} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                num_threads, times[False], times[True],
+                single[False] / (num_threads * times[False]),
+                single[True] / (num_threads * times[True])))
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,94 @@
+"""Compare copying user files into the sandbox against hard links.
+
+Large users are made by repeating records of generated users.
+
+python benchmarks/benchmark_staging.py --data_path data --num_users 20 \
+    --user_size 50
+"""
+from __future__ import division, print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from opalalgorithms.utils import AlgorithmRunner, StagingOptions
+
+
+parser = argparse.ArgumentParser(
+    description='Benchmark staging of user files by copy and hard link.')
+parser.add_argument('--data_path', default='data',
+                    help='Data path with generated csv files.')
+parser.add_argument('--num_users', type=int, default=20,
+                    help='Number of users to be processed.')
+parser.add_argument('--user_size', type=float, default=50,
+                    help='Approximate size of each user file in MB.')
+parser.add_argument('--algorithm', default='sample_algos/algo1.py',
+                    help='Path to algorithm to be run.')
+parser.add_argument('--class_name', default='SampleAlgo1',
+                    help='Class name of the algorithm.')
+
+
+def written_bytes():
+    """Return bytes written to storage by this process, None if unknown."""
+    try:
+        with open('/proc/self/io') as io_file:
+            for line in io_file:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def make_large_users(data_path, data_dir, num_users, user_size):
+    """Write users of `user_size` MB by repeating records of real users."""
+    csv_files = sorted(
+        f for f in os.listdir(data_path) if f.endswith('.csv'))
+    for filename in csv_files[:num_users]:
+        with open(os.path.join(data_path, filename)) as user_file:
+            header = user_file.readline()
+            records = user_file.read()
+        repeats = max(1, int(user_size * 2 ** 20 / max(len(records), 1)))
+        with open(os.path.join(data_dir, filename), 'w') as user_file:
+            user_file.write(header)
+            for _ in range(repeats):
+                user_file.write(records)
+        os.chmod(os.path.join(data_dir, filename), 0o644)
+
+
+def benchmark(algorithm, data_dir, staging):
+    """Return seconds and bytes written by a single process run."""
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=False, multiprocess=False, local_reduce=True,
+        staging=StagingOptions(staging))
+    start_bytes = written_bytes()
+    start_time = time.time()
+    algorunner({'resolution': 'location_level_1'}, data_dir, 1)
+    elapsed = time.time() - start_time
+    end_bytes = written_bytes()
+    if start_bytes is None or end_bytes is None:
+        return elapsed, None
+    return elapsed, end_bytes - start_bytes
+
+
+def main(args):
+    """Run benchmark over large users."""
+    algorithm = dict(code=open(args.algorithm).read(),
+                     className=args.class_name)
+    # data next to the staging directory, hard links need same filesystem
+    data_dir = tempfile.mkdtemp(dir=os.environ.get('OPALALGO_STAGING_DIR'))
+    try:
+        make_large_users(
+            args.data_path, data_dir, args.num_users, args.user_size)
+        for staging in ('copy', 'link'):
+            elapsed, written = benchmark(algorithm, data_dir, staging)
+            print('{:5}: {:.2f}s, {} bytes written'.format(
+                staging, elapsed,
+                'unknown' if written is None else written))
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,57 @@
+"""Compare per-user sandbox against pre-forked zygote sandbox.
+
+python benchmarks/benchmark_zygote.py --data_path data --num_users 50
+"""
+from __future__ import division, print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from opalalgorithms.utils import AlgorithmRunner, ZygoteOptions
+
+
+parser = argparse.ArgumentParser(
+    description='Benchmark zygote sandbox against per-user safe_exec.')
+parser.add_argument('--data_path', default='data',
+                    help='Data path with generated csv files.')
+parser.add_argument('--num_users', type=int, default=50,
+                    help='Number of users to be processed.')
+parser.add_argument('--algorithm', default='sample_algos/algo1.py',
+                    help='Path to algorithm to be run.')
+parser.add_argument('--class_name', default='SampleAlgo1',
+                    help='Class name of the algorithm.')
+
+
+def benchmark(algorithm, data_dir, zygote):
+    """Return seconds per user taken by a single process run."""
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=False, multiprocess=False, local_reduce=True,
+        zygote=ZygoteOptions() if zygote else None)
+    start_time = time.time()
+    algorunner({'resolution': 'location_level_1'}, data_dir, 1)
+    return (time.time() - start_time) / len(os.listdir(data_dir))
+
+
+def main(args):
+    """Run benchmark over a subset of users."""
+    algorithm = dict(code=open(args.algorithm).read(),
+                     className=args.class_name)
+    data_dir = tempfile.mkdtemp()
+    try:
+        csv_files = sorted(
+            f for f in os.listdir(args.data_path) if f.endswith('.csv'))
+        for filename in csv_files[:args.num_users]:
+            shutil.copy(os.path.join(args.data_path, filename), data_dir)
+        safe_exec_time = benchmark(algorithm, data_dir, zygote=False)
+        zygote_time = benchmark(algorithm, data_dir, zygote=True)
+    finally:
+        shutil.rmtree(data_dir)
+    print('safe_exec: {:.4f}s per user'.format(safe_exec_time))
+    print('zygote:    {:.4f}s per user'.format(zygote_time))
+    print('speedup:   {:.2f}x'.format(safe_exec_time / zygote_time))
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
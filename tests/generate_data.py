@@ -5,6 +5,7 @@ python generate_data.py -c config
 from __future__ import division, print_function
 import configargparse
 from opalalgorithms.utils import OPALDataGenerator
+from opalalgorithms.utils.datagenerator import PROFILES
 import time
 import multiprocessing as mp
 import os
@@ -29,6 +30,11 @@ parser.add_argument('--num_antennas_per_user', type=int, required=True,
                     help='Total number of antennas available per user.')
 parser.add_argument('--data_path', required=True,
                     help='Data path where generated csv have to be saved.')
+parser.add_argument('--profile', default='uniform', choices=sorted(PROFILES),
+                    help='Workload profile with distributions of records, '
+                    'antennas and correspondents.')
+parser.add_argument('--seed', type=int, default=None,
+                    help='Seed to generate same data for same user ids.')
 args = parser.parse_args()
 
 
@@ -100,7 +106,8 @@ def generate_data(writing_queue, threadID, opal_data_generator, num_users,
     print("Creating {} users, starting from id "
           "{}".format(num_users, start_id))
     for i in range(num_users):
-        user = (str(start_id + i), opal_data_generator.generate_data())
+        user_id = str(start_id + i)
+        user = (user_id, opal_data_generator.generate_data(user_id))
         writing_queue.put(user)
     elapsed_time = time.time() - start_time
     print("The thread {} is done and it took: {}".format(
@@ -121,5 +128,6 @@ if __name__ == "__main__":
     # TODO: Remove bandicoot extended.
     odg = OPALDataGenerator(args.num_antennas, args.num_antennas_per_user,
                             args.num_records_per_user,
-                            bandicoot_extended=True)
+                            bandicoot_extended=True, profile=args.profile,
+                            seed=args.seed)
     generate(odg, args.num_users, args.num_threads, args.offset)
@@ -0,0 +1,24 @@
+"""Sample algorithm reporting the cpus on which it runs."""
+from __future__ import division, print_function
+import os
+
+from opalalgorithms.core import OPALAlgorithm
+
+
+class SampleAlgoAffinity(OPALAlgorithm):
+    """Report cpus of the process running map."""
+
+    def __init__(self):
+        """Initialize algorithm."""
+        super(SampleAlgoAffinity, self).__init__()
+
+    def map(self, params, bandicoot_user):
+        """Return key naming the cpus the sandbox may run on.
+
+        Args:
+            params (dict): Request parameters.
+            bandicoot_user (bandicoot.core.User): Bandicoot user object.
+
+        """
+        cpus = sorted(os.sched_getaffinity(0))
+        return {'cpus_' + '_'.join(str(cpu) for cpu in cpus): 1}
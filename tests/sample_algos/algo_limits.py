@@ -0,0 +1,37 @@
+"""Sample algorithm exceeding limits of the sandbox for some users."""
+from __future__ import division, print_function
+from opalalgorithms.core import OPALAlgorithm
+
+
+class SampleAlgo1(OPALAlgorithm):
+    """Calculate population density, or exceed limits for some users."""
+
+    def __init__(self):
+        """Initialize population density."""
+        super(SampleAlgo1, self).__init__()
+
+    def map(self, params, bandicoot_user):
+        """Get home of the bandicoot user, unless the user is greedy.
+
+        Args:
+            params (dict): Request parameters, `greedy_users` are names of
+                users for which the algorithm spins forever if `mode` is
+                `spin`, allocates `size` bytes if `mode` is `allocate`, or
+                removes records of the user and fails if `mode` is
+                `corrupt`.
+            bandicoot_user (bandicoot.core.User): Bandicoot user object.
+
+        """
+        if bandicoot_user.name in params['greedy_users']:
+            if params['mode'] == 'spin':
+                while True:
+                    pass
+            if params['mode'] == 'corrupt':
+                bandicoot_user.records = []
+                raise ValueError('Corrupted user')
+            data = bytearray(params['size'])
+            return {'size': len(data)}
+        home = bandicoot_user.recompute_home()
+        if not home:
+            return None
+        return {getattr(home, params["resolution"]): 1}
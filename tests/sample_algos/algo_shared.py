@@ -0,0 +1,26 @@
+"""Sample algorithm using a lookup table from shared parameters."""
+from __future__ import division, print_function
+from opalalgorithms.core import OPALAlgorithm
+
+
+class SampleAlgoShared(OPALAlgorithm):
+    """Calculate population density by region of home."""
+
+    def __init__(self):
+        """Initialize population density."""
+        super(SampleAlgoShared, self).__init__()
+
+    def map(self, params, bandicoot_user):
+        """Get region of home of the bandicoot user.
+
+        Args:
+            params (dict): Request parameters with `regions` mapping
+                locations to regions.
+            bandicoot_user (bandicoot.core.User): Bandicoot user object.
+
+        """
+        home = bandicoot_user.recompute_home()
+        if not home:
+            return None
+        location = getattr(home, params["resolution"])
+        return {params["regions"].get(location, "unknown"): 1}
@@ -0,0 +1,36 @@
+"""Test placement of processes on CPU cores."""
+from __future__ import division, print_function
+
+from opalalgorithms.utils.affinity import (
+    available_cpus, numa_nodes, parse_cpulist, plan_affinity)
+
+
+def test_parse_cpulist():
+    """Check that ranges and single cpus are parsed."""
+    assert parse_cpulist('0-3,8,10-11\n') == [0, 1, 2, 3, 8, 10, 11]
+
+
+def test_plan_affinity_numa():
+    """Check that mappers stay within a node and collector has its core."""
+    nodes = [list(range(0, 8)), list(range(8, 16))]
+    collector_cpus, mapper_cpus = plan_affinity(6, nodes)
+    assert collector_cpus == [15]
+    assert len(mapper_cpus) == 6
+    assert all(set(cpus) <= set(nodes[0]) or set(cpus) <= set(nodes[1])
+               for cpus in mapper_cpus)
+    used = [cpu for cpus in mapper_cpus for cpu in cpus]
+    assert len(used) == len(set(used)) == 15
+
+
+def test_plan_affinity_few_cpus():
+    """Check that mappers share cores when there are fewer than mappers."""
+    collector_cpus, mapper_cpus = plan_affinity(4, [[0, 1, 2]])
+    assert collector_cpus == [2]
+    assert mapper_cpus == [[0], [1], [0], [1]]
+    assert plan_affinity(2, [[0]]) == ([0], [[0], [0]])
+
+
+def test_numa_nodes():
+    """Check that nodes cover the available cpus."""
+    assert sorted(cpu for node in numa_nodes() for cpu in node) == \
+        available_cpus()
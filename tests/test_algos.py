@@ -1,13 +1,26 @@
 """Test population density algorithm."""
 from __future__ import division, print_function
+import json
+import multiprocessing as mp
+import os
 import subprocess
 import time
 import signal
 
 import codejail
+from codejail.exceptions import SafeExecException
 import pytest
 
-from opalalgorithms.utils import AlgorithmRunner
+from opalalgorithms.utils import (
+    AlgorithmRunner, JSONLinesSink, Limits, ProfileOptions, RecyclingOptions,
+    ResultCache, StagingOptions, UserSelection, ZygoteOptions,
+    convert_weights)
+from opalalgorithms.utils import algorithmrunner
+from opalalgorithms.utils.affinity import affinity_supported, plan_affinity
+from opalalgorithms.utils.algorithmrunner import is_limit_exceeded
+from opalalgorithms.utils.prefetch import FilePrefetcher
+from opalalgorithms.utils.staging import FileStager
+from opalalgorithms.utils.userindex import slice_records
 
 
 NUM_THREADS = 3
@@ -33,6 +46,55 @@ def run_algo(algorithm_filename, params, dev_mode=True,
     return algorunner(params, DATA_PATH, NUM_THREADS)
 
 
+def assert_same_results(result, expected):
+    """Assert that two runs gave the same results, in any order."""
+    assert sorted(map(str, result)) == sorted(map(str, expected))
+
+
+class RecordingPrefetcher(FilePrefetcher):
+    """Prefetcher logging how many files it read ahead at most.
+
+    Mappers run in other processes, hence the number is appended to
+    `log_path` when the prefetcher is closed.
+    """
+
+    log_path = None
+
+    def __init__(self, *args, **kwargs):
+        """Initialize prefetcher."""
+        super(RecordingPrefetcher, self).__init__(*args, **kwargs)
+        self.max_ahead = 0
+
+    def release(self, path):
+        """Release file and record files still read ahead."""
+        super(RecordingPrefetcher, self).release(path)
+        self.max_ahead = max(self.max_ahead, self.num_files)
+
+    def close(self):
+        """Log files read ahead and stop reader threads."""
+        with open(self.log_path, 'a') as log_file:
+            log_file.write('{}\n'.format(self.max_ahead))
+        super(RecordingPrefetcher, self).close()
+
+
+class RecordingStager(FileStager):
+    """Stager logging the numbers of files it linked and copied."""
+
+    log_path = None
+
+    def close(self):
+        """Log staged files and remove the staging directory."""
+        with open(self.log_path, 'a') as log_file:
+            log_file.write('{} {}\n'.format(self.num_linked, self.num_copied))
+        super(RecordingStager, self).close()
+
+
+def read_log(path):
+    """Return lines logged by recording classes, as lists of integers."""
+    with open(path) as log_file:
+        return [list(map(int, line.split())) for line in log_file]
+
+
 def test_algo_multiprocess_sandboxing_success():
     """Test that algorithm runner runs successfully.
 
@@ -74,3 +136,522 @@ def test_interrupt_works():
     time.sleep(1)
     poll = proc.poll()
     assert poll is not None
+
+
+def test_algo_local_reduce():
+    """Test that results are reduced locally in the collector."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorunner = AlgorithmRunner(algorithm, dev_mode=True, local_reduce=True)
+    reducer = algorunner(params, DATA_PATH, NUM_THREADS)
+    summary = reducer.summary()
+    assert sum(value['count'] for value in summary.values()) > 0
+
+
+def test_algo_result_cache(tmpdir, monkeypatch):
+    """Test that rerun with a result cache reuses results of users."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    result_cache = ResultCache(str(tmpdir))
+    computed = []
+    process_user_csv = algorithmrunner.process_user_csv
+
+    def counting_process_user_csv(params, user_csv_file, *args, **kwargs):
+        computed.append(user_csv_file)
+        return process_user_csv(params, user_csv_file, *args, **kwargs)
+
+    monkeypatch.setattr(
+        algorithmrunner, 'process_user_csv', counting_process_user_csv)
+    num_users = len(os.listdir(DATA_PATH))
+
+    def run(algorithm, params):
+        del computed[:]
+        return AlgorithmRunner(
+            algorithm, dev_mode=True, multiprocess=False,
+            result_cache=result_cache)(params, DATA_PATH, NUM_THREADS)
+
+    result = run(algorithm, params)
+    assert len(computed) == num_users
+    cached_result = run(algorithm, params)
+    assert computed == []
+    assert_same_results(result, cached_result)
+    # changes in params or code of the algorithm invalidate entries
+    run(algorithm, dict(params, resolution='location_level_2'))
+    assert len(computed) == num_users
+    run(dict(algorithm, code=algorithm['code'] + '\n'), params)
+    assert len(computed) == num_users
+    run(algorithm, params)
+    assert computed == []
+
+
+def test_algo_report_slowest_users():
+    """Test that slowest users are reported and no user is skipped."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=True, limits=Limits(realtime=15), num_slowest=5)
+    algorunner(params, DATA_PATH, NUM_THREADS)
+    assert len(algorunner.report.slowest_users) == 5
+    assert algorunner.report.skipped_users == []
+
+
+@pytest.mark.parametrize('mode, limits', [
+    ('spin', Limits(cpu=1)),
+    ('allocate', Limits(memory=2 ** 31))])
+def test_algo_limits_skip_users(tmpdir, mode, limits):
+    """Test that users exceeding limits are skipped and others are not."""
+    greedy_users = ['0', '1']
+    data_dir = tmpdir.mkdir('data')
+    for filename in os.listdir(DATA_PATH):
+        if os.path.splitext(filename)[0] not in greedy_users:
+            data_dir.join(filename).write(
+                open(os.path.join(DATA_PATH, filename)).read())
+    params = dict(resolution='location_level_1', greedy_users=greedy_users,
+                  mode=mode, size=2 ** 32)
+    algorunner = AlgorithmRunner(
+        get_algo('sample_algos/algo_limits.py'), dev_mode=True,
+        multiprocess=False, limits=limits)
+    result = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert sorted(
+        user for user, _ in algorunner.report.skipped_users) == greedy_users
+    assert_same_results(result, AlgorithmRunner(
+        get_algo('sample_algos/algo1.py'), dev_mode=True)(
+            params, str(data_dir), NUM_THREADS))
+
+
+def test_algo_failure_warm_pool():
+    """Test that a failing job does not leak workers of a warm pool."""
+    params = dict(resolution='location_level_1', greedy_users=['0'],
+                  mode='corrupt')
+    pool = mp.Pool(processes=NUM_THREADS + 1)
+    manager = mp.Manager()
+    try:
+        # every leaked collector would keep one of the workers busy
+        for _ in range(NUM_THREADS + 1):
+            with pytest.raises(SafeExecException):
+                AlgorithmRunner(
+                    get_algo('sample_algos/algo_limits.py'), dev_mode=True,
+                    pool=pool, manager=manager)(
+                        params, DATA_PATH, NUM_THREADS)
+        result = AlgorithmRunner(
+            get_algo('sample_algos/algo1.py'), dev_mode=True, pool=pool,
+            manager=manager)(params, DATA_PATH, NUM_THREADS)
+        assert_same_results(result, run_algo('sample_algos/algo1.py', params))
+    finally:
+        pool.terminate()
+        pool.join()
+        manager.shutdown()
+
+
+def test_is_limit_exceeded():
+    """Test that codejail errors of exceeded limits are recognized."""
+    limits = {'CPU': 1, 'REALTIME': 2, 'VMEM': 2 ** 30}
+    template = ("Couldn't execute jailed code: stdout: b'', stderr: {!r} "
+                "with status code: {}")
+    memory_error = ('Traceback (most recent call last):\n  File "jailed_code"'
+                    ', line 3, in <module>\nMemoryError\n')
+    value_error = ('Traceback (most recent call last):\n  File "jailed_code"'
+                   ', line 3, in <module>\nValueError: bad value\n')
+    exceeded = [
+        SafeExecException(template.format(b'', -signal.SIGKILL)),
+        SafeExecException(template.format(b'', -signal.SIGXCPU)),
+        SafeExecException(template.format(memory_error.encode(), 1))]
+    for exc in exceeded:
+        assert is_limit_exceeded(exc, 0.5, limits)
+    failed = SafeExecException(template.format(value_error.encode(), 1))
+    assert not is_limit_exceeded(failed, 0.5, limits)
+    assert is_limit_exceeded(failed, 2.5, limits)
+    assert not is_limit_exceeded(SafeExecException(
+        template.format(b'', -signal.SIGSEGV)), 0.5, limits)
+
+
+def test_algo_zygote_success():
+    """Test that zygote sandbox gives same results as per-user sandbox."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    results = []
+    for zygote in [None, ZygoteOptions()]:
+        algorunner = AlgorithmRunner(algorithm, dev_mode=True, zygote=zygote)
+        results.append(algorunner(params, DATA_PATH, NUM_THREADS))
+    assert_same_results(results[0], results[1])
+
+
+def test_algo_estimate():
+    """Test that cost of a run is estimated from a sample of users."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorunner = AlgorithmRunner(algorithm, dev_mode=True)
+    estimate = algorunner.estimate(params, DATA_PATH, sample_size=8)
+    assert estimate['num_users'] == len(os.listdir(DATA_PATH))
+    assert estimate['num_sampled'] == 8
+    assert estimate['cpu_seconds'] > 0
+    assert estimate['wall_seconds'] == pytest.approx(
+        estimate['total_user_seconds'] / estimate['num_threads'])
+    assert estimate['recommended_num_threads'] >= 1
+    assert estimate['recommended_limits']['cpu'] >= 1
+    assert estimate['recommended_limits']['realtime'] >= 1
+
+
+def test_algo_profile():
+    """Test that profiles of sampled users are aggregated in dev_mode."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=True,
+        profile=ProfileOptions(sample=0.5, memory=True))
+    result = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert type(result) is list
+    profile = algorunner.report.profile
+    assert 0 < profile.num_users < len(os.listdir(DATA_PATH))
+    assert any(function[2] == 'recompute_home'
+               for function in profile.functions)
+
+
+def test_algo_weights_store(tmpdir):
+    """Test that weights from a weights store scale results."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    users = [os.path.splitext(f)[0] for f in os.listdir(DATA_PATH)]
+    json_path = str(tmpdir.join('weights.json'))
+    store_path = str(tmpdir.join('weights.bin'))
+    with open(json_path, 'w') as json_file:
+        json.dump(dict((user, 2) for user in users), json_file)
+    convert_weights(json_path, store_path)
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorunner = AlgorithmRunner(algorithm, dev_mode=True)
+    result = algorunner(params, DATA_PATH, NUM_THREADS, store_path)
+    assert all(value == 2 for res in result for value in res.values())
+
+
+def test_algo_fused_success():
+    """Test that several algorithms are run over the data in one pass."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    other_algorithm = dict(
+        algorithm, params=dict(sample=0.2, resolution='location_level_2'))
+    algorunner = AlgorithmRunner(
+        [algorithm, other_algorithm], dev_mode=True)
+    results = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert len(results) == 2
+    assert_same_results(
+        results[0], run_algo('sample_algos/algo1.py', params))
+    assert len(results[1]) == len(results[0])
+
+
+def test_algo_fused_isolation(tmpdir):
+    """Test that an algorithm failing on a user does not affect others."""
+    greedy_users = ['0', '1']
+    algorithm = get_algo('sample_algos/algo_limits.py')
+    algorithms = [
+        dict(algorithm, params=dict(
+            greedy_users=greedy_users, mode=mode, size=2 ** 32,
+            resolution='location_level_1'))
+        for mode in ('corrupt', 'spin', 'allocate')]
+    params = dict(resolution='location_level_1')
+    algorithms.append(get_algo('sample_algos/algo1.py'))
+    algorunner = AlgorithmRunner(
+        algorithms, dev_mode=True, multiprocess=False,
+        limits=Limits(cpu=1, memory=2 ** 31))
+    results = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert algorunner.report.skipped_users == []
+    assert_same_results(
+        results[3], run_algo('sample_algos/algo1.py', params))
+    data_dir = tmpdir.mkdir('data')
+    for filename in os.listdir(DATA_PATH):
+        if os.path.splitext(filename)[0] not in greedy_users:
+            data_dir.join(filename).write(
+                open(os.path.join(DATA_PATH, filename)).read())
+    expected = AlgorithmRunner(
+        get_algo('sample_algos/algo1.py'), dev_mode=True)(
+            params, str(data_dir), NUM_THREADS)
+    for result in results[:3]:
+        assert_same_results(result, expected)
+
+
+def test_algo_fused_result_cache(tmpdir, monkeypatch):
+    """Test that users on which an algorithm failed are not cached."""
+    greedy_users = ['0', '1']
+    algorithms = [
+        dict(get_algo('sample_algos/algo_limits.py'), params=dict(
+            greedy_users=greedy_users, mode='corrupt',
+            resolution='location_level_1')),
+        get_algo('sample_algos/algo1.py')]
+    params = dict(resolution='location_level_1')
+    computed = []
+    process_user_csv_fused = algorithmrunner.process_user_csv_fused
+
+    def counting_process_user_csv_fused(params, user_csv_file, *args,
+                                        **kwargs):
+        computed.append(os.path.splitext(os.path.basename(
+            user_csv_file))[0])
+        return process_user_csv_fused(
+            params, user_csv_file, *args, **kwargs)
+
+    monkeypatch.setattr(algorithmrunner, 'process_user_csv_fused',
+                        counting_process_user_csv_fused)
+    result_cache = ResultCache(str(tmpdir))
+    for _ in range(2):
+        del computed[:]
+        results = AlgorithmRunner(
+            algorithms, dev_mode=True, multiprocess=False,
+            result_cache=result_cache)(params, DATA_PATH, NUM_THREADS)
+        assert len(results[1]) == len(os.listdir(DATA_PATH))
+    assert sorted(computed) == greedy_users
+
+
+def test_algo_prefetch(tmpdir, monkeypatch):
+    """Test that files are read ahead without changing the result."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    expected = run_algo('sample_algos/algo1.py', params)
+    monkeypatch.setattr(algorithmrunner, 'FilePrefetcher',
+                        RecordingPrefetcher)
+    for prefetch_threads in (0, 1):
+        log_path = str(tmpdir.join('prefetch{}.log'.format(prefetch_threads)))
+        monkeypatch.setattr(RecordingPrefetcher, 'log_path', log_path)
+        algorunner = AlgorithmRunner(
+            algorithm, dev_mode=True, staging=StagingOptions(
+                prefetch=4, prefetch_threads=prefetch_threads))
+        result = algorunner(params, DATA_PATH, NUM_THREADS)
+        assert_same_results(result, expected)
+        max_ahead = [line[0] for line in read_log(log_path)]
+        assert len(max_ahead) == NUM_THREADS
+        # upcoming files were read while the current user was processed
+        assert 0 < max(max_ahead) <= 4
+
+
+def test_algo_sink(tmpdir):
+    """Test that results are written to a local sink."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    path = str(tmpdir.join('results.jsonl'))
+    algorunner = AlgorithmRunner(algorithm, sink=JSONLinesSink(path))
+    sink = algorunner(params, DATA_PATH, NUM_THREADS)
+    with open(path) as result_file:
+        results = [json.loads(line) for line in result_file]
+    assert sink.num_results == len(results)
+    assert_same_results(
+        results, run_algo('sample_algos/algo1.py', params))
+
+
+def test_algo_shared_params():
+    """Test that algorithms look up tables from shared parameters."""
+    users = [os.path.splitext(f)[0] for f in os.listdir(DATA_PATH)]
+    result = run_algo('sample_algos/algo1.py', dict(
+        sample=0.2, resolution='location_level_1'))
+    locations = set(key for res in result for key in res)
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1',
+        regions=dict((location, 'region') for location in locations))
+    algorithm = get_algo(
+        'sample_algos/algo_shared.py', class_name='SampleAlgoShared')
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=True, shared_params=['regions'])
+    result = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert len(result) == len(users)
+    assert all(res == {'region': 1} for res in result)
+
+
+def test_algo_online():
+    """Test that online aggregation estimates totals of a complete run."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    totals = {}
+    for res in run_algo('sample_algos/algo1.py', params):
+        for key, value in res.items():
+            totals[key] = totals.get(key, 0) + value
+    algorithm = get_algo('sample_algos/algo1.py')
+    for multiprocess in (True, False):
+        published = []
+        algorunner = AlgorithmRunner(
+            algorithm, dev_mode=True, multiprocess=multiprocess)
+        aggregator = algorunner.run_online(
+            params, DATA_PATH, NUM_THREADS, relative_error=None,
+            callback=published.append, seed=0)
+        assert published and not aggregator.stopped_early
+        assert aggregator.num_users == aggregator.population
+        assert dict((key, stats['estimate']) for key, stats in
+                    aggregator.estimates().items()) == pytest.approx(totals)
+        aggregator = algorunner.run_online(
+            params, DATA_PATH, NUM_THREADS, time_budget=0,
+            publish_interval=0, seed=0)
+        assert aggregator.stopped_early
+        assert aggregator.num_users < aggregator.population
+
+
+def test_algo_vocabulary():
+    """Test that results of fixed vocabulary are summed as arrays."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    totals = {}
+    for res in run_algo('sample_algos/algo1.py', params):
+        for key, value in res.items():
+            totals[key] = totals.get(key, 0) + value
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorithm['vocabulary'] = sorted(totals) + ['unused']
+    for multiprocess in (True, False):
+        algorunner = AlgorithmRunner(
+            algorithm, dev_mode=True, multiprocess=multiprocess)
+        reducer = algorunner(params, DATA_PATH, NUM_THREADS)
+        assert reducer.totals() == totals
+        assert reducer.num_users == sum(totals.values())
+
+
+def test_algo_staging_link(tmpdir, monkeypatch):
+    """Test that user files staged through hard links give same results."""
+    params = dict(
+        sample=0.2,
+        resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    expected = run_algo('sample_algos/algo1.py', params)
+    monkeypatch.setattr(algorithmrunner, 'FileStager', RecordingStager)
+    for multiprocess in (True, False):
+        log_path = str(tmpdir.join('staging{}.log'.format(multiprocess)))
+        monkeypatch.setattr(RecordingStager, 'log_path', log_path)
+        algorunner = AlgorithmRunner(
+            algorithm, dev_mode=True, multiprocess=multiprocess,
+            staging=StagingOptions('link'))
+        result = algorunner(params, DATA_PATH, NUM_THREADS)
+        assert_same_results(result, expected)
+        # every user file was linked, none was copied
+        num_linked, num_copied = map(sum, zip(*read_log(log_path)))
+        assert num_linked == algorunner.num_users
+        assert num_copied == 0
+
+
+def test_algo_time_window(tmpdir):
+    """Test that a time window gives results of the records in it."""
+    params = dict(resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    window = ('2016-01-05 00:00:00', '2016-01-05 23:59:59')
+    sliced_dir = tmpdir.mkdir('sliced')
+    num_users = 0
+    for filename in os.listdir(DATA_PATH):
+        if filename.endswith('.csv'):
+            num_users += 1
+            slice_records(os.path.join(DATA_PATH, filename),
+                          str(sliced_dir.join(filename)), *window)
+    expected = AlgorithmRunner(algorithm, dev_mode=True)(
+        params, str(sliced_dir), NUM_THREADS)
+    index_path = str(tmpdir.join('time_index.json.gz'))
+    for multiprocess in (True, False):
+        algorunner = AlgorithmRunner(
+            algorithm, dev_mode=True, multiprocess=multiprocess,
+            selection=UserSelection(
+                time_window=window, time_index=index_path))
+        result = algorunner(params, DATA_PATH, NUM_THREADS)
+        assert 0 < algorunner.num_users < num_users
+        assert_same_results(result, expected)
+
+
+def test_algo_locations(tmpdir):
+    """Test that a run restricted to a region runs only its users."""
+    params = dict(resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    region_dir = tmpdir.mkdir('region')
+    for filename in os.listdir(DATA_PATH):
+        path = os.path.join(DATA_PATH, filename)
+        if filename.endswith('.csv') and ',Maharashtra,' in open(path).read():
+            region_dir.join(filename).write(open(path).read())
+    expected = AlgorithmRunner(algorithm, dev_mode=True)(
+        params, str(region_dir), NUM_THREADS)
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=True, selection=UserSelection(
+            locations={'location_level_1': ['Maharashtra']},
+            location_index=str(tmpdir.join('location_index'))))
+    result = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert algorunner.num_users == len(region_dir.listdir())
+    assert_same_results(result, expected)
+
+
+def test_algo_worker_recycling():
+    """Test that recycled mappers lose no users."""
+    params = dict(resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    expected = run_algo('sample_algos/algo1.py', params)
+    algorunner = AlgorithmRunner(
+        algorithm, dev_mode=True, staging=StagingOptions(prefetch=4),
+        recycling=RecyclingOptions(max_users=10))
+    result = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert_same_results(result, expected)
+    report = algorunner.report
+    assert report.num_recycled >= 100 // 10 - NUM_THREADS
+    assert report.num_replaced <= report.num_recycled
+    assert len(report.memory) == NUM_THREADS + report.num_replaced + 1
+    assert report.memory[-1].name == 'collector'
+    assert all(usage.peak > 0 for usage in report.memory)
+    assert 'collector' in report.format_memory()
+    summary = report.summary()
+    assert summary['num_recycled'] == report.num_recycled
+    assert [usage['name'] for usage in summary['memory']].count(
+        'mapper') == NUM_THREADS + report.num_replaced
+
+
+def test_algo_recycling_warm_pool():
+    """Test that mappers of a warm pool are not recycled above max_rss."""
+    params = dict(resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    pool = mp.Pool(NUM_THREADS + 1)
+    try:
+        with pytest.warns(RuntimeWarning):
+            algorunner = AlgorithmRunner(
+                algorithm, dev_mode=True, pool=pool,
+                recycling=RecyclingOptions(max_rss=1))
+        result = algorunner(params, DATA_PATH, NUM_THREADS)
+    finally:
+        pool.close()
+        pool.join()
+    assert_same_results(result, run_algo('sample_algos/algo1.py', params))
+    assert algorunner.report.num_recycled == 0
+
+
+def test_algo_pin_cpus():
+    """Test that pinned mappers give same results and run on their cpus."""
+    params = dict(resolution='location_level_1')
+    algorithm = get_algo('sample_algos/algo1.py')
+    algorunner = AlgorithmRunner(algorithm, dev_mode=True, pin_cpus=True)
+    result = algorunner(params, DATA_PATH, NUM_THREADS)
+    assert_same_results(result, run_algo('sample_algos/algo1.py', params))
+    if not affinity_supported():
+        return
+    algorithm = dict(code=open('sample_algos/algo_affinity.py').read(),
+                     className='SampleAlgoAffinity')
+    result = AlgorithmRunner(algorithm, dev_mode=True, pin_cpus=True)(
+        params, DATA_PATH, NUM_THREADS)
+    _, mapper_cpus = plan_affinity(NUM_THREADS)
+    planned = set('cpus_' + '_'.join(str(cpu) for cpu in sorted(cpus))
+                  for cpus in mapper_cpus)
+    assert len(result) == 100
+    assert set(key for res in result for key in res) <= planned
+
+
+def test_algo_pin_cpus_unsupported(monkeypatch):
+    """Test that pinning without support for it warns."""
+    monkeypatch.setattr(algorithmrunner, 'affinity_supported', lambda: False)
+    with pytest.warns(RuntimeWarning):
+        AlgorithmRunner(get_algo('sample_algos/algo1.py'), pin_cpus=True)
+    with pytest.warns(RuntimeWarning):
+        AlgorithmRunner(get_algo('sample_algos/algo1.py'), pin_cpus=True,
+                        multiprocess=False)
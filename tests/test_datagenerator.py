@@ -0,0 +1,54 @@
+"""Test generation of synthetic data."""
+from __future__ import division, print_function
+
+import pytest
+
+from opalalgorithms.utils.datagenerator import OPALDataGenerator
+
+
+def records(data):
+    """Return records of generated data, without header."""
+    return [line.split(',') for line in data.splitlines()[1:]]
+
+
+def test_uniform_profile():
+    """Check that users have the same number of records by default."""
+    generator = OPALDataGenerator(100, 10, 50)
+    assert all(len(records(generator.generate_data(i))) == 50
+               for i in range(5))
+
+
+def test_seed():
+    """Check that data depends only on seed and user id."""
+    generator = OPALDataGenerator(100, 10, 50, profile='realistic', seed=3)
+    assert generator.generate_data('7') == OPALDataGenerator(
+        100, 10, 50, profile='realistic', seed=3).generate_data('7')
+    assert generator.generate_data('7') != generator.generate_data('8')
+
+
+def test_skewed_profile():
+    """Check that records, antennas and hours are skewed."""
+    generator = OPALDataGenerator(
+        100, 10, 100, profile='heavy_tail', seed=1)
+    users = [records(generator.generate_data(i)) for i in range(200)]
+    sizes = sorted(len(user) for user in users)
+    assert sizes[-1] > 5 * sizes[len(sizes) // 2]
+    antennas = {}
+    hours = [0] * 24
+    for user in users:
+        for record in user:
+            antennas[record[5]] = antennas.get(record[5], 0) + 1
+            hours[int(record[3][11:13])] += 1
+        assert [record[3] for record in user] == sorted(
+            record[3] for record in user)
+    counts = sorted(antennas.values(), reverse=True)
+    assert counts[0] > 10 * counts[len(counts) // 2]
+    assert sum(hours[18:21]) > 5 * sum(hours[2:5])
+
+
+def test_unknown_profile():
+    """Check that unknown profiles are rejected."""
+    with pytest.raises(ValueError):
+        OPALDataGenerator(100, 10, 50, profile='bursty')
+    with pytest.raises(ValueError):
+        OPALDataGenerator(100, 10, 50, profile={'records_exponent': 0.5})
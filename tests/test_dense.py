@@ -0,0 +1,67 @@
+"""Test array backed results with a fixed vocabulary."""
+from __future__ import division, print_function
+import pickle
+
+from opalalgorithms.utils.algorithmrunner import ResultProcessor
+from opalalgorithms.utils.dense import DenseReducer
+from opalalgorithms.utils.reducer import StreamingReducer
+
+
+def test_dense_reducer_validation():
+    """Check that only numeric results of the vocabulary are valid."""
+    reducer = DenseReducer(['a', 'b', 'c'])
+    assert reducer.is_valid([1, 2.5, 0])
+    assert reducer.is_valid({'a': 1})
+    assert not reducer.is_valid([1, 2])
+    assert not reducer.is_valid(['1', 2, 3])
+    assert not reducer.is_valid([1, 2, float('nan')])
+    assert not reducer.is_valid([[1], [2], [3]])
+    assert not reducer.is_valid({'d': 1})
+    assert not reducer.is_valid({'a': 'x'})
+
+
+def test_dense_reducer_sum():
+    """Check that scaled results of mappers are summed and merged."""
+    reducers = [DenseReducer(['a', 'b', 'c']) for _ in range(2)]
+    assert reducers[0].add([1, 0, 2], scaler=2)
+    assert reducers[1].add({'b': 3})
+    assert not reducers[1].add({'d': 1})
+    reducer = DenseReducer(['a', 'b', 'c'])
+    for partial in reducers:
+        reducer.merge(pickle.loads(pickle.dumps(partial)))
+    assert reducer.num_users == 2
+    assert reducer.totals() == {'a': 2, 'b': 3, 'c': 4}
+    assert reducer.summary()['c'] == {'sum': 4, 'count': 1, 'mean': 4}
+    assert reducer.summary()['b'] == {'sum': 3, 'count': 2, 'mean': 1.5}
+
+
+def test_dense_reducer_matches_streaming_reducer():
+    """Check that counts and means match those of the streaming reducer."""
+    results = [{'a': 0, 'b': 2}, {'a': 4}, {'b': 0}, {'c': 0}]
+    dense = DenseReducer(['a', 'b', 'c', 'd'])
+    streaming = StreamingReducer()
+    for result in results:
+        assert dense.add(result)
+        streaming(result)
+    expected = dict(
+        (key, dict((name, stats[name]) for name in ('sum', 'count', 'mean')))
+        for key, stats in streaming.summary().items())
+    assert dense.summary() == expected
+    assert set(dense.totals()) == {'a', 'b', 'c'}
+
+
+def test_dense_totals_posted(monkeypatch):
+    """Check that totals are sent as a single update outside dev_mode."""
+    updates = []
+    monkeypatch.setattr(
+        ResultProcessor, '_send_request',
+        lambda self, result: updates.append(result))
+    processor = ResultProcessor({}, False, vocabulary=['a', 'b'])
+    processor([1, 2], scaler=2)
+    processor({'b': 1})
+    assert processor.get_result() is True
+    assert updates == [{'a': 2, 'b': 5}]
+    processor = ResultProcessor({}, True, vocabulary=['a', 'b'])
+    processor([1, 2])
+    assert processor.get_result().totals() == {'a': 1, 'b': 2}
+    assert updates == [{'a': 2, 'b': 5}]
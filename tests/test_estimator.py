@@ -0,0 +1,46 @@
+"""Test extrapolation of the cost of a run and recommended settings."""
+from __future__ import division, print_function
+
+import pytest
+
+from opalalgorithms.utils.estimator import CostEstimator
+
+
+def measurement(total, cpu, read=0.0, max_rss=2 ** 20, vm_peak=2 ** 24):
+    """Return measurement of a sampled user."""
+    return {'total': total, 'read': read, 'parse': total / 4,
+            'map': total / 2, 'cpu': cpu, 'max_rss': max_rss,
+            'vm_peak': vm_peak, 'result_bytes': 10}
+
+
+def test_estimate_extrapolates_strata():
+    """Check that cpu and wall clock time are extrapolated separately."""
+    estimator = CostEstimator()
+    estimator.add_stratum(10, [measurement(1.0, 0.5)])
+    estimator.add_stratum(30, [measurement(2.0, 0.2),
+                               measurement(4.0, 0.4)])
+    estimate = estimator.estimate(num_threads=4)
+    assert estimate['num_users'] == 40
+    assert estimate['num_sampled'] == 3
+    assert estimate['total_user_seconds'] == pytest.approx(100.0)
+    assert estimate['cpu_seconds'] == pytest.approx(14.0)
+    assert estimate['wall_seconds'] == pytest.approx(25.0)
+    assert estimate['result_bytes'] == pytest.approx(400)
+
+
+def test_estimate_recommends_batch_settings():
+    """Check that limits and read-ahead follow the sampled users."""
+    estimator = CostEstimator()
+    estimator.add_stratum(10, [measurement(1.0, 0.5, vm_peak=2 ** 24),
+                               measurement(2.0, 1.5, vm_peak=2 ** 25)])
+    estimate = estimator.estimate()
+    assert estimate['recommended_limits'] == {
+        'cpu': 5, 'realtime': 6, 'memory': 2 ** 26}
+    assert estimate['recommended_prefetch'] == 0
+    assert estimate['recommended_num_threads'] >= 1
+    estimator = CostEstimator()
+    estimator.add_stratum(
+        10, [measurement(1.0, 0.5, read=1.5, vm_peak=0)])
+    estimate = estimator.estimate()
+    assert estimate['recommended_prefetch'] == 3
+    assert estimate['recommended_limits']['memory'] is None
@@ -0,0 +1,48 @@
+"""Test that light helpers are imported without the runner stack."""
+from __future__ import division, print_function
+import json
+import subprocess
+import sys
+
+
+IMPORT_TIME_BUDGET = 0.1  # seconds
+NUM_IMPORT_RUNS = 5
+HEAVY_MODULES = ['requests', 'codejail', 'multiprocessing', 'bandicoot',
+                 'numpy']
+IMPORT_CODE = """
+import json, sys, time
+start_time = time.time()
+from opalalgorithms.core import OPALAlgorithm
+import opalalgorithms.utils
+from opalalgorithms.utils import fields, is_date_between, is_date_greater
+elapsed = time.time() - start_time
+print(json.dumps({{'elapsed': elapsed, 'loaded': [
+    m for m in {} if m in sys.modules]}}))
+""".format(HEAVY_MODULES)
+
+
+def import_stats():
+    """Import helpers in a fresh interpreter and return statistics."""
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_CODE])
+    return json.loads(output.decode('utf-8'))
+
+
+def test_light_imports():
+    """Check that helpers used inside the sandbox load no heavy module."""
+    assert import_stats()['loaded'] == []
+
+
+def test_import_time_budget():
+    """Check import time of helpers used inside the sandbox."""
+    elapsed = sorted(
+        import_stats()['elapsed'] for _ in range(NUM_IMPORT_RUNS))
+    assert elapsed[NUM_IMPORT_RUNS // 2] < IMPORT_TIME_BUDGET
+
+
+def test_lazy_attributes():
+    """Check that runner attributes are still importable from the package."""
+    import opalalgorithms.utils
+    from opalalgorithms.utils import AlgorithmRunner, fields
+    assert opalalgorithms.utils.AlgorithmRunner is AlgorithmRunner
+    assert 'AlgorithmRunner' in dir(opalalgorithms.utils)
+    assert fields['datetime'] == 4
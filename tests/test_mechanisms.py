@@ -0,0 +1,115 @@
+"""Test vectorised privacy mechanisms."""
+from __future__ import division, print_function
+
+import numpy as np
+import pytest
+
+from opalalgorithms.core import OPALPrivacy
+from opalalgorithms.utils import PrivacyAlgorithmRunner
+from opalalgorithms.utils.mechanisms import (
+    ComposedMechanism, GaussianMechanism, LaplaceMechanism,
+    SuppressionMechanism, salted_uniforms)
+
+
+RESULT = dict(('key{}'.format(i), float(i % 50)) for i in range(20000))
+
+
+def noise(private):
+    """Return noise added to each key of `RESULT`."""
+    return np.array([private[key] - RESULT[key] for key in sorted(RESULT)])
+
+
+def test_salted_uniforms():
+    """Check that uniforms depend only on key and salt."""
+    uniforms = salted_uniforms(['a', 'b'], 'salt', num=2)
+    assert uniforms.shape == (2, 2)
+    assert ((uniforms > 0) & (uniforms < 1)).all()
+    assert (salted_uniforms(['b'], 'salt', num=2)[0] == uniforms[1]).all()
+    assert (salted_uniforms(['a'], 'other')[0] != uniforms[0, 0]).all()
+    assert (salted_uniforms(['a'], 'salt', domain=b'other')[0] !=
+            uniforms[0, 0]).all()
+
+
+def test_noise_distribution():
+    """Check scale of random and salted noise."""
+    for salted in (False, True):
+        laplace = noise(PrivacyAlgorithmRunner(
+            LaplaceMechanism(epsilon=0.5, salted=salted), {}, 's')(RESULT))
+        assert abs(np.mean(np.abs(laplace)) - 2) < 0.1
+        gaussian = noise(PrivacyAlgorithmRunner(
+            GaussianMechanism(epsilon=1, delta=1e-5, salted=salted), {},
+            's', seed=0)(RESULT))
+        assert abs(np.std(gaussian) / np.sqrt(2 * np.log(1.25e5)) - 1) < 0.05
+
+
+def test_partitions_and_composition():
+    """Check that partitioned runs equal a single run."""
+    mechanism = ComposedMechanism([
+        LaplaceMechanism(salted=True), SuppressionMechanism(threshold=10)])
+    single = PrivacyAlgorithmRunner(mechanism, {'epsilon': 2}, 's')(RESULT)
+    partitioned = PrivacyAlgorithmRunner(
+        mechanism, {'epsilon': 2}, 's', num_partitions=4,
+        num_threads=2)(RESULT)
+    assert single == partitioned
+    assert all(value >= 10 for value in single.values())
+    assert 0 < len(single) < len(RESULT)
+    seeded = [PrivacyAlgorithmRunner(
+        LaplaceMechanism(), {}, 's', num_partitions=3, seed=1)(RESULT)
+        for _ in range(2)]
+    assert seeded[0] == seeded[1]
+
+
+def test_invalid_privacy_result():
+    """Check that results of other privacy algorithms are validated."""
+    class NestedPrivacy(OPALPrivacy):
+        def __call__(self, params, result, salt):
+            return {'a': {'b': 1}}
+
+    with pytest.warns(RuntimeWarning):
+        assert PrivacyAlgorithmRunner(
+            NestedPrivacy(), {}, 's')({'a': 1}) == {}
+    with pytest.warns(RuntimeWarning):
+        assert PrivacyAlgorithmRunner(
+            LaplaceMechanism(), {}, 's')({'a': 'b'}) == {}
+    with pytest.raises(ValueError):
+        LaplaceMechanism()({}, {'a': [1]}, 's')
+
+
+def test_numpy_privacy_result():
+    """Check that numpy numbers are valid and converted."""
+    class NumpyPrivacy(OPALPrivacy):
+        def __call__(self, params, result, salt):
+            return {'a': np.int64(result['a']), 'b': np.float32(0.5)}
+
+    private = PrivacyAlgorithmRunner(NumpyPrivacy(), {}, 's')({'a': 1})
+    assert private == {'a': 1, 'b': 0.5}
+    assert type(private['a']) is int
+    assert PrivacyAlgorithmRunner(
+        SuppressionMechanism(1), {}, 's')({'a': np.int64(2)}) == {'a': 2.0}
+
+
+def test_overridden_mechanism_call():
+    """Check that mechanisms overriding __call__ are called."""
+    class RoundedMechanism(SuppressionMechanism):
+        def __call__(self, params, result, salt):
+            private = super(RoundedMechanism, self).__call__(
+                params, result, salt)
+            return dict((key, round(val)) for key, val in private.items())
+
+    assert PrivacyAlgorithmRunner(RoundedMechanism(1), {}, 's')(
+        {'a': 2.4, 'b': 0.5}) == {'a': 2}
+
+
+def test_privacy_runner_reuses_pool():
+    """Check that partitions of every call are applied by one pool."""
+    runner = PrivacyAlgorithmRunner(
+        LaplaceMechanism(salted=True), {}, 's', num_partitions=4,
+        num_threads=2)
+    try:
+        first = runner(RESULT)
+        pool = runner.pool
+        assert runner(RESULT) == first
+        assert runner.pool is pool
+    finally:
+        runner.close()
+    assert runner.pool is None
@@ -0,0 +1,20 @@
+"""Test memory usage of worker processes."""
+from __future__ import division, print_function
+import os
+
+from opalalgorithms.utils.memory import MemoryUsage, current_rss
+
+
+def test_memory_usage():
+    """Check that peak and mean of samples are kept."""
+    assert current_rss() > 0
+    usage = MemoryUsage('mapper')
+    assert usage.mean == 0
+    data = bytearray(64 * 2 ** 20)
+    rss = usage.sample()
+    del data
+    usage.sample()
+    assert usage.pid == os.getpid()
+    assert usage.num_samples == 2
+    assert usage.peak >= rss >= 64 * 2 ** 20
+    assert 0 < usage.mean <= usage.peak
@@ -0,0 +1,50 @@
+"""Test online aggregation with confidence intervals."""
+from __future__ import division, print_function
+import random
+
+import pytest
+
+from opalalgorithms.utils.online import OnlineAggregator, normal_quantile
+
+
+def test_normal_quantile():
+    """Check quantiles of the standard normal distribution."""
+    assert normal_quantile(0.95) == pytest.approx(1.959964, abs=1e-5)
+    assert normal_quantile(0.99) == pytest.approx(2.575829, abs=1e-5)
+
+
+def test_online_aggregator_coverage():
+    """Check that intervals cover the true totals and shrink to them."""
+    rng = random.Random(0)
+    population = [{'a': rng.random() * 10} if rng.random() < 0.7 else
+                  {'b': 1} for _ in range(2000)]
+    totals = {'a': sum(user.get('a', 0) for user in population),
+              'b': sum(user.get('b', 0) for user in population)}
+    # one more user without a valid result
+    aggregator = OnlineAggregator(len(population) + 1, relative_error=0.05)
+    rng.shuffle(population)
+    for user in population[:500]:
+        aggregator.update(user)
+    aggregator.update(None)
+    estimates = aggregator.estimates()
+    for key, total in totals.items():
+        assert estimates[key]['low'] <= total <= estimates[key]['high']
+        assert estimates[key]['relative_error'] < 0.15
+    assert aggregator.should_stop() == (
+        aggregator.max_relative_error() <= 0.05)
+    for user in population[500:]:
+        aggregator.update(user)
+    aggregator.finish()
+    estimates = aggregator.estimates()
+    for key, total in totals.items():
+        assert estimates[key]['estimate'] == pytest.approx(total)
+        assert estimates[key]['low'] == pytest.approx(total)
+    assert not aggregator.should_stop()
+    assert aggregator.summary()['num_users'] == 2001
+
+
+def test_online_aggregator_time_budget():
+    """Check that the aggregator stops once the time budget is reached."""
+    aggregator = OnlineAggregator(10, relative_error=None, time_budget=0)
+    aggregator.update({'a': 1})
+    assert aggregator.should_stop()
@@ -0,0 +1,44 @@
+"""Test read-ahead of user files."""
+from __future__ import division, print_function
+
+from six.moves import queue
+
+from opalalgorithms.utils.prefetch import FilePrefetcher, iter_file_queue
+
+
+def fill_queue(tmpdir, num_files, size):
+    """Write files of `size` bytes and queue them."""
+    file_queue = queue.Queue()
+    for i in range(num_files):
+        path = tmpdir.join('{}.csv'.format(i))
+        path.write('x' * size)
+        file_queue.put((str(path), i))
+    return file_queue
+
+
+def test_iter_file_queue_order(tmpdir):
+    """Check that all files are yielded in order with and without threads."""
+    for num_threads in (0, 2):
+        file_queue = fill_queue(tmpdir, 10, 100)
+        prefetcher = FilePrefetcher(window=3, num_threads=num_threads)
+        items = list(iter_file_queue(file_queue, prefetcher))
+        prefetcher.close()
+        assert [scaler for _, scaler in items] == list(range(10))
+        assert prefetcher.num_files == 0
+        assert prefetcher.num_bytes == 0
+
+
+def test_prefetch_window_bounded(tmpdir):
+    """Check that prefetched files stay within the window."""
+    file_queue = fill_queue(tmpdir, 10, 100)
+    prefetcher = FilePrefetcher(window=4, max_bytes=250)
+    for _ in iter_file_queue(file_queue, prefetcher):
+        assert prefetcher.num_files <= 2
+        assert prefetcher.num_bytes <= 200
+    prefetcher.close()
+
+
+def test_iter_file_queue_without_prefetcher(tmpdir):
+    """Check that files are yielded one at a time without prefetcher."""
+    file_queue = fill_queue(tmpdir, 5, 10)
+    assert len(list(iter_file_queue(file_queue))) == 5
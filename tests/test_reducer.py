@@ -0,0 +1,39 @@
+"""Test streaming reducers."""
+from __future__ import division, print_function
+import random
+
+from opalalgorithms.utils.reducer import (
+    QuantileSketch, FrequentItems, StreamingReducer)
+
+
+def test_quantile_sketch_median():
+    """Check that median is approximated with bounded memory."""
+    sketch = QuantileSketch(k=100, seed=0)
+    values = list(range(100000))
+    random.Random(0).shuffle(values)
+    for value in values:
+        sketch.update(value)
+    assert abs(sketch.quantile(0.5) - 50000) < 5000
+    assert sum(len(c) for c in sketch.compactors) < 1000
+
+
+def test_frequent_items_mode():
+    """Check that heavy hitter is returned as mode."""
+    summary = FrequentItems(k=4)
+    for value in [1] * 50 + list(range(2, 40)):
+        summary.update(value)
+    assert summary.mode() == 1
+    assert len(summary.counters) <= 4
+
+
+def test_streaming_reducer_merge():
+    """Check that partial reducers merge to the same exact statistics."""
+    first, second = StreamingReducer(), StreamingReducer()
+    for i in range(100):
+        (first if i % 2 else second)({'alpha': 1, 'beta': i})
+    first.merge(StreamingReducer.from_dict(second.to_dict()))
+    summary = first.summary()
+    assert summary['alpha'] == {
+        'sum': 100, 'count': 100, 'mean': 1, 'median': 1, 'mode': 1}
+    assert summary['beta']['sum'] == sum(range(100))
+    assert summary['beta']['mean'] == sum(range(100)) / 100
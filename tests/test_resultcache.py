@@ -0,0 +1,44 @@
+"""Test cache of results of users."""
+from __future__ import division, print_function
+import os
+import time
+
+from opalalgorithms.utils.resultcache import ResultCache
+
+
+ALGORITHM = dict(code='class A(object): pass', className='A')
+
+
+def test_result_cache_invalidation(tmpdir):
+    """Check that entries are invalidated by changes in params or data."""
+    user_csv_file = str(tmpdir.join('user.csv'))
+    with open(user_csv_file, 'w') as csv_file:
+        csv_file.write('a,b\n')
+    cache = ResultCache(str(tmpdir.join('cache')))
+    job_key = cache.job_key(ALGORITHM, {'resolution': 'location_level_1'})
+    assert cache.get(job_key, user_csv_file) == (False, None)
+    cache.set(job_key, user_csv_file, {'Dakar': 1})
+    assert cache.get(job_key, user_csv_file) == (True, {'Dakar': 1})
+    other_key = cache.job_key(ALGORITHM, {'resolution': 'location_level_2'})
+    assert cache.get(other_key, user_csv_file) == (False, None)
+    with open(user_csv_file, 'a') as csv_file:
+        csv_file.write('c,d\n')
+    os.utime(user_csv_file, (time.time() + 10, time.time() + 10))
+    assert cache.get(job_key, user_csv_file) == (False, None)
+
+
+def test_result_cache_eviction(tmpdir):
+    """Check that least recently used entries are evicted."""
+    cache = ResultCache(str(tmpdir.join('cache')), max_entries=2)
+    job_key = cache.job_key(ALGORITHM, {})
+    paths = []
+    for i in range(3):
+        paths.append(str(tmpdir.join('{}.csv'.format(i))))
+        with open(paths[-1], 'w') as csv_file:
+            csv_file.write('a,b\n')
+        cache.set(job_key, paths[-1], {'key': i})
+        time.sleep(0.01)
+    cache.get(job_key, paths[0])
+    assert cache.evict() == 1
+    assert cache.get(job_key, paths[0])[0]
+    assert not cache.get(job_key, paths[1])[0]
@@ -0,0 +1,181 @@
+"""Test runner service with a local HTTP API."""
+from __future__ import division, print_function
+import json
+import time
+
+import pytest
+from six.moves.urllib.error import HTTPError
+from six.moves.urllib.request import Request, urlopen
+
+from opalalgorithms.utils import AlgorithmRunner
+from opalalgorithms.utils.service import RunnerService, job_options
+
+
+class FakeRunner(object):
+    """Runner recording the order in which jobs are run."""
+
+    runs = []
+
+    def __init__(self, request, pool, manager):
+        """Initialize fake runner."""
+        self.request = request
+
+    def __call__(self, params, data_dir, num_threads, weights_file=None):
+        """Record the run and return its parameters."""
+        FakeRunner.runs.append(params['name'])
+        return params
+
+    def progress(self):
+        """Return progress of the run."""
+        return 0.5
+
+
+class SlowRunner(FakeRunner):
+    """Runner taking a while for every job."""
+
+    def __call__(self, params, data_dir, num_threads, weights_file=None):
+        """Wait before recording the run."""
+        time.sleep(0.5)
+        return super(SlowRunner, self).__call__(
+            params, data_dir, num_threads, weights_file)
+
+
+def http(service, path, body=None):
+    """Send request to the service and return decoded response."""
+    request = Request('http://127.0.0.1:{}{}'.format(service.port, path))
+    if body is not None:
+        request.add_header('Content-Type', 'application/json')
+        request.data = json.dumps(body).encode('utf-8')
+    return json.loads(urlopen(request).read().decode('utf-8'))
+
+
+def wait_for_jobs(service, timeout=10):
+    """Wait until all jobs of the service are finished."""
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        if all(job['status'] in ('done', 'failed')
+               for job in service.status()):
+            return
+        time.sleep(0.05)
+
+
+def test_service_priorities_and_status():
+    """Check that queued jobs run by priority and report their status."""
+    FakeRunner.runs = []
+    service = RunnerService(1, runner_factory=FakeRunner)
+    for name, priority in [('low', 0), ('high', 10), ('medium', 5)]:
+        service.submit({'algorithm': {}, 'params': {'name': name},
+                        'data_dir': 'data'}, priority)
+    service.start()
+    try:
+        job_id = http(service, '/jobs', {
+            'algorithm': {}, 'params': {'name': 'http'},
+            'data_dir': 'data'})['job_id']
+        wait_for_jobs(service)
+        assert FakeRunner.runs == ['high', 'medium', 'low', 'http']
+        status = http(service, '/jobs/{}'.format(job_id))
+        assert status['status'] == 'done'
+        assert status['progress'] == 1.0
+        assert status['result'] == {'name': 'http'}
+        assert len(http(service, '/jobs')) == 4
+    finally:
+        service.stop()
+
+
+def test_service_rejects_unknown_options():
+    """Check that jobs can not set options outside of the whitelist."""
+    service = RunnerService(1, runner_factory=FakeRunner)
+    service.start()
+    try:
+        for options in ({'sandboxing': False}, {'pool': None}, [],
+                        {'limits': {'bogus': 1}}, {'limits': 5},
+                        {'staging': {'method': 'move'}},
+                        {'selection': {'time_index': 'index.json.gz'}}):
+            with pytest.raises(HTTPError) as excinfo:
+                http(service, '/jobs', {
+                    'algorithm': {}, 'params': {'name': 'http'},
+                    'data_dir': 'data', 'options': options})
+            assert excinfo.value.code == 400
+        assert service.status() == []
+    finally:
+        service.stop()
+
+
+def test_service_rejects_invalid_requests():
+    """Check that malformed requests are rejected with a message."""
+    service = RunnerService(1, runner_factory=FakeRunner)
+    valid = {'algorithm': {}, 'params': {'name': 'http'}, 'data_dir': 'data'}
+    service.start()
+    try:
+        for request in ([valid], dict(valid, priority='high'),
+                        dict(valid, priority=1.5), dict(valid, num_threads=0),
+                        dict(valid, num_threads=True), dict(valid, params=[])):
+            with pytest.raises(HTTPError) as excinfo:
+                http(service, '/jobs', request)
+            assert excinfo.value.code == 400
+            assert json.loads(excinfo.value.read().decode('utf-8'))['error']
+        with pytest.raises(ValueError):
+            service.submit(valid, priority=None)
+        assert service.status() == []
+    finally:
+        service.stop()
+
+
+def test_service_stop_cancels_queued_jobs():
+    """Check that jobs still queued when the service stops are cancelled."""
+    FakeRunner.runs = []
+    service = RunnerService(1, runner_factory=SlowRunner)
+    for name in ['first', 'second', 'third']:
+        service.submit({'algorithm': {}, 'params': {'name': name},
+                        'data_dir': 'data'})
+    service.start(serve=False)
+    while service.status(1)['status'] == 'queued':
+        time.sleep(0.01)
+    service.stop()
+    assert FakeRunner.runs == ['first']
+    assert [job['status'] for job in service.status()] == [
+        'done', 'cancelled', 'cancelled']
+
+
+def test_service_keeps_indexes(tmpdir):
+    """Check that jobs selecting users share indexes of the service."""
+    request = {'algorithm': {}, 'params': {}, 'data_dir': 'data',
+               'options': {'selection': {'locations': {
+                   'location_level_1': ['a']}}, 'zygote': {}}}
+    first = job_options(request, str(tmpdir))
+    second = job_options(dict(request, options=dict(
+        request['options'], selection={'time_window': (
+            '2017-01-01 00:00:00', '2017-01-02 00:00:00')})), str(tmpdir))
+    assert first['selection'].location_index.startswith(str(tmpdir))
+    assert first['selection'].location_index == \
+        second['selection'].location_index
+    assert first['selection'].time_index == second['selection'].time_index
+    assert first['zygote'].warm
+    assert job_options(request)['selection'].location_index is None
+
+
+def test_service_runs_algorithm():
+    """Check that the default runner runs sandboxed jobs on warm workers."""
+    params = dict(resolution='location_level_1')
+    algorithm = dict(code=open('sample_algos/algo1.py').read(),
+                     className='SampleAlgo1')
+    service = RunnerService(2)
+    service.start()
+    try:
+        for _ in range(2):
+            job_id = http(service, '/jobs', {
+                'algorithm': algorithm, 'params': params,
+                'data_dir': 'data', 'options': {
+                    'dev_mode': True, 'limits': {'cpu': 5}}})['job_id']
+        wait_for_jobs(service, timeout=60)
+        status = http(service, '/jobs/{}'.format(job_id))
+        assert status['status'] == 'done', status['error']
+        assert service.jobs[job_id].runner.sandboxing
+        assert service.jobs[job_id].runner.limits['CPU'] == 5
+        assert status['report']['memory'][-1]['name'] == 'collector'
+        expected = AlgorithmRunner(algorithm, dev_mode=True)(
+            params, 'data', 2)
+        assert sorted(map(str, status['result'])) == sorted(
+            map(str, expected))
+    finally:
+        service.stop()
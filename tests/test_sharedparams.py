@@ -0,0 +1,81 @@
+"""Test shared read-only parameters."""
+from __future__ import division, print_function
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from opalalgorithms.utils.resultcache import ResultCache
+from opalalgorithms.utils.sharedparams import (
+    SharedParams, is_shared_ref, publish_shared_params,
+    resolve_shared_params, resolver_code)
+
+
+def test_shared_params_view(tmpdir):
+    """Check that published tables are read back through the view."""
+    table = dict(('ant{}'.format(i), [i, 'region{}'.format(i % 7)])
+                 for i in range(1000))
+    table[u'\xe9t\xe9'] = {'nested': True}
+    params = {'regions': table, 'resolution': 'location_level_1'}
+    published, directory = publish_shared_params(
+        params, ['regions'], str(tmpdir))
+    assert published['resolution'] == 'location_level_1'
+    assert is_shared_ref(published['regions'])
+    assert params['regions'] is table
+    view = pickle.loads(pickle.dumps(
+        resolve_shared_params(published)['regions']))
+    assert isinstance(view, SharedParams)
+    assert len(view) == len(table)
+    assert dict(view) == table
+    assert view['ant5'] == [5, 'region5']
+    assert view.get('unknown', 'default') == 'default'
+    assert 'ant999' in view and 1 not in view
+    with pytest.raises(KeyError):
+        view['unknown']
+    view.close()
+
+
+def test_publish_shared_params_errors():
+    """Check that non dict parameters are rejected and nothing is left."""
+    def shared_dirs():
+        return set(name for name in os.listdir(tempfile.gettempdir())
+                   if name.startswith('codejail-shared-'))
+
+    before = shared_dirs()
+    with pytest.raises(TypeError):
+        publish_shared_params({'regions': [1, 2]}, ['regions'])
+    assert shared_dirs() == before
+
+
+def test_shared_params_cache_key(tmpdir):
+    """Check that cache keys depend on content of tables, not on path."""
+    cache = ResultCache(str(tmpdir.join('cache')))
+    algorithm = {'code': '', 'className': 'A'}
+    keys = []
+    for name, table in (('a', {'x': 1}), ('b', {'x': 1}), ('c', {'x': 2})):
+        directory = str(tmpdir.join(name))
+        os.mkdir(directory)
+        published, _ = publish_shared_params(
+            {'regions': table}, ['regions'], directory)
+        keys.append(cache.job_key(algorithm, published))
+    assert keys[0] == keys[1] != keys[2]
+
+
+def test_resolver_code_without_package(tmpdir):
+    """Check that references are resolved without importing the package."""
+    published, _ = publish_shared_params(
+        {'regions': {'ant1': 'north'}}, ['regions'], str(tmpdir))
+    code = '{}\n{}'.format(resolver_code(), (
+        'import json, sys\n'
+        'params = resolve_shared_params({!r})\n'
+        'print(json.dumps([params["regions"]["ant1"], '
+        '"opalalgorithms" in sys.modules]))').format(published))
+    env = dict(os.environ)
+    env.pop('PYTHONPATH', None)
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], cwd=str(tmpdir), env=env)
+    assert json.loads(output.decode('utf-8')) == ['north', False]
@@ -0,0 +1,82 @@
+"""Test local sinks of results."""
+from __future__ import division, print_function
+import csv
+import gzip
+import json
+import os
+import pickle
+import socket
+import threading
+
+from opalalgorithms.utils.sinks import CSVSink, JSONLinesSink, UnixSocketSink
+
+
+RESULTS = [{'ant{}'.format(i): i, 'other': 1.5} for i in range(100)]
+
+
+def write_all(sink):
+    """Write results through a pickled copy of the sink, as the collector."""
+    sink = pickle.loads(pickle.dumps(sink))
+    for result in RESULTS:
+        sink.write(result)
+    sink.close()
+    return pickle.loads(pickle.dumps(sink))
+
+
+def test_jsonlines_sink_rotation(tmpdir):
+    """Check that rotated and compressed files contain all results."""
+    sink = write_all(JSONLinesSink(
+        str(tmpdir.join('results.jsonl.gz')), max_bytes=500,
+        buffer_size=200))
+    assert sink.num_results == 100
+    assert len(sink.paths) > 1
+    assert sink.paths[0].endswith('results.00000.jsonl.gz')
+    results = []
+    for path in sink.paths:
+        with gzip.open(path, 'rb') as result_file:
+            data = result_file.read()
+        assert len(data) <= 500
+        results.extend(
+            json.loads(line) for line in data.decode('utf-8').splitlines())
+    assert results == RESULTS
+
+
+def test_csv_sink(tmpdir):
+    """Check that rows of the csv file group back to the results."""
+    sink = write_all(CSVSink(str(tmpdir.join('results.csv'))))
+    assert sink.summary() == {
+        'num_results': 100, 'paths': [str(tmpdir.join('results.csv'))]}
+    results = {}
+    with open(sink.paths[0]) as result_file:
+        for row in csv.DictReader(result_file):
+            results.setdefault(int(row['result']), {})[row['key']] = float(
+                row['value'])
+    assert [results[i] for i in range(100)] == RESULTS
+
+
+def test_unix_socket_sink(tmpdir):
+    """Check that results are streamed to a listening consumer."""
+    address = os.path.join(str(tmpdir), 'results.sock')
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(address)
+    server.listen(1)
+    received = []
+
+    def consume():
+        connection, _ = server.accept()
+        data = b''
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+        connection.close()
+        received.extend(
+            json.loads(line) for line in data.decode('utf-8').splitlines())
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    write_all(UnixSocketSink(address, buffer_size=1000))
+    consumer.join()
+    server.close()
+    assert received == RESULTS
@@ -0,0 +1,30 @@
+"""Test staging of user files without copying."""
+from __future__ import division, print_function
+import os
+
+from opalalgorithms.utils.staging import FileStager
+
+
+def test_stager_links_readable_files(tmpdir):
+    """Check that readable files are hard linked and others copied."""
+    readable = tmpdir.join('readable.csv')
+    readable.write('a,b\n1,2\n')
+    os.chmod(str(readable), 0o644)
+    private = tmpdir.join('private.csv')
+    private.write('a,b\n3,4\n')
+    os.chmod(str(private), 0o600)
+    stager = FileStager(str(tmpdir))
+    staged = stager.stage(str(readable))
+    assert os.path.basename(os.path.dirname(staged)).startswith(
+        'codejail-staging-')
+    assert os.path.samefile(staged, str(readable))
+    staged_private = stager.stage(str(private))
+    assert not os.path.samefile(staged_private, str(private))
+    assert open(staged_private).read() == 'a,b\n3,4\n'
+    assert os.stat(staged_private).st_mode & 0o777 == 0o644
+    assert (stager.num_linked, stager.num_copied) == (1, 1)
+    stager.release(staged)
+    assert readable.check()
+    directory = stager.directory
+    stager.close()
+    assert not os.path.exists(directory)
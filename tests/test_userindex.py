@@ -0,0 +1,176 @@
+"""Test indexes of user files."""
+from __future__ import division, print_function
+import os
+
+from opalalgorithms.utils import userindex
+from opalalgorithms.utils.userindex import (
+    LocationIndex, TimeIndex, slice_records)
+
+
+HEADER = 'interaction,direction,datetime,antenna_id\n'
+LOCATION_HEADER = 'datetime,antenna_id,location_level_2,location_level_1\n'
+
+
+def write_user(path, dates):
+    """Write a user file with records at `dates`."""
+    with open(str(path), 'w') as user_file:
+        user_file.write(HEADER)
+        for date in dates:
+            user_file.write('call,in,{},1\n'.format(date))
+
+
+def test_time_index_incremental(tmpdir):
+    """Check that only new and changed users are scanned."""
+    first = tmpdir.join('a.csv')
+    second = tmpdir.join('b.csv')
+    write_user(first, ['2016-01-01 10:00:00', '2016-01-03 10:00:00'])
+    write_user(second, ['2016-02-05 10:00:00', '2016-02-01 10:00:00'])
+    csv_files = [str(first), str(second)]
+    index_path = str(tmpdir.join('index.json.gz'))
+    index = TimeIndex(index_path)
+    assert index.update(csv_files) == 2
+    assert index.entries['b.csv'] == [
+        '2016-02-01 10:00:00', '2016-02-05 10:00:00', 2, False]
+    assert index.is_sorted(str(first))
+
+    index = TimeIndex(index_path)
+    assert index.update(csv_files) == 0
+    write_user(second, ['2016-03-01 10:00:00'])
+    os.utime(str(second), (0, 0))
+    assert index.update(csv_files) == 1
+    assert index.update([str(first)]) == 0
+    assert sorted(TimeIndex(index_path).entries) == ['a.csv']
+
+
+def test_time_index_select(tmpdir):
+    """Check that users overlapping the window are selected."""
+    csv_files = []
+    for name, dates in [('a', ['2016-01-01 10:00:00']),
+                        ('b', ['2016-01-10 10:00:00', '2016-01-20 10:00:00']),
+                        ('c', [])]:
+        write_user(tmpdir.join(name + '.csv'), dates)
+        csv_files.append(str(tmpdir.join(name + '.csv')))
+    index = TimeIndex()
+    index.update(csv_files)
+    assert index.select(
+        csv_files, '2016-01-15 00:00:00', '2016-01-31 00:00:00') == [
+            csv_files[1]]
+    assert index.select(
+        csv_files, '2016-01-01 10:00:00', '2016-01-01 10:00:00') == [
+            csv_files[0]]
+
+
+def test_slice_records(tmpdir):
+    """Check that sorted and unsorted users are sliced alike."""
+    dates = ['2016-01-0{} 10:00:00'.format(day) for day in range(1, 8)]
+    for is_sorted, user_dates in [(True, dates), (False, dates[::-1])]:
+        path = tmpdir.join('user.csv')
+        write_user(path, user_dates)
+        slice_path = str(tmpdir.join('slice.csv'))
+        assert slice_records(
+            str(path), slice_path, '2016-01-03 00:00:00',
+            '2016-01-05 10:00:00', is_sorted) == 3
+        lines = open(slice_path).readlines()
+        assert lines[0] == HEADER
+        assert sorted(line.split(',')[2] for line in lines[1:]) == dates[2:5]
+
+
+def test_location_index_select(tmpdir):
+    """Check that users are found by region and antenna."""
+    rows = {'a': [('Maharashtra', 'Mumbai', 1), ('Maharashtra', 'Pune', 2)],
+            'b': [('Flandesr', 'Brugges', 2)],
+            'c': [('Maharashtra', 'Mumbai', 3)]}
+    csv_files = []
+    for name in sorted(rows):
+        path = tmpdir.join(name + '.csv')
+        with open(str(path), 'w') as user_file:
+            user_file.write(
+                'datetime,antenna_id,location_level_1,location_level_2\n')
+            for row in rows[name]:
+                user_file.write('2016-01-01 10:00:00,{2},{0},{1}\n'.format(
+                    *row))
+        csv_files.append(str(path))
+    index_path = str(tmpdir.join('location_index'))
+    index = LocationIndex(index_path)
+    assert index.update(csv_files) == 3
+    assert index.users('antenna_id', [2]) == set(['a.csv', 'b.csv'])
+    assert index.select(csv_files, {'location_level_1': ['Maharashtra'],
+                                    'location_level_2': ['Pune', 'Brugges']}
+                        ) == [csv_files[0]]
+
+    index = LocationIndex(index_path)
+    assert index.select(csv_files, {'location_level_2': ['Mumbai']}) == [
+        csv_files[0], csv_files[2]]
+    os.remove(csv_files[0])
+    assert index.update(csv_files[1:]) == 0
+    assert index.select(csv_files[1:], {'antenna_id': ['1', '2']}) == [
+        csv_files[1]]
+
+
+def write_locations(path, rows, header=LOCATION_HEADER):
+    """Write a user file with records at locations `rows`."""
+    with open(str(path), 'w') as user_file:
+        user_file.write(header)
+        for row in rows:
+            user_file.write('2016-01-01 10:00:00,' + ','.join(row) + '\n')
+
+
+def test_location_index_reads_only_selected(tmpdir, monkeypatch):
+    """Check that selecting users reads new and found users only."""
+    data_dir = tmpdir.mkdir('data')
+    data_dir.mkdir('north')
+    write_locations(data_dir.join('north', 'a.csv'), [('1', 'Pune', 'M')])
+    write_locations(data_dir.join('b.csv'), [('2', 'Brugges', 'F')])
+    write_locations(data_dir.join('c.csv'), [('3', 'Mumbai', 'M')])
+    # user without a location_level_1 column is selected by any region
+    write_locations(data_dir.join('d.csv'), [('4', 'Ghent')],
+                    'datetime,antenna_id,location_level_2\n')
+    csv_files = [str(data_dir.join(name)) for name in (
+        os.path.join('north', 'a.csv'), 'b.csv', 'c.csv', 'd.csv')]
+    index_dir = str(tmpdir.join('location_index'))
+    scanned = []
+    scan = LocationIndex._scan
+    monkeypatch.setattr(LocationIndex, '_scan', lambda self, path: (
+        scanned.append(os.path.basename(path)) or scan(self, path)))
+    fingerprinted = []
+    fingerprint = userindex.file_fingerprint
+    monkeypatch.setattr(userindex, 'file_fingerprint', lambda path: (
+        fingerprinted.append(os.path.basename(path)) or fingerprint(path)))
+    index = LocationIndex(index_dir, str(data_dir))
+    region = {'location_level_1': ['M']}
+    assert index.select(csv_files, region) == [
+        csv_files[0], csv_files[2], csv_files[3]]
+    assert sorted(scanned) == ['a.csv', 'b.csv', 'c.csv', 'd.csv']
+    assert set(index.entries) == set([
+        os.path.join('north', 'a.csv'), 'b.csv', 'c.csv', 'd.csv'])
+    assert index.entries['d.csv'] == ['location_level_1']
+
+    # c moved away from the region, b moved into it but is not found
+    write_locations(data_dir.join('c.csv'), [('3', 'Brugges', 'F')])
+    write_locations(data_dir.join('b.csv'), [('2', 'Pune', 'M')])
+    for name in ('b.csv', 'c.csv'):
+        os.utime(str(data_dir.join(name)), (0, 0))
+    del scanned[:], fingerprinted[:]
+    index = LocationIndex(index_dir, str(data_dir))
+    assert index.select(csv_files, region) == [csv_files[0], csv_files[3]]
+    assert scanned == ['c.csv']
+    assert sorted(fingerprinted) == ['a.csv', 'c.csv', 'c.csv', 'd.csv']
+
+    # refreshing the index finds b
+    assert index.update(csv_files) == 1
+    assert LocationIndex(index_dir, str(data_dir)).select(
+        csv_files, region) == [csv_files[0], csv_files[1], csv_files[3]]
+
+
+def test_time_index_relative_keys(tmpdir):
+    """Check that users of different directories are kept apart."""
+    csv_files = []
+    for name, date in [('north', '2016-01-01 10:00:00'),
+                       ('south', '2016-02-01 10:00:00')]:
+        write_user(tmpdir.mkdir(name).join('a.csv'), [date])
+        csv_files.append(str(tmpdir.join(name, 'a.csv')))
+    index = TimeIndex(root=str(tmpdir))
+    assert index.update(csv_files) == 2
+    assert index.select(
+        csv_files, '2016-02-01 00:00:00', '2016-02-02 00:00:00') == [
+            csv_files[1]]
@@ -0,0 +1,26 @@
+"""Test memory mapped weights store."""
+from __future__ import division, print_function
+import json
+import pickle
+
+from opalalgorithms.utils.weights import (
+    WeightsStore, convert_weights, is_weights_store)
+
+
+def test_weights_store_lookup(tmpdir):
+    """Check that weights converted from JSON are looked up correctly."""
+    weights = dict(('{}'.format(i), i / 10) for i in range(1000))
+    json_path = str(tmpdir.join('weights.json'))
+    store_path = str(tmpdir.join('weights.bin'))
+    with open(json_path, 'w') as json_file:
+        json.dump(weights, json_file)
+    assert convert_weights(json_path, store_path) == 1000
+    assert is_weights_store(store_path)
+    assert not is_weights_store(json_path)
+    store = pickle.loads(pickle.dumps(WeightsStore(store_path)))
+    assert len(store) == 1000
+    for user, weight in weights.items():
+        assert store.get(user) == weight
+    assert store.get('unknown') == 1
+    assert store.get('unknown', default=2) == 2
+    store.close()
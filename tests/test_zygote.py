@@ -0,0 +1,166 @@
+"""Test limits of the zygote sandbox during its startup."""
+from __future__ import division, print_function
+import os
+import time
+
+from codejail.exceptions import SafeExecException
+import pytest
+
+from opalalgorithms.utils.sharedparams import publish_shared_params
+from opalalgorithms.utils.zygote import (
+    ZygoteJail, close_warm_zygotes, get_zygote, release_zygote)
+
+
+SPINNING_ALGORITHM = '''
+while True:
+    pass
+'''
+ALLOCATING_ALGORITHM = '''
+data = bytearray(2 ** 32)
+'''
+
+
+@pytest.mark.parametrize('code', [SPINNING_ALGORITHM, ALLOCATING_ALGORITHM])
+def test_zygote_startup_limits(code):
+    """Check that top level code of the algorithm is limited."""
+    algorithm = dict(code=code, className='SampleAlgo1')
+    start_time = time.time()
+    with pytest.raises(SafeExecException):
+        ZygoteJail(algorithm, {}, sandboxing=False,
+                   limits={'CPU': 1, 'REALTIME': 3, 'VMEM': 2 ** 31})
+    assert time.time() - start_time < 5
+
+
+def test_zygote_runs_users():
+    """Check that limits of the startup do not affect the users."""
+    algorithm = dict(code=open('sample_algos/algo1.py').read(),
+                     className='SampleAlgo1')
+    jail = ZygoteJail(algorithm, {'resolution': 'location_level_1'},
+                      sandboxing=False,
+                      limits={'CPU': 1, 'REALTIME': 3, 'VMEM': 2 ** 31})
+    try:
+        for _ in range(3):
+            assert len(jail('data/0.csv')) == 1
+    finally:
+        jail.close()
+
+
+ESCAPING_ALGORITHM = '''
+import os
+import resource
+
+from opalalgorithms.core import OPALAlgorithm
+
+
+class SampleAlgo1(OPALAlgorithm):
+
+    def map(self, params, bandicoot_user):
+        result = {
+            'nproc': list(resource.getrlimit(resource.RLIMIT_NPROC)),
+            'fsize': list(resource.getrlimit(resource.RLIMIT_FSIZE))}
+        try:
+            pid = os.fork()
+        except OSError:
+            result['fork'] = False
+        else:
+            if pid == 0:
+                os._exit(0)
+            os.waitpid(pid, 0)
+            result['fork'] = True
+        try:
+            with open(params['path'], 'w') as output:
+                output.write('escaped')
+                output.flush()
+        except (IOError, OSError):
+            result['write'] = False
+        else:
+            result['write'] = True
+        return result
+'''
+
+
+def test_zygote_child_limits(tmpdir):
+    """Check that children may neither start processes nor write files."""
+    algorithm = dict(code=ESCAPING_ALGORITHM, className='SampleAlgo1')
+    path = str(tmpdir.join('escaped.txt'))
+    jail = ZygoteJail(algorithm, {'path': path}, sandboxing=False,
+                      limits={'CPU': 1, 'REALTIME': 3})
+    try:
+        result = jail('data/0.csv')
+    finally:
+        jail.close()
+    assert result['nproc'] == [0, 0]
+    assert result['fsize'] == [0, 0]
+    assert not result['write']
+    assert not os.path.exists(path) or os.path.getsize(path) == 0
+    # the process limit is not enforced for root
+    if os.geteuid() != 0:
+        assert not result['fork']
+
+
+def test_zygote_died():
+    """Check that a zygote dying during the job is reported as such."""
+    algorithm = dict(code=open('sample_algos/algo1.py').read(),
+                     className='SampleAlgo1')
+    jail = ZygoteJail(algorithm, {'resolution': 'location_level_1'},
+                      sandboxing=False)
+    try:
+        jail.process.kill()
+        jail.process.wait()
+        with pytest.raises(SafeExecException) as excinfo:
+            jail('data/0.csv')
+        assert 'Zygote died' in str(excinfo.value)
+    finally:
+        jail.close()
+
+
+def test_zygote_warm_jobs():
+    """Check that a warm zygote serves later jobs, also after a failure."""
+    algorithm = dict(code=open('sample_algos/algo1.py').read(),
+                     className='SampleAlgo1')
+    limits = {'CPU': 1, 'REALTIME': 3}
+    try:
+        jail = get_zygote(algorithm, {'resolution': 'location_level_1'},
+                          sandboxing=False, limits=limits, warm=True)
+        pid = jail.process.pid
+        first_result = jail('data/0.csv')
+        release_zygote(jail)
+        assert jail.process.poll() is None
+        with pytest.raises(SafeExecException):
+            get_zygote(dict(code=SPINNING_ALGORITHM, className='SampleAlgo1'),
+                       {}, sandboxing=False, limits=limits, warm=True)
+        jail = get_zygote(algorithm, {'resolution': 'location_level_2'},
+                          sandboxing=False, limits=limits, warm=True)
+        assert jail.process.pid == pid
+        assert jail('data/0.csv') != first_result
+        release_zygote(jail)
+        jail.process.kill()
+        jail.process.wait()
+        jail = get_zygote(algorithm, {'resolution': 'location_level_1'},
+                          sandboxing=False, limits=limits, warm=True)
+        assert jail.process.pid != pid
+        assert jail('data/0.csv') == first_result
+        release_zygote(jail)
+    finally:
+        close_warm_zygotes()
+    assert jail.process is None
+
+
+def test_zygote_shared_params(tmpdir):
+    """Check that the zygote resolves shared parameters."""
+    params = {'resolution': 'location_level_1'}
+    jail = ZygoteJail(dict(code=open('sample_algos/algo1.py').read(),
+                           className='SampleAlgo1'), params, sandboxing=False)
+    try:
+        location, = jail('data/0.csv')
+    finally:
+        jail.close()
+    params, _ = publish_shared_params(
+        dict(params, regions={location: 'region'}), ['regions'], str(tmpdir))
+    jail = ZygoteJail(dict(code=open('sample_algos/algo_shared.py').read(),
+                           className='SampleAlgoShared'), params,
+                      sandboxing=False)
+    try:
+        assert jail('data/0.csv') == {'region': 1}
+    finally:
+        jail.close()